@@ -0,0 +1,203 @@
+'''
+Local stand-in for the USPS Web Tools API, serving recorded TrackV2, Verify, RateV4 and IntlRateV2 responses.
+Every item of a request, tracking id, address or package, is answered with a recorded fixture under its own
+ID, so responses grow with the batch like the real ones. Latency and server errors can be injected.
+
+    python benchmarks/standin.py [--port 8080] [--latency 0.05] [--error-rate 0.01]
+
+Point a courier at it by setting `base_url` to the printed URL.
+'''
+import argparse
+import random
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+# Recorded TrackV2 TrackInfo, a delivered package with its full history
+TRACK_INFO = '''<TrackInfo ID="{id}">
+<TrackSummary><EventTime>2:48 pm</EventTime><EventDate>January 8, 2016</EventDate><Event>Delivered, In/At Mailbox</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11218</EventZIPCode></TrackSummary>
+<TrackDetail><EventTime>8:41 am</EventTime><EventDate>January 8, 2016</EventDate><Event>Out for Delivery</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11218</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>8:31 am</EventTime><EventDate>January 8, 2016</EventDate><Event>Sorting Complete</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11218</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>6:13 am</EventTime><EventDate>January 8, 2016</EventDate><Event>Arrived at Post Office</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11218</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>1:25 am</EventTime><EventDate>January 8, 2016</EventDate><Event>Departed USPS Facility</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11256</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>11:40 pm</EventTime><EventDate>January 7, 2016</EventDate><Event>Arrived at USPS Facility</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11256</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>4:58 am</EventTime><EventDate>January 7, 2016</EventDate><Event>Departed USPS Origin Facility</Event><EventCity>CHICAGO</EventCity><EventState>IL</EventState><EventZIPCode>60701</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime>10:08 pm</EventTime><EventDate>January 6, 2016</EventDate><Event>Accepted at USPS Origin Facility</Event><EventCity>CHICAGO</EventCity><EventState>IL</EventState><EventZIPCode>60701</EventZIPCode></TrackDetail>
+<TrackDetail><EventTime></EventTime><EventDate></EventDate><Event>Shipping Label Created, USPS Awaiting Item</Event><EventCity>CHICAGO</EventCity><EventState>IL</EventState><EventZIPCode>60607</EventZIPCode></TrackDetail>
+</TrackInfo>'''
+
+# Recorded Verify Address, a standardized address
+ADDRESS = '''<Address ID="{id}"><Address2>1 INFINITE LOOP</Address2><City>CUPERTINO</City><State>CA</State><Zip5>95014</Zip5><Zip4>2083</Zip4><DeliveryPoint>01</DeliveryPoint><CarrierRoute>C067</CarrierRoute></Address>'''
+
+# Recorded RateV4 Postage, with the special services a detailed rate reads
+POSTAGE = '''<Postage CLASSID="{class_id}"><MailService>{service}</MailService><Rate>{rate}</Rate>
+<SpecialServices>
+<SpecialService><ServiceID>1</ServiceID><ServiceName>Insurance</ServiceName><Available>true</Available><Price>2.05</Price></SpecialService>
+<SpecialService><ServiceID>0</ServiceID><ServiceName>Certified Mail&amp;lt;sup&amp;gt;&amp;#174;&amp;lt;/sup&amp;gt;</ServiceName><Available>true</Available><Price>3.45</Price></SpecialService>
+<SpecialService><ServiceID>13</ServiceID><ServiceName>Return Receipt</ServiceName><Available>true</Available><Price>2.80</Price></SpecialService>
+</SpecialServices>
+</Postage>'''
+
+SERVICES = (
+    ('3', 'Priority Mail Express 1-Day&amp;lt;sup&amp;gt;&amp;#8482;&amp;lt;/sup&amp;gt;', '26.35'),
+    ('1', 'Priority Mail 1-Day&amp;lt;sup&amp;gt;&amp;#8482;&amp;lt;/sup&amp;gt;', '7.15'),
+    ('6', 'Media Mail Parcel', '3.19'),
+    ('7', 'Library Mail Parcel', '3.04'),
+)
+
+PACKAGE = '''<Package ID="{id}"><ZipOrigination>{origin}</ZipOrigination><ZipDestination>{destination}</ZipDestination><Pounds>1</Pounds><Ounces>8</Ounces><Size>REGULAR</Size><Machinable>TRUE</Machinable><Zone>1</Zone>
+{postage}
+</Package>'''
+
+
+# Answers each item of a request with its fixture, keyed on the API name
+def _track(request):
+    return 'TrackResponse', [TRACK_INFO.format(id=item.get('ID')) for item in request.iter('TrackID')]
+
+
+def _verify(request):
+    return 'AddressValidateResponse', [ADDRESS.format(id=item.get('ID')) for item in request.iter('Address')]
+
+
+def _rate(request):
+    packages = []
+    for item in request.iter('Package'):
+        service = (item.findtext('Service') or 'ALL').upper()
+        # Detailed rates ask for a single service
+        services = [entry for entry in SERVICES if service in entry[1].upper()] or SERVICES
+        packages.append(PACKAGE.format(
+            id=item.get('ID'),
+            origin=item.findtext('ZipOrigination'),
+            destination=item.findtext('ZipDestination'),
+            postage='\n'.join(
+                POSTAGE.format(class_id=class_id, service=name, rate=rate) for class_id, name, rate in services
+            )
+        ))
+    return request.tag.replace('Request', 'Response'), packages
+
+
+APIS = {'TrackV2': _track, 'Verify': _verify, 'RateV4': _rate, 'IntlRateV2': _rate}
+
+
+# Answers the form fields of a request with a (status, body) pair
+def respond(fields):
+    api = APIS.get(fields.get('API', [''])[0])
+    if api is None or 'XML' not in fields:
+        return 400, b'Unknown API'
+
+    root, items = api(ElementTree.fromstring(fields['XML'][0]))
+    return 200, ('<?xml version="1.0" encoding="UTF-8"?>\n<%s>\n%s\n</%s>' % (root, '\n'.join(items), root)).encode('utf-8')
+
+
+# Answers an `HTTPRequest` without a server, as the handler of a `ponyexpress.transport.MemoryTransport`
+def memory_handler(request):
+    return respond(parse_qs(request.body or urlsplit(request.url).query))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written apart, Nagle's algorithm would hold the body back for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.answer(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.answer(parse_qs(body.decode('ascii')))
+
+    def answer(self, fields):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failed = server.random.random() < server.error_rate
+            latency = server.latency + server.random.random() * server.jitter
+        if latency:
+            time.sleep(latency)
+
+        if failed:
+            self.send(server.error_status, b'Service Unavailable')
+        else:
+            self.send(*respond(fields))
+
+    def send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''
+    Threaded HTTP server standing in for the USPS API. Run it with `serve_forever`, or `start` it in the background.
+
+    ## Parameters
+    `port` - Port to listen on, any free port when 0.
+    `latency` - Seconds every response is held back, for the carrier's server time and round trip.
+    `jitter` - Up to this many seconds more are added at random to each response.
+    `error_rate` - Fraction of requests answered with `error_status` instead.
+    `error_status` - HTTP status of the injected errors.
+    `seed` - Seed of the injected latency and errors, so runs can be repeated.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0, jitter=0, error_rate=0, error_status=503, seed=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    # Root URL to use as a courier's `base_url`
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    # Serves from a daemon thread, returning the server
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the USPS Web Tools API.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds every response is held back')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra seconds per response')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failed')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    server = StandInServer(args.port, args.latency, args.jitter, args.error_rate, args.error_status)
+    print('Serving the USPS stand-in on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+Micro-benchmark of building `TrackingEvent`s from USPS formatted dates and times, comparing the
+strptime based parsing used before with the memoized fast path.
+
+    python benchmarks/tracking_events.py [events]
+'''
+import sys
+import timeit
+from datetime import datetime as dt
+
+from ponyexpress.tracking import TrackingEvent, TrackingResponse
+
+# A realistic spread of values, tracking responses repeat the same few dates and times
+DATES = ['January %d, 2016' % day for day in range(1, 8)]
+TIMES = ['%d:%02d %s' % (hour, minute, meridiem) for hour in range(1, 13) for minute in (0, 17, 48) for meridiem in ('am', 'pm')]
+
+
+class StrptimeEvent(object):
+    # The previous TrackingEvent parsing, kept here as the baseline
+    def __init__(self, state, city, postal_code, etype, date, time, date_format, time_format):
+        self.type = etype.upper()
+        self.date = dt.strptime(date, date_format).date()
+        self.time = dt.strptime(time, time_format).time()
+        self.state = state.title()
+        self.city = city.title()
+        self.postal_code = postal_code
+
+    @property
+    def datetime(self):
+        return dt.combine(self.date, self.time)
+
+
+def build(event_class, count):
+    events = [
+        event_class('NY', 'BROOKLYN', '11218', 'Arrived at Unit', DATES[i % len(DATES)], TIMES[i % len(TIMES)], '%B %d, %Y', '%I:%M %p')
+        for i in range(count)
+    ]
+    # The status scans read every event's datetime
+    response = TrackingResponse(*events)
+    response.accepted
+    response.delivered
+    return response
+
+
+def main(count=10000, repeat=5):
+    for name, event_class in (('strptime', StrptimeEvent), ('memoized', TrackingEvent)):
+        best = min(timeit.repeat(lambda: build(event_class, count), number=1, repeat=repeat))
+        print('%-10s %12.0f events/sec' % (name, count / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
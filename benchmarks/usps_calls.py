@@ -0,0 +1,169 @@
+'''
+Throughput benchmark of the USPS courier against the local stand-in server of `standin.py`, so it runs offline
+and can be repeated. Every API is called at each concurrency and batch size, reporting calls/sec, p50/p99
+latency, CPU per item and peak memory. The server runs in its own process, so the CPU and memory are the
+courier's alone.
+
+    python benchmarks/usps_calls.py [--calls 100] [--concurrency 1,8] [--batch 1,10] [--latency 0.01]
+                                    [--transport requests|httpx|http2|memory]
+
+Batches of more than one item use the batch APIs, `track_many`, `validate_addresses` and `getRates`.
+Detailed rates have no batch API and only run with a batch of 1. The memory transport answers from the
+fixtures without a server, measuring the courier's own overhead.
+'''
+import argparse
+import multiprocessing
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from ponyexpress.policy import RequestPolicy
+from ponyexpress.rates import DOMESTIC, Package, RateCalculation
+from ponyexpress.transport import HTTPXTransport, MemoryTransport, RequestsTransport
+from ponyexpress.usps import USPSCourier
+from standin import StandInServer, memory_handler
+
+
+# Each call uses items of its own, so calls running at once aren't coalesced into one
+def package(item):
+    return Package((1, 8), 12, 12, 13, True, '11218', '%05d' % (10000 + item % 89999))
+
+
+def track(usps, items):
+    ids = ['9400%018d' % item for item in items]
+    return usps.track(ids[0]) if len(ids) == 1 else usps.track_many(ids)
+
+
+def validate(usps, items):
+    addresses = [('CA', 'Cupertino', '95014', '%d Infinite Loop' % item) for item in items]
+    return usps.validateAddress(*addresses[0]) if len(addresses) == 1 else usps.validate_addresses(addresses)
+
+
+def rate(usps, items):
+    packages = [package(item) for item in items]
+    return usps.getRate(package=packages[0]) if len(packages) == 1 else usps.getRates(packages)
+
+
+def detailed_rate(usps, items):
+    return usps.getDetailedRate(RateCalculation(package(items[0]), '7.15', 'Priority Mail 1-Day', DOMESTIC))
+
+
+TRANSPORTS = {
+    'requests': lambda pool_size: RequestsTransport(pool_size),
+    'httpx': lambda pool_size: HTTPXTransport(pool_size, http2=False),
+    # The stand-in only speaks HTTP/1.1, so this measures the overhead of the HTTP/2 capable client
+    'http2': lambda pool_size: HTTPXTransport(pool_size, http2=True),
+    'memory': lambda pool_size: MemoryTransport(memory_handler),
+}
+
+APIS = (
+    ('track', track, True),
+    ('validateAddress', validate, True),
+    ('getRate', rate, True),
+    ('getDetailedRate', detailed_rate, False),
+)
+
+
+# Runs the stand-in server in a child process, sending back its URL
+def serve(connection, options):
+    server = StandInServer(**options)
+    connection.send(server.url)
+    server.serve_forever()
+
+
+def start_server(**options):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child, options))
+    process.daemon = True
+    process.start()
+    return process, parent.recv()
+
+
+# Makes `calls` calls of `batch` items each, `concurrency` at a time, returning each call's latency and the errors
+def run(url, function, calls, concurrency, batch, transport='requests', **courier_options):
+    usps = USPSCourier('bench', transport=TRANSPORTS[transport](concurrency), **courier_options)
+    usps.base_url = url
+    errors = []
+
+    def call(number):
+        started = time.perf_counter()
+        try:
+            function(usps, range(number * batch, (number + 1) * batch))
+        except Exception as error:
+            errors.append(error)
+        return time.perf_counter() - started
+
+    # Opens the connections before measuring
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(call, range(-concurrency, 0)))
+        del errors[:]
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        latencies = list(executor.map(call, range(calls)))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    usps.close()
+    return latencies, errors, wall, cpu
+
+
+# Peak memory allocated while making the calls. Measured in a run of its own, since tracing slows every allocation.
+def peak_memory(url, function, calls, concurrency, batch, **courier_options):
+    tracemalloc.start()
+    try:
+        run(url, function, calls, concurrency, batch, **courier_options)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the USPS courier against a local stand-in server.')
+    parser.add_argument('--calls', type=int, default=100, help='calls per scenario')
+    parser.add_argument('--concurrency', default='1,8', help='comma separated numbers of calls in flight')
+    parser.add_argument('--batch', default='1,10', help='comma separated numbers of items per call')
+    parser.add_argument('--apis', default=','.join(name for name, _, _ in APIS), help='comma separated APIs to run')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds the server holds every response')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra seconds per response')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests the server fails')
+    parser.add_argument('--retries', type=int, default=0, help='retries of failed requests')
+    parser.add_argument('--streaming', action='store_true', help='parse batch responses as they arrive')
+    parser.add_argument('--transport', default='requests', choices=sorted(TRANSPORTS), help='transport to send with')
+    args = parser.parse_args()
+
+    concurrencies = [int(value) for value in args.concurrency.split(',')]
+    batches = [int(value) for value in args.batch.split(',')]
+    apis = args.apis.split(',')
+
+    server, url = start_server(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    options = {
+        'streaming': args.streaming, 'policy': RequestPolicy(retries=args.retries), 'transport': args.transport
+    }
+
+    print('%-16s %5s %5s %9s %9s %8s %8s %12s %10s %6s' % (
+        'api', 'batch', 'conc', 'calls/s', 'items/s', 'p50 ms', 'p99 ms', 'cpu us/item', 'peak KiB', 'errors'
+    ))
+    try:
+        for name, function, batched in APIS:
+            if name not in apis:
+                continue
+            for batch in batches if batched else [1]:
+                for concurrency in concurrencies:
+                    latencies, errors, wall, cpu = run(url, function, args.calls, concurrency, batch, **options)
+                    peak = peak_memory(url, function, args.calls, concurrency, batch, **options)
+                    items = args.calls * batch
+                    print('%-16s %5d %5d %9.1f %9.1f %8.2f %8.2f %12.1f %10.1f %6d' % (
+                        name, batch, concurrency, args.calls / wall, items / wall,
+                        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+                        cpu / items * 1e6, peak / 1024.0, len(errors)
+                    ))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import sys
+
+from ponyexpress.cli import main
+
+sys.exit(main())
@@ -6,14 +6,16 @@ class AddressValidationResponse(object):
 
     ## Attributes
     `addresses` - List of `Address` objects matching the validation request
+    `error` - The carrier's error message when the address could not be validated, otherwise None.
     '''
 
     # Init for new AddressValidationResponse
     def __init__(self, *addresses):
         self.addresses = []
+        self.error = None
 
-    # Since we only allow single address validation, here is a simple hook for getting the validated address.
-    # Though we do store it as a list, this is for the future when you can validate multiple addresses simultaneously.
+    # Each response covers a single requested address, here is a simple hook for getting the validated address.
+    # Though we do store it as a list, the carrier may return several candidates for one request.
     @property
     def address(self):
         if len(self.addresses):
@@ -48,6 +50,7 @@ class Address(object):
     `Carrier Route` - The route the letter/package will travel when out for delivery. Can be used to gain information
         about the surrounding area like income and total delivery points.
     '''
+    __slots__ = ('state', 'city', 'zip', 'street', 'delivery_point', 'carrier_route')
 
     # Init method for creating a new Address instance.
     def __init__(self, state, city, postal_code, street,
@@ -0,0 +1,552 @@
+'''
+Asyncio versions of the couriers. Requests go through a pooled `httpx.AsyncClient` by default and share the
+request building and response parsing of the blocking couriers, so both return identical objects.
+'''
+import asyncio
+from collections import OrderedDict, deque
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from ponyexpress.config import DEFAULT_CONCURRENCY, DEFAULT_POOL_SIZE, STREAM_CHUNK_SIZE
+from ponyexpress.courier import BaseCourier, ElementStream
+from ponyexpress.policy import clock
+from ponyexpress.rates import DOMESTIC, RateCalculationResponse
+from ponyexpress.transport import IDENTITY_ENCODING, MemoryResponse, MemoryTransport, _httpx_timeout, _require_httpx
+from ponyexpress.usps import USPSCourier
+from ponyexpress.utils import chunked
+
+
+# Awaitable version of `ponyexpress.utils.pipelined`, running `function` as a task per item. Tasks still running
+# when the consumer stops are cancelled. It lives here rather than in `utils`, which Python 2.7 imports too.
+async def _pipelined(function, iterable, concurrency):
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(asyncio.ensure_future(function(item)))
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class AsyncSingleFlight(object):
+    '''
+    Coalesces identical calls made from several tasks of one event loop.
+
+    ## Attributes
+    `coalesced` - Number of calls which were answered by another call in flight, instead of running.
+    '''
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+
+    '''
+    Awaitable version of `ponyexpress.coalesce.SingleFlight.do`. A caller which is cancelled doesn't cancel
+    the call the others wait on.
+
+    ## Parameters
+    `key` - Identifies identical calls.
+    `function` - Called without arguments to produce the awaitable result.
+    '''
+    async def do(self, key, function):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        return await asyncio.shield(task)
+
+
+class AsyncHTTPXTransport(object):
+    '''
+    Transport over a pooled `httpx.AsyncClient`, the default of the asynchronous couriers. With `http2`, every
+    task's calls are multiplexed over a few connections. Accepts every `ponyexpress.transport.HTTPXTransport`
+    option, but `http2` is off by default.
+    '''
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, compression=True, http2=False):
+        _require_httpx(http2)
+        self.session = httpx.AsyncClient(
+            http2=http2, headers=None if compression else IDENTITY_ENCODING, limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size if keep_alive else 0
+            )
+        )
+
+    # Errors of a single attempt which are worth retrying
+    @property
+    def retryable_errors(self):
+        return (httpx.TransportError, )
+
+    # Awaitable version of `HTTPXTransport.send`, returning the `httpx.Response`
+    async def send(self, request, timeout, stream=False):
+        built = self.session.build_request(
+            request.method, request.url, content=request.body, headers=request.headers, timeout=_httpx_timeout(timeout)
+        )
+        return await self.session.send(built, stream=stream)
+
+    async def warm(self, url, timeout):
+        try:
+            await self.session.head(url, timeout=_httpx_timeout(timeout))
+        except httpx.HTTPError:
+            pass
+
+    async def close(self):
+        await self.session.aclose()
+
+
+class AsyncMemoryResponse(MemoryResponse):
+    '''
+    A response produced in memory, with the methods of the asynchronous responses.
+    '''
+    __slots__ = ()
+
+    async def aiter_bytes(self, chunk_size):
+        for data in self.iter_content(chunk_size):
+            yield data
+
+    async def aclose(self):
+        pass
+
+
+class AsyncMemoryTransport(MemoryTransport):
+    '''
+    Awaitable version of `MemoryTransport`, for the asynchronous couriers.
+    '''
+    async def send(self, request, timeout=None, stream=False):
+        response = MemoryTransport.send(self, request, timeout, stream)
+        return AsyncMemoryResponse(response.status_code, response.content)
+
+    async def warm(self, url, timeout):
+        pass
+
+    async def close(self):
+        pass
+
+
+class AsyncBaseCourier(BaseCourier):
+    '''
+    Provides the awaitable request path for new carriers. Accepts every `BaseCourier` option, a `transport`
+    must be one of the asynchronous transports of this module.
+
+    ## Parameters
+    `concurrency` - Maximum number of requests this courier has in flight at once.
+    `http2` - Multiplex the requests over HTTP/2 connections with the default transport, requires the h2 package.
+    '''
+    # Creates a new instance of the asynchronous postal carrier base object
+    def __init__(self, username, password='', concurrency=DEFAULT_CONCURRENCY, prewarm=False, http2=False, **kwargs):
+        self.http2 = http2
+
+        # Connections can only be opened inside the event loop, so warming waits for `async with`
+        super(AsyncBaseCourier, self).__init__(username, password, prewarm=False, **kwargs)
+        self._prewarm = prewarm
+
+        self.concurrency = concurrency
+        self._semaphore = None
+
+    # Builds the default asynchronous transport used for every request
+    def _create_transport(self, pool_size, keep_alive):
+        return AsyncHTTPXTransport(pool_size, keep_alive, http2=self.http2)
+
+    def _create_flights(self):
+        return AsyncSingleFlight()
+
+    # Created on first use so it belongs to the running event loop
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def __aenter__(self):
+        if self._prewarm:
+            await self.prewarm()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # The connections are closed asynchronously, so only `async with` can manage the courier
+    def __enter__(self):
+        raise TypeError('%s is asynchronous, use `async with` instead of `with`' % type(self).__name__)
+
+    '''
+    Opens connections to the carrier ahead of time so the first real calls skip the handshake.
+    Warming is best effort, connection failures here are left for the real request to report.
+
+    ## Parameters
+    `connections` - Number of connections to open, defaults to the full pool size.
+    '''
+    async def prewarm(self, connections=None):
+        if not self.base_url:
+            return
+
+        await asyncio.gather(*[
+            self.transport.warm(self.base_url, self.timeout) for _ in range(connections or self.pool_size)
+        ])
+
+    # Releases every pooled connection held by the courier
+    async def close(self):
+        await self.transport.close()
+
+    '''
+    Awaitable version of `BaseCourier.get_server_response`. At most `concurrency` requests run at once.
+
+    ## Returns
+    `Response` - The parsed response from the server. Can be XMLElementTree or JSON decoded Python object.
+    '''
+    async def get_server_response(self, endpoint='', params={}, method='default', build=None, items=1):
+        metrics = self._metrics(method, items)
+        if metrics is None:
+            parsed_response = await self._get_parsed(self._prepare_request(endpoint, params, method))
+            return parsed_response if build is None else build(parsed_response)
+
+        try:
+            request = self._prepare_request(endpoint, params, method)
+            metrics.request(request)
+            parsed_response = await self._get_parsed(request, metrics)
+
+            started = clock()
+            response = parsed_response if build is None else build(parsed_response)
+            metrics.build = clock() - started
+        except Exception as error:
+            self._emit(metrics, error)
+            raise
+
+        self._emit(metrics)
+        return response
+
+    # Awaitable version of `BaseCourier._get_parsed`
+    async def _get_parsed(self, request, metrics=None):
+        if not (self.coalesce and request.idempotent):
+            return await self._fetch(request, metrics)
+
+        if metrics is None:
+            return await self._flights.do(request.key, lambda: self._fetch(request))
+
+        # Only the call which actually goes out measures the network and parsing
+        metrics.coalesced = True
+
+        def fetch():
+            metrics.coalesced = False
+            return self._fetch(request, metrics)
+
+        return await self._flights.do(request.key, fetch)
+
+    # Awaitable version of `BaseCourier._fetch`
+    async def _fetch(self, request, metrics=None):
+        if metrics is None:
+            return self._handle_response(await self._execute(request))
+
+        started = clock()
+        response = await self._execute(request)
+        received = clock()
+        metrics.response(response, received - started)
+        try:
+            return self._handle_response(response)
+        finally:
+            metrics.parse = clock() - received
+
+    '''
+    Awaitable version of `BaseCourier.get_server_elements`. When `streaming`, the body is parsed incrementally
+    as it arrives and each finished element is detached from the tree, instead of building the whole tree.
+    Each element is converted with `each` as soon as it is parsed, so only the converted elements are kept
+    until `build` runs.
+
+    ## Returns
+    `List` - XMLElements with the given tag, in document order, or what `build` made of them.
+    '''
+    async def get_server_elements(self, endpoint='', params={}, tag=None, method='default', build=None, items=1,
+                                  each=None):
+        if not self.streaming:
+            return await self.get_server_response(
+                endpoint, params, method, lambda root: self._build_elements(root.findall(tag), build or list, each),
+                items
+            )
+
+        metrics = self._metrics(method, items)
+        try:
+            request = self._prepare_request(endpoint, params, method)
+            if metrics is not None:
+                metrics.request(request)
+                if each is not None:
+                    each = metrics.timed('build', each)
+            elements = await self._read_elements(request, tag, metrics, each)
+
+            started = clock()
+            response = elements if build is None else build(elements)
+            if metrics is not None:
+                metrics.add('build', clock() - started)
+        except Exception as error:
+            if metrics is not None:
+                self._emit(metrics, error)
+            raise
+
+        if metrics is not None:
+            self._emit(metrics)
+        return response
+
+    # Reading the elements as they arrive would block the event loop, they are awaited all at once instead
+    def iter_server_response(self, *args, **kwargs):
+        raise TypeError(
+            '%s is asynchronous and can\'t iterate responses, await `get_server_elements` instead' % type(self).__name__
+        )
+
+    # Streams the response, parsing each piece as it arrives, timing both when measuring. Elements are converted
+    # with `each` as they are completed.
+    async def _read_elements(self, request, tag, metrics=None, each=None):
+        elements = []
+
+        def keep(element):
+            elements.append(element if each is None else each(element))
+
+        started = clock()
+        response = await self._execute(request, stream=True)
+        try:
+            if response.status_code != 200:
+                self.process_exception(response)
+
+            # Save the response object for user inspection
+            self._server_response = response
+
+            stream = ElementStream(tag, self.xml_parser)
+            if metrics is None:
+                async for data in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                    for element in stream.feed(data):
+                        keep(element)
+                for element in stream.close():
+                    keep(element)
+                return elements
+
+            metrics.status = response.status_code
+            metrics.connect = metrics.network = clock() - started
+            feed, close = metrics.timed('parse', stream.feed), metrics.timed('parse', stream.close)
+            received = clock()
+            async for data in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                metrics.add('network', clock() - received)
+                metrics.response_bytes += len(data)
+                for element in feed(data):
+                    keep(element)
+                received = clock()
+            metrics.add('network', clock() - received)
+            for element in close():
+                keep(element)
+            metrics.transfer = metrics.network - metrics.connect
+        finally:
+            await response.aclose()
+
+        return elements
+
+    # Awaitable version of `BaseCourier._execute`
+    async def _execute(self, request, stream=False):
+        policy = self.policy
+        policy.count('requests')
+        expires = policy.expires(clock())
+
+        attempt = 0
+        while True:
+            timeout = policy.timeout(self.timeout, expires)
+            try:
+                response = await self._attempt(request, timeout, stream)
+            except self._retryable_errors:
+                delay = policy.retry_delay(request, attempt, expires)
+                if delay is None:
+                    raise
+            else:
+                if not policy.retry_status(response.status_code):
+                    return response
+                delay = policy.retry_delay(request, attempt, expires)
+                if delay is None:
+                    return response
+                await response.aclose()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # Awaitable version of `BaseCourier._attempt`
+    async def _attempt(self, request, timeout, stream):
+        policy = self.policy
+        policy.count('attempts')
+        delay = None if stream else policy.hedge_delay(request)
+
+        started = clock()
+        if delay is None:
+            response = await self._send(request, timeout, stream)
+        else:
+            response = await self._hedged_send(request, timeout, delay)
+        policy.record_latency(clock() - started)
+        return response
+
+    # Sends a single request, at most `concurrency` are in flight at once
+    async def _send(self, request, timeout, stream=False):
+        # Tokens are reserved without blocking the event loop, then waited out
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.reserve(self.rate_limit_key)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        async with self.semaphore:
+            return await self.transport.send(request, timeout, stream)
+
+    # Awaitable version of `BaseCourier._hedged_send`, the losing request is cancelled
+    async def _hedged_send(self, request, timeout, delay):
+        primary = asyncio.ensure_future(self._send(request, timeout))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.policy.count('hedges')
+        hedge = asyncio.ensure_future(self._send(request, timeout))
+        pending = {primary, hedge}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            answered = [task for task in done if task.exception() is None]
+            if not answered and pending:
+                continue
+
+            task = answered[0] if answered else done.pop()
+            if task is hedge and answered:
+                self.policy.count('hedge_wins')
+            for loser in pending:
+                loser.cancel()
+            return task.result()
+
+
+class AsyncUSPSCourier(AsyncBaseCourier, USPSCourier):
+    '''
+    Awaitable USPS courier. Every method mirrors its `USPSCourier` counterpart, batch methods send their
+    chunks concurrently within the courier's `concurrency` limit.
+    '''
+    # USPS Address Validation V4 API, see `USPSCourier.validateAddress`
+    async def validateAddress(self, state, city, postal_code, street_2, street_1='', name=''):
+        fields = self._address_fields(state, city, postal_code, street_2, street_1, name)
+
+        response = self._cached_address(fields)
+        if response is not None:
+            return response
+
+        response = await self.get_server_response(
+            self.address_validation_endpoint, self._address_params([fields]), method='Address Validation',
+            build=self._address_response
+        )
+        self._cache_address(fields, response)
+        return response
+
+    # USPS Address Validation V4 API for many addresses at once, see `USPSCourier.validate_addresses`
+    async def validate_addresses(self, addresses):
+        responses = []
+
+        async def validate_chunk(chunk):
+            params = self._address_params([fields for _, fields in chunk])
+            await self.get_server_elements(
+                self.address_validation_endpoint, params, 'Address', method='Address Validation',
+                build=lambda results: self._address_chunk_response(chunk, results, responses),
+                each=self._address_result, items=len(chunk)
+            )
+
+        await asyncio.gather(*[validate_chunk(chunk) for chunk in list(self._address_chunks(addresses, responses))])
+        return responses
+
+    # Asynchronous generator version of `USPSCourier.iter_validate`, batches in flight default to `concurrency`
+    async def iter_validate(self, addresses, batch_size=None, concurrency=None):
+        async def validate_batch(batch):
+            return zip(batch, await self.validate_addresses(batch))
+
+        batches = _pipelined(
+            validate_batch, chunked(addresses, batch_size or self.MAX_ADDRESSES), concurrency or self.concurrency
+        )
+        async for pairs in batches:
+            for pair in pairs:
+                yield pair
+
+    # USPS Tracking Detail V2 API, see `USPSCourier.track`
+    async def track(self, tracking_id):
+        response = self._cached_tracking(tracking_id)
+        if response is not None:
+            return response
+
+        response = await self.get_server_response(
+            self.tracking_endpoint, self._track_params([tracking_id]), method='Tracking', build=self._track_response
+        )
+        self._cache_tracking(tracking_id, response)
+        return response
+
+    # USPS Tracking Detail V2 API for many packages at once, see `USPSCourier.track_many`
+    async def track_many(self, tracking_ids):
+        async def track_chunk(chunk):
+            return await self.get_server_elements(
+                self.tracking_endpoint, self._track_params(chunk), 'TrackInfo', method='Tracking',
+                build=lambda found: self._track_chunk_response(chunk, found), each=self._track_info,
+                items=len(chunk)
+            )
+
+        responses = OrderedDict()
+        for chunk_responses in await asyncio.gather(*[
+            track_chunk(chunk) for chunk in list(self._track_chunks(tracking_ids, responses))
+        ]):
+            responses.update(chunk_responses)
+
+        return responses
+
+    # Asynchronous generator version of `USPSCourier.iter_track`, batches in flight default to `concurrency`
+    async def iter_track(self, tracking_ids, batch_size=None, concurrency=None):
+        async def track_batch(batch):
+            return batch, await self.track_many(batch)
+
+        batches = _pipelined(
+            track_batch, chunked(tracking_ids, batch_size or self.MAX_TRACK_IDS), concurrency or self.concurrency
+        )
+        async for batch, responses in batches:
+            for tracking_id in batch:
+                yield tracking_id, responses[tracking_id]
+
+    # USPS Rate Calculator V4 and International V2 API, see `USPSCourier.getRate`
+    async def getRate(self, rate_type=DOMESTIC, method='ALL', detailed=False, **kwargs):
+        package = kwargs.get('package', None)
+        params = self._rate_params(package, method)
+
+        response = self._known_rates(package, rate_type, method)
+        if response is not None:
+            return response
+
+        response = await self.get_server_response(
+            getattr(self, rate_type + '_rate_endpoint'), params, method='Rate',
+            build=lambda raw_response: self._rate_response(raw_response, package, rate_type)
+        )
+        self._cache_rates(response, package, rate_type, method)
+        return response
+
+    # USPS Rate Calculator V4 and International V2 API for many packages at once, see `USPSCourier.getRates`
+    async def getRates(self, packages, rate_type=DOMESTIC, method='ALL'):
+        async def rate_chunk(ids):
+            params = self._rates_params(ids, method)
+            return await self.get_server_elements(
+                getattr(self, rate_type + '_rate_endpoint'), params, 'Package', method='Rate',
+                build=lambda package_rates: self._rates_chunk_response(
+                    RateCalculationResponse(), ids, package_rates, rate_type, method
+                ),
+                each=lambda package_info: self._package_rates(package_info, ids, rate_type), items=len(ids)
+            )
+
+        # Chunks are merged in order so package ids line up with the blocking version
+        response = RateCalculationResponse()
+        chunks = list(self._rate_chunks(packages, response, rate_type, method))
+        for chunk_response in await asyncio.gather(*[rate_chunk(ids) for ids in chunks]):
+            response.add(*chunk_response.rates)
+            response.errors.update(chunk_response.errors)
+
+        return response
+
+    # USPS Detailed Rate Calculator V4 and International V2 API, see `USPSCourier.getDetailedRate`
+    async def getDetailedRate(self, rate):
+        params = self._detailed_rate_params(rate)
+        return await self.get_server_response(
+            getattr(self, rate.type + '_rate_endpoint'), params, method='Rate',
+            build=lambda raw_response: self._detailed_rate_response(raw_response, rate)
+        )
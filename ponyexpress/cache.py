@@ -0,0 +1,344 @@
+'''
+Response caches for the couriers. Every backend expires entries after a TTL, evicts the least recently
+used entries past `maxsize`, and counts its hits and misses.
+'''
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime as dt
+
+from ponyexpress.address import Address, AddressValidationResponse
+from ponyexpress.config import (
+    DEFAULT_ADDRESS_CACHE_TTL,
+    DEFAULT_ADDRESS_NEGATIVE_TTL,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_TRACKING_MAX_TTL,
+    DEFAULT_TRACKING_MIN_TTL,
+    DEFAULT_TRACKING_TTL_FACTOR
+)
+
+# TTL for entries which should never expire, only be evicted
+FOREVER = float('inf')
+
+
+class BaseCache(object):
+    '''
+    Interface for cache backends. Subclasses implement `_get`, `_set`, `delete` and `clear`.
+
+    ## Attributes
+    `maxsize` - Maximum number of entries kept, the least recently used are evicted first. None for unbounded.
+    `ttl` - Default number of seconds an entry is kept for. None keeps entries until they are evicted.
+    `hits` - Number of lookups answered from the cache.
+    `misses` - Number of lookups which found nothing, or only an expired entry.
+    '''
+
+    # Marks a missing entry, since None is a valid cached value
+    MISSING = object()
+
+    # Init for new caches
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    '''
+    Looks up a cached value.
+
+    ## Parameters
+    `key` - The String key the value was stored under.
+    `default` - Returned when nothing is cached for `key`.
+
+    ## Returns
+    `Object` - The cached value, or `default`.
+    '''
+    def get(self, key, default=None):
+        value = self._get(key)
+        if value is self.MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    '''
+    Stores a value.
+
+    ## Parameters
+    `key` - String key to store the value under.
+    `value` - Any picklable value.
+    `ttl` - Seconds to keep this entry for, overriding the cache's default. Pass None to use the default,
+        or `FOREVER` to keep the entry until it is evicted.
+    '''
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._set(key, value, time.time() + ttl if ttl not in (None, FOREVER) else None)
+
+    # Hit and miss counters as a dictionary, for reporting
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, expires):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+    '''
+    In-process cache, shared by every thread using it.
+    '''
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, ttl=None):
+        super(MemoryCache, self).__init__(maxsize, ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return self.MISSING
+
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                return self.MISSING
+
+            # Re-insert to mark the entry as most recently used
+            self._entries[key] = entry
+            return value
+
+    def _set(self, key, value, expires):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+
+            # Evict the least recently used entries
+            while self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(BaseCache):
+    '''
+    On-disk cache in a SQLite database. Several processes on one host can share the same file.
+    Values are pickled, and hit/miss counters are kept per process.
+
+    ## Parameters
+    `path` - Location of the database file, created if it does not exist.
+    '''
+    def __init__(self, path, maxsize=DEFAULT_CACHE_SIZE, ttl=None):
+        super(SQLiteCache, self).__init__(maxsize, ttl)
+        self.path = os.path.abspath(path)
+
+        # sqlite3 connections can't be shared between threads
+        self._local = threading.local()
+
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    # Opens, or re-uses, this thread's connection to the database
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Readers don't block the writer, which keeps concurrent workers moving
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key):
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute('SELECT value, expires FROM cache WHERE key = ?', (key, )).fetchone()
+            if row is None:
+                return self.MISSING
+
+            value, expires = row
+            if expires is not None and expires <= now:
+                connection.execute('DELETE FROM cache WHERE key = ?', (key, ))
+                return self.MISSING
+
+            connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+            return pickle.loads(value)
+
+    def _set(self, key, value, expires):
+        value = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                (key, value, expires, time.time())
+            )
+
+            # Evict the least recently used entries
+            if self.maxsize is not None:
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                    (self.maxsize, )
+                )
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key, ))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM cache')
+
+
+class AddressCache(object):
+    '''
+    Cache of address validation results keyed on the normalized request, so re-validating an address
+    is a local lookup. Addresses the carrier rejected are cached too, for their own, shorter, TTL.
+
+    ## Parameters
+    `path` - File to persist the cache to, so it survives restarts. Kept in memory when not given.
+    `backend` - Any `BaseCache` to store the results in instead, overrides `path`.
+    `ttl` - Seconds to keep validated addresses for.
+    `negative_ttl` - Seconds to keep rejected addresses for.
+    `maxsize` - Maximum number of addresses kept.
+    '''
+
+    # Order of the normalized request fields within a key
+    _fields = ('state', 'city', 'zip5', 'zip4', 'address_2', 'address_1', 'name')
+
+    # Init for new AddressCache
+    def __init__(self, path=None, backend=None, ttl=DEFAULT_ADDRESS_CACHE_TTL,
+                 negative_ttl=DEFAULT_ADDRESS_NEGATIVE_TTL, maxsize=DEFAULT_CACHE_SIZE):
+        if backend is None:
+            backend = SQLiteCache(path, maxsize) if path else MemoryCache(maxsize)
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @property
+    def hits(self):
+        return self.backend.hits
+
+    @property
+    def misses(self):
+        return self.backend.misses
+
+    def stats(self):
+        return self.backend.stats()
+
+    # Builds the cache key from upper cased request fields, ignoring repeated whitespace
+    def key(self, fields):
+        return 'address:' + '|'.join(' '.join(fields.get(field, '').split()) for field in self._fields)
+
+    '''
+    Looks up the validation result of an address.
+
+    ## Parameters
+    `fields` - The normalized request fields of the address, as sent to the carrier.
+
+    ## Returns
+    `AddressValidationResponse` - A new response rebuilt from the cache, or None if the address isn't cached.
+    '''
+    def get(self, fields):
+        entry = self.backend.get(self.key(fields))
+        if entry is None:
+            return None
+
+        addresses, error = entry
+        response = AddressValidationResponse()
+        response.add(*[Address(*address) for address in addresses])
+        response.error = error
+        return response
+
+    # Stores the validation result of an address, with the TTL matching whether it was validated
+    def set(self, fields, response):
+        addresses = [
+            (address.state, address.city, address.zip, address.street, address.delivery_point, address.carrier_route)
+            for address in response.addresses
+        ]
+        self.backend.set(
+            self.key(fields),
+            (addresses, response.error),
+            ttl=self.ttl if response.validated else self.negative_ttl
+        )
+
+
+class TrackingCache(object):
+    '''
+    Cache of tracking results which takes the shipment's status into account. Delivered, or otherwise terminal,
+    shipments are kept until they are evicted, since they won't change again. Shipments in transit are kept
+    for a TTL which grows with the time since their latest event, so quiet shipments are fetched less often.
+
+    ## Parameters
+    `path` - File to persist the cache to. Kept in memory when not given.
+    `backend` - Any `BaseCache` to store the results in instead, overrides `path`.
+    `maxsize` - Maximum number of shipments kept, bounding the memory used.
+    `min_ttl` - Seconds to keep a shipment with a brand new event for, also used for lookup errors.
+    `max_ttl` - Upper bound of the TTL for shipments in transit.
+    `ttl_factor` - Fraction of the time since the latest event used as the TTL.
+    '''
+
+    # Init for new TrackingCache
+    def __init__(self, path=None, backend=None, maxsize=DEFAULT_CACHE_SIZE, min_ttl=DEFAULT_TRACKING_MIN_TTL,
+                 max_ttl=DEFAULT_TRACKING_MAX_TTL, ttl_factor=DEFAULT_TRACKING_TTL_FACTOR):
+        if backend is None:
+            backend = SQLiteCache(path, maxsize) if path else MemoryCache(maxsize)
+        self.backend = backend
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.ttl_factor = ttl_factor
+
+    @property
+    def hits(self):
+        return self.backend.hits
+
+    @property
+    def misses(self):
+        return self.backend.misses
+
+    def stats(self):
+        return self.backend.stats()
+
+    def key(self, tracking_id):
+        return 'tracking:' + tracking_id
+
+    # Seconds to keep a tracking result for, based on its status
+    def ttl(self, response):
+        if response.terminal:
+            return FOREVER
+        if not response.events:
+            return self.min_ttl
+
+        age = (dt.now() - response.events[0].datetime).total_seconds()
+        return min(self.max_ttl, max(self.min_ttl, age * self.ttl_factor))
+
+    # Returns the cached `TrackingResponse` for a tracking id, or None if it isn't cached
+    def get(self, tracking_id):
+        return self.backend.get(self.key(tracking_id))
+
+    # Stores the `TrackingResponse` for a tracking id
+    def set(self, tracking_id, response):
+        self.backend.set(self.key(tracking_id), response, ttl=self.ttl(response))
@@ -0,0 +1,388 @@
+'''
+The `ponyexpress` command, for bulk jobs. Rows are read from CSV or JSON Lines, tracked, validated or rated in
+batches running concurrently, through `USPSCourier.iter_track`, `iter_validate` and `getRates`, and written back
+out with their results, in input order, as each batch is done. Neither file is ever held in memory, and with
+`--checkpoint` an interrupted run resumes where it stopped.
+
+    ponyexpress track ids.csv -o tracked.csv --batch 35 --concurrency 8 --checkpoint tracked.checkpoint
+    ponyexpress validate addresses.jsonl -o validated.jsonl
+    ponyexpress rate packages.csv --rate-type international
+
+Input columns, or keys of each JSON object:
+    track - `tracking_id`.
+    validate - `state`, `city`, `postal_code`, `street_2`, and optionally `street_1` and `name`,
+        the arguments of `USPSCourier.validateAddress`.
+    rate - `weight` in ounces, `length`, `width` and `height` in inches, `origin` and `destination` zip codes,
+        and optionally `rectangular`, which defaults to true.
+
+A row missing a required column, or with a rate column that isn't a number, is written back with its `error`
+like the rows the carrier rejects, without stopping the run or the rest of its batch.
+
+Credentials are read from `--username` and `--password`, or the PONYEXPRESS_USERNAME and PONYEXPRESS_PASSWORD
+environment variables.
+'''
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+from datetime import date
+
+from ponyexpress.limiter import RateLimiter
+from ponyexpress.rates import DOMESTIC, INTERNATIONAL, Package
+from ponyexpress.usps import USPSCourier
+from ponyexpress.utils import chunked, pipelined
+
+# File formats by extension, anything else is read and written as JSON Lines
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}
+
+# Columns holding the `validateAddress` arguments, the first four are required
+ADDRESS_FIELDS = ('state', 'city', 'postal_code', 'street_2', 'street_1', 'name')
+
+# Result columns each command adds to the rows
+TRACKING_COLUMNS = ('status', 'accepted', 'delivered', 'terminal', 'events', 'error')
+ADDRESS_COLUMNS = ('validated', 'candidates', 'valid_street', 'valid_city', 'valid_state', 'valid_zip', 'error')
+RATE_COLUMNS = ('service', 'price', 'rates', 'error')
+
+# Replaces a file in one step, `os.replace` is new in Python 3.3 and renaming over a file is as atomic on POSIX
+_replace = getattr(os, 'replace', os.rename)
+
+
+# Values of the input columns, raising `ValueError` for a row missing a required one
+def _field(row, name):
+    value = row.get(name)
+    if value is None or value == '':
+        raise ValueError('missing %s' % name)
+    return value
+
+
+# Values of the rate columns, which are text when read from CSV
+def _number(row, name):
+    value = _field(row, name)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('%s is not a number: %r' % (name, value))
+    return int(number) if number.is_integer() else number
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'n')
+    return bool(value)
+
+
+# Pairs every row with the courier input built from it, or with the error that kept it from being built.
+# A bad row fails on its own, without stopping the run or the rest of its batch.
+def _prepare(rows, build):
+    for row in rows:
+        try:
+            yield row, build(row), None
+        except ValueError as error:
+            yield row, None, str(error)
+
+
+# Output row of an input row that was never sent, with every result column empty but `error`
+def _failed(row, columns, error):
+    return dict(row, **dict(dict.fromkeys(columns), error=error))
+
+
+# Sends the rows that were built to a streaming courier call, and yields every row with its result in input order.
+# The rows waiting on their batch are held in a `tee` buffer, bounded by the batch size and concurrency.
+def _stream(rows, build, send, result, columns):
+    prepared, inputs = itertools.tee(_prepare(rows, build))
+    answered = send(value for _, value, error in inputs if error is None)
+    for row, _, error in prepared:
+        if error is not None:
+            yield _failed(row, columns, error)
+        else:
+            yield dict(row, **result(next(answered)[1]))
+
+
+# Each command turns the input rows into their output rows, lazily and in input order
+def track_rows(usps, rows, args):
+    return _stream(
+        rows, lambda row: str(_field(row, 'tracking_id')),
+        lambda ids: usps.iter_track(ids, args.batch, args.concurrency), tracking_result, TRACKING_COLUMNS
+    )
+
+
+def tracking_result(response):
+    return {
+        'status': response.status,
+        'accepted': response.accepted,
+        'delivered': response.delivered,
+        'terminal': response.terminal,
+        'events': len(response.events),
+        'error': response.error
+    }
+
+
+def validate_rows(usps, rows, args):
+    return _stream(
+        rows, _address, lambda addresses: usps.iter_validate(addresses, args.batch, args.concurrency),
+        address_result, ADDRESS_COLUMNS
+    )
+
+
+# The `validateAddress` arguments of a row
+def _address(row):
+    address = dict((name, str(_field(row, name))) for name in ADDRESS_FIELDS[:4])
+    address.update((name, str(row[name])) for name in ADDRESS_FIELDS[4:] if row.get(name))
+    return address
+
+
+def address_result(response):
+    address = response.address
+    return {
+        'validated': response.validated,
+        'candidates': len(response.addresses),
+        'valid_street': address.street if address else None,
+        'valid_city': address.city if address else None,
+        'valid_state': address.state if address else None,
+        'valid_zip': address.zip if address else None,
+        'error': response.error
+    }
+
+
+def rate_rows(usps, rows, args):
+    for results in pipelined(lambda batch: _rate_batch(usps, batch, args), chunked(rows, args.batch), args.concurrency):
+        for row in results:
+            yield row
+
+
+def _package(row):
+    return Package(
+        _number(row, 'weight'), _number(row, 'length'), _number(row, 'width'), _number(row, 'height'),
+        _flag(row.get('rectangular', True)), str(_field(row, 'origin')), str(_field(row, 'destination'))
+    )
+
+
+# Rates the rows of a batch that make a package, in one call
+def _rate_batch(usps, rows, args):
+    prepared = list(_prepare(rows, _package))
+    packages = [package for _, package, error in prepared if error is None]
+    response = usps.getRates(packages, args.rate_type, args.service) if packages else None
+
+    results = []
+    package_id = 0
+    for row, _, error in prepared:
+        if error is not None:
+            results.append(_failed(row, RATE_COLUMNS, error))
+            continue
+
+        cheapest = response.cheapest(str(package_id))
+        results.append(dict(
+            row,
+            service=cheapest.method if cheapest else None,
+            price=cheapest.price if cheapest else None,
+            rates=[{'service': rate.method, 'price': rate.price} for rate in response.rates_for(str(package_id))],
+            error=response.errors.get(str(package_id))
+        ))
+        package_id += 1
+    return results
+
+
+COMMANDS = {'track': track_rows, 'validate': validate_rows, 'rate': rate_rows}
+
+# Rows per batch of each command when not given, the most the API takes in one request
+BATCH_SIZES = {
+    'track': USPSCourier.MAX_TRACK_IDS,
+    'validate': USPSCourier.MAX_ADDRESSES,
+    'rate': USPSCourier.MAX_PACKAGES
+}
+
+
+def read_rows(stream, file_format):
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+        return
+
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+class RowWriter(object):
+    '''
+    Writes output rows as CSV or JSON Lines. CSV columns are those of the first row written.
+
+    ## Parameters
+    `stream` - Text stream to write to.
+    `file_format` - csv or jsonl.
+    `header` - Write the CSV header, which a resumed run already has.
+    '''
+    def __init__(self, stream, file_format, header=True):
+        self.stream = stream
+        self.file_format = file_format
+        self.header = header
+        self._writer = None
+
+    def write(self, row):
+        if self.file_format != 'csv':
+            self.stream.write(json.dumps(row, default=_json_default, ensure_ascii=False) + '\n')
+            return
+
+        if self._writer is None:
+            self._writer = csv.DictWriter(self.stream, list(row), extrasaction='ignore')
+            if self.header:
+                self._writer.writeheader()
+        self._writer.writerow(dict(
+            (key, self._cell(value)) for key, value in row.items()
+        ))
+
+    @staticmethod
+    def _cell(value):
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, default=_json_default, ensure_ascii=False)
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+
+class Checkpoint(object):
+    '''
+    Progress of a run, saved after every batch: the number of input rows done, and the length of the output
+    they were written to. Output written after the last save is cut off when resuming, so no row is written twice.
+
+    ## Parameters
+    `path` - File the progress is kept in, loaded if it exists.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.offset = 0
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                state = json.load(checkpoint)
+            self.rows, self.offset = state['rows'], state['offset']
+
+    # Saves the progress, replacing the file in one step so a crash never leaves it half written
+    def save(self, rows, offset):
+        self.rows, self.offset = rows, offset
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'rows': rows, 'offset': offset}, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        _replace(temporary, self.path)
+
+
+def _file_format(path, given):
+    return given or FORMATS.get(os.path.splitext(path)[1].lower(), 'jsonl')
+
+
+# Opens the output for writing in binary, cut off at `offset` when resuming
+def _open_output(path, offset):
+    if offset and os.path.exists(path):
+        output = open(path, 'r+b')
+        output.truncate(offset)
+        output.seek(offset)
+        return output
+    return open(path, 'wb')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='ponyexpress', description='Track, validate or rate the rows of a CSV or JSON Lines file with USPS.'
+    )
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('input', help='CSV or JSON Lines file, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='file to write the results to, - for stdout')
+    parser.add_argument('--input-format', choices=('csv', 'jsonl'), help='defaults to the input file extension')
+    parser.add_argument('--output-format', choices=('csv', 'jsonl'), help='defaults to the output file extension')
+    parser.add_argument('--batch', type=int, help='rows per batch, defaults to the most the API takes at once')
+    parser.add_argument('--concurrency', type=int, default=4, help='batches run at once')
+    parser.add_argument('--checkpoint', help='file to save progress to, and resume from')
+    parser.add_argument('--username', default=os.environ.get('PONYEXPRESS_USERNAME'))
+    parser.add_argument('--password', default=os.environ.get('PONYEXPRESS_PASSWORD', ''))
+    parser.add_argument('--base-url', help='carrier URL to use instead of production')
+    parser.add_argument('--rate-limit', type=float, help='most requests per second to send')
+    parser.add_argument('--rate-type', choices=(DOMESTIC, INTERNATIONAL), default=DOMESTIC)
+    parser.add_argument('--service', default='ALL', help='service to rate, defaults to all of them')
+
+    args = parser.parse_args(argv)
+    if not args.username:
+        parser.error('a username is required, with --username or PONYEXPRESS_USERNAME')
+    if args.checkpoint and args.output == '-':
+        parser.error('--checkpoint needs an --output file to resume')
+    args.batch = args.batch or BATCH_SIZES[args.command]
+    args.input_format = _file_format(args.input, args.input_format)
+    # Results written to stdout keep the input's format
+    args.output_format = args.output_format or (args.input_format if args.output == '-' else None)
+    args.output_format = _file_format(args.output, args.output_format)
+    return args
+
+
+'''
+Runs a bulk job, see the module documentation.
+
+## Parameters
+`argv` - Command line arguments, defaults to those of the process.
+
+## Returns
+`Integer` - The exit status.
+'''
+def main(argv=None):
+    args = parse_args(argv)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    done = checkpoint.rows if checkpoint else 0
+
+    usps = USPSCourier(
+        args.username, args.password, pool_size=args.concurrency,
+        rate_limiter=RateLimiter(args.rate_limit) if args.rate_limit else None
+    )
+    if args.base_url:
+        usps.base_url = args.base_url
+
+    source = sys.stdin if args.input == '-' else io.open(args.input, newline='', encoding='utf-8')
+    if args.output == '-':
+        raw = None
+        output = sys.stdout
+    else:
+        raw = _open_output(args.output, checkpoint.offset if checkpoint else 0)
+        output = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    writer = RowWriter(output, args.output_format, header=not done)
+
+    # Progress is saved every batch worth of rows, and when a batch fails, since the rows before it are complete
+    def save(done):
+        output.flush()
+        if checkpoint is not None:
+            checkpoint.save(done, raw.tell())
+
+    rows = itertools.islice(read_rows(source, args.input_format), done, None)
+    try:
+        for row in COMMANDS[args.command](usps, rows, args):
+            writer.write(row)
+            done += 1
+            if done % args.batch == 0:
+                save(done)
+        save(done)
+    except KeyboardInterrupt:
+        sys.stderr.write('Interrupted after %d rows\n' % done)
+        return 130
+    except Exception as error:
+        save(done)
+        sys.stderr.write('Stopped after %d rows: %s\n' % (done, error))
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if raw is not None:
+            output.close()
+        usps.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+'''
+Single-flight coalescing of identical requests. While a request is in flight, callers making the same
+request wait for it and share its result, or its error, instead of sending their own. The asyncio version,
+`AsyncSingleFlight`, lives in `ponyexpress.aio`.
+'''
+import threading
+
+
+class _Call(object):
+    # The in-flight call every waiter shares
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Coalesces identical calls made from several threads.
+
+    ## Attributes
+    `coalesced` - Number of calls which were answered by another call in flight, instead of running.
+    '''
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    '''
+    Runs `function`, unless a call with the same key is already running, in which case its outcome is shared.
+
+    ## Parameters
+    `key` - Identifies identical calls.
+    `function` - Called without arguments to produce the result.
+
+    ## Returns
+    `Object` - The result of the call. Errors are raised in every caller.
+    '''
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
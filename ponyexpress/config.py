@@ -1,2 +1,47 @@
 JSON_RESPONSE = 'JSON'
 XML_RESPONSE = 'XML'
+
+# Connection pool defaults shared by every courier
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+
+# Maximum number of requests an asynchronous courier has in flight at once
+DEFAULT_CONCURRENCY = 10
+
+# Response cache defaults
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_RATE_CACHE_TTL = 60 * 60
+DEFAULT_ADDRESS_CACHE_TTL = 30 * 24 * 60 * 60
+DEFAULT_ADDRESS_NEGATIVE_TTL = 24 * 60 * 60
+
+# Tracking cache TTLs for packages which are still moving, in seconds. The TTL grows with the time since
+# the latest event, from the minimum to the maximum.
+DEFAULT_TRACKING_MIN_TTL = 5 * 60
+DEFAULT_TRACKING_MAX_TTL = 6 * 60 * 60
+DEFAULT_TRACKING_TTL_FACTOR = 0.1
+
+# Bytes read from the network at a time when streaming a response
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# URL length past which XML requests are sent as a POST body instead of a query string
+DEFAULT_POST_THRESHOLD = 2000
+
+# Number of distinct tracking event dates, and times, remembered once parsed
+DATETIME_MEMO_SIZE = 4096
+
+# Maximum number of extra carrier values stored on a RateOption
+RATE_OPTION_MAX_EXTRAS = 8
+
+# Number of distinct tracking event types remembered once classified
+EVENT_TYPE_MEMO_SIZE = 4096
+
+# Request execution policy defaults. Idempotent requests are retried on connection errors and these statuses,
+# waiting a random time of up to `DEFAULT_BACKOFF * 2 ** attempt` seconds, capped at `DEFAULT_MAX_BACKOFF`.
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.1
+DEFAULT_MAX_BACKOFF = 2.0
+DEFAULT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Number of recent latencies hedging delays are computed from, and the number needed before hedging starts
+DEFAULT_LATENCY_WINDOW = 200
+DEFAULT_HEDGE_MIN_SAMPLES = 20
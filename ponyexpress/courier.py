@@ -1,24 +1,136 @@
 '''
 Base carrier class and helper objects.
 '''
-import requests, json
-import xml.etree.ElementTree as et
-from xml.etree.ElementTree import ParseError
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from ponyexpress.config import JSON_RESPONSE
+from ponyexpress.config import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_POST_THRESHOLD,
+    DEFAULT_READ_TIMEOUT,
+    JSON_RESPONSE,
+    STREAM_CHUNK_SIZE
+)
+from ponyexpress import instrument
+from ponyexpress.coalesce import SingleFlight
+from ponyexpress.parsers import get_json_backend, get_xml_backend
+from ponyexpress.policy import RequestPolicy, clock
+from ponyexpress.request import HTTPRequest
+from ponyexpress.transport import RequestsTransport
+
+
+class ElementStream(object):
+    '''
+    Incremental XML parser for a response body which arrives in pieces. Hands out the direct children of the
+    root element with the requested tag as soon as each one is complete, and detaches every finished child
+    from the tree, so the tree never holds more than the element currently being received.
+
+    ## Parameters
+    `tag` - Tag of the root's children to hand out, such as TrackInfo.
+    `backend` - The `ponyexpress.parsers.XMLBackend` to parse with, defaults to the fastest installed.
+    '''
+    def __init__(self, tag, backend=None):
+        self.tag = tag
+        self._backend = get_xml_backend(backend)
+        self._parser = self._backend.pull_parser(events=('start', 'end'))
+        self._root = None
+        self._depth = 0
+
+    '''
+    Parses the next piece of the body.
+
+    ## Parameters
+    `data` - The next bytes of the response body.
+
+    ## Returns
+    `List` - The elements completed by this piece, in document order.
+    '''
+    def feed(self, data):
+        try:
+            self._parser.feed(data)
+            return self._read_events()
+        except self._backend.errors:
+            raise SyntaxError('The webserver responded with malformed XML')
+
+    # Finishes parsing once the whole body was fed, returning the last completed elements
+    def close(self):
+        try:
+            self._parser.close()
+            return self._read_events()
+        except self._backend.errors:
+            raise SyntaxError('The webserver responded with malformed XML')
+
+    def _read_events(self):
+        elements = []
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = element
+                self._depth += 1
+                continue
+
+            self._depth -= 1
+            if self._depth == 1:
+                # Finished children of the root are always its only child
+                self._root.remove(element)
+                if element.tag == self.tag:
+                    elements.append(element)
+        return elements
+
+
+# Closes the response of a hedged request which lost the race
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
 
 
 class BaseCourier(object):
     '''
     Provides base level attributes and methods for new carriers.
+
+    Every courier sends its requests through a transport owning a connection pool, so repeated calls reuse
+    keep-alive connections to the carrier instead of doing a fresh TCP handshake per request.
+
+    ## Parameters
+    `pool_size` - Maximum number of connections kept open to each carrier host.
+    `keep_alive` - Whether connections are kept open between requests.
+    `connect_timeout` - Seconds to wait for a connection to be established.
+    `read_timeout` - Seconds to wait for the server to send a response.
+    `prewarm` - Open connections to `base_url` at construction instead of on the first call.
+    `streaming` - Parse batch responses incrementally as they arrive, see `get_server_elements`. Needs an XML
+        backend which can, lxml on Python 2.7, where the standard library can't.
+    `xml_parser` - Name of the `ponyexpress.parsers` XML backend to use, defaults to the fastest installed.
+    `json_parser` - Name of the `ponyexpress.parsers` JSON backend to use, defaults to the fastest installed.
+    `post_threshold` - URL length past which `XMLEndpoint` requests are sent as a POST body.
+    `policy` - The `ponyexpress.policy.RequestPolicy` deciding deadlines, retries and hedging. Defaults to
+        retrying idempotent requests without hedging.
+    `rate_limiter` - A `ponyexpress.limiter.RateLimiter` every request waits on, under the courier's `rate_limit_key`.
+    `coalesce` - Share one HTTP call, and its parsed result, between concurrent identical idempotent requests.
+    `transport` - The `ponyexpress.transport` transport to send requests with, such as an `HTTPXTransport` for
+        HTTP/2. Defaults to a `RequestsTransport` built from `pool_size` and `keep_alive`.
+    `hooks` - Callables receiving the `ponyexpress.instrument.CallMetrics` of every call this courier makes,
+        on top of the hooks added with `ponyexpress.instrument.add_hook`.
     '''
-    # Creates a new instance of the postal carrier base object
-    def __init__(self, username, password=''):
-        # Init instance variables
-        self.tracking_endpoint = None
-        self.shipping_endpoint = None
-        self.address_validation_endpoint = None
+    # Root URL of the carrier's API, endpoints are relative to it
+    base_url = None
 
+    # Name of the carrier, couriers of the same carrier and username share their rate limits
+    carrier = None
+
+    # Service endpoints, either a `ponyexpress.request.XMLEndpoint` compiled once for the whole class,
+    # or a URL format string. Carriers override the ones they support.
+    tracking_endpoint = None
+    shipping_endpoint = None
+    address_validation_endpoint = None
+
+    # Creates a new instance of the postal carrier base object
+    def __init__(self, username, password='', pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 prewarm=False, streaming=False, xml_parser=None, json_parser=None,
+                 post_threshold=DEFAULT_POST_THRESHOLD, policy=None, rate_limiter=None, coalesce=True,
+                 hooks=None, transport=None):
         # Default response parse is JSON. See `ponyexpress.config` for preset types.
         self.response_type = JSON_RESPONSE
 
@@ -26,6 +138,113 @@ class BaseCourier(object):
         self.username = username
         self.password = password
 
+        # Parsing libraries for each response type
+        self.xml_parser = get_xml_backend(xml_parser)
+        self.json_parser = get_json_backend(json_parser)
+        if streaming and not self.xml_parser.streams:
+            raise ImportError(
+                'Streaming needs an XML backend which parses incrementally, the %s backend can\'t on this Python. '
+                'Install lxml with `pip install ponyexpress[fast]`' % self.xml_parser.name
+            )
+
+        # Connection pool shared by every request made through this courier
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.transport = transport or self._create_transport(pool_size, keep_alive)
+        self.streaming = streaming
+        self.post_threshold = post_threshold
+        self.policy = policy or RequestPolicy()
+        self.rate_limiter = rate_limiter
+        self.coalesce = coalesce
+        self._flights = self._create_flights()
+        self.hooks = list(hooks or ())
+        # Threads sending hedged requests, created on first use by whichever thread hedges first
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+        if prewarm:
+            self.prewarm()
+
+    # Builds the default transport used for every request
+    def _create_transport(self, pool_size, keep_alive):
+        return RequestsTransport(pool_size, keep_alive)
+
+    # The transport's HTTP client, such as the `requests.Session` of a `RequestsTransport`. None for transports
+    # without one, like `MemoryTransport`.
+    @property
+    def session(self):
+        return getattr(self.transport, 'session', None)
+
+    @session.setter
+    def session(self, session):
+        self.transport.session = session
+
+    # Errors of a single attempt which are worth retrying
+    @property
+    def _retryable_errors(self):
+        return self.transport.retryable_errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    '''
+    Opens connections to the carrier ahead of time so the first real calls skip the handshake.
+    Warming is best effort, connection failures here are left for the real request to report.
+
+    ## Parameters
+    `connections` - Number of connections to open, defaults to the full pool size.
+    '''
+    def prewarm(self, connections=None):
+        if not self.base_url:
+            return
+
+        # Connections are only kept when requests are in flight at the same time
+        threads = [
+            threading.Thread(target=self.transport.warm, args=(self.base_url, self.timeout))
+            for _ in range(connections or self.pool_size)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Tracks the requests in flight, for coalescing
+    def _create_flights(self):
+        return SingleFlight()
+
+    # Number of calls which shared the HTTP call of an identical one in flight, instead of making their own
+    @property
+    def coalesced(self):
+        return self._flights.coalesced
+
+    # Key of the courier's bucket in its `rate_limiter`
+    @property
+    def rate_limit_key(self):
+        return '%s:%s' % (self.carrier or type(self).__name__, self.username)
+
+    # Measurements for a call, or None when there is no hook to hand them to, so nothing is measured
+    def _metrics(self, method, items):
+        if not self.hooks and not instrument.HOOKS:
+            return None
+        metrics = instrument.CallMetrics(method, type(self).__name__)
+        metrics.items = items
+        return metrics
+
+    # Hands the measurements of a finished call to every hook
+    def _emit(self, metrics, error=None):
+        metrics.finish(self.hooks + instrument.HOOKS, error)
+
+    # Releases every pooled connection held by the courier
+    def close(self):
+        with self._hedge_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
+        self.transport.close()
+
     '''
     Helper function for parsing a JSON based repsonse. Very naive for now, just loads and returns
 
@@ -37,8 +256,8 @@ class BaseCourier(object):
     '''
     def parse_json(self, response):
         try:
-            return json.loads(response)
-        except ValueError:
+            return self.json_parser.loads(response)
+        except self.json_parser.errors:
             raise SyntaxError('The webserver responded with malformed %s' % self.response_type)
 
     '''
@@ -52,8 +271,8 @@ class BaseCourier(object):
     '''
     def parse_xml(self, response):
         try:
-            return et.fromstring(response)
-        except ParseError:
+            return self.xml_parser.fromstring(response)
+        except self.xml_parser.errors:
             raise SyntaxError('The webserver responded with malformed %s' % self.response_type)
 
     '''
@@ -61,32 +280,273 @@ class BaseCourier(object):
     Simply throw an exception saying something went wrong, but we don't know what to do about it.
 
     ## Parameters
-    `error` - The error data associated with the response.
+    `error` - The error data associated with the response, such as the HTTP response which was not a success.
     '''
-    def process_exception(self, *kwargs):
+    def process_exception(self, error=None):
         raise NotImplementedError('An error occured in your request. Unable to parse detailed error message.')
 
     '''
     Base XMl response. Gets and parses a servers response, with basic error handling.
 
     ## Parameters
-    `tracking_id` - String representing the tracking identifier for your package/letter.
+    `endpoint` - The service endpoint to request.
+    `params` - Parameters rendered into the request.
+    `method` - Name of the API called, reported to the instrumentation hooks.
+    `build` - Function building the response objects from the parsed response, timed apart from parsing.
+    `items` - Number of items the call is made for, reported to the instrumentation hooks.
 
     ## Returns
-    `Response` - The parsed response from the server. Can be XMLElementTree or JSON decoded Python object.
+    `Response` - The parsed response from the server, or what `build` made of it. The parsed response can be
+        XMLElementTree or JSON decoded Python object.
     '''
-    def get_server_response(self, endpoint='', params={}, method='default'):
+    def get_server_response(self, endpoint='', params={}, method='default', build=None, items=1):
+        metrics = self._metrics(method, items)
+        if metrics is None:
+            parsed_response = self._get_parsed(self._prepare_request(endpoint, params, method))
+            return parsed_response if build is None else build(parsed_response)
+
+        try:
+            request = self._prepare_request(endpoint, params, method)
+            metrics.request(request)
+            parsed_response = self._get_parsed(request, metrics)
+
+            started = clock()
+            response = parsed_response if build is None else build(parsed_response)
+            metrics.build = clock() - started
+        except Exception as error:
+            self._emit(metrics, error)
+            raise
+
+        self._emit(metrics)
+        return response
+
+    # Sends the request and parses its response, sharing both with identical requests in flight
+    def _get_parsed(self, request, metrics=None):
+        if not (self.coalesce and request.idempotent):
+            return self._fetch(request, metrics)
+
+        if metrics is None:
+            return self._flights.do(request.key, lambda: self._fetch(request))
+
+        # Only the call which actually goes out measures the network and parsing
+        metrics.coalesced = True
+
+        def fetch():
+            metrics.coalesced = False
+            return self._fetch(request, metrics)
+
+        return self._flights.do(request.key, fetch)
+
+    # Sends the request and parses its response, timing both when measuring
+    def _fetch(self, request, metrics=None):
+        if metrics is None:
+            return self._handle_response(self._execute(request))
+
+        started = clock()
+        response = self._execute(request)
+        received = clock()
+        metrics.response(response, received - started)
+        try:
+            return self._handle_response(response)
+        finally:
+            metrics.parse = clock() - received
+
+    '''
+    Streaming XML response. Parses the body incrementally while it is downloaded, and yields the
+    root's children with the given tag one at a time. Each yielded element is detached from the tree,
+    so memory stays flat no matter how large the response is.
+
+    When measured, the time the consumer spends between elements is reported as the build time.
+
+    ## Parameters
+    `tag` - Tag of the root's children to yield.
+    `items` - Number of items the call is made for, reported to the instrumentation hooks.
+
+    ## Returns
+    `Generator` - Yields XMLElements as each one has been received.
+    '''
+    def iter_server_response(self, endpoint='', params={}, tag=None, method='default', items=1):
+        metrics = self._metrics(method, items)
+        error = None
+        try:
+            request = self._prepare_request(endpoint, params, method)
+            if metrics is None:
+                for element in self._iter_elements(request, tag):
+                    yield element
+                return
+
+            metrics.request(request)
+            for element in self._iter_elements(request, tag, metrics):
+                yield element
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            if metrics is not None:
+                metrics.consumed()
+                self._emit(metrics, error)
+
+    def _iter_elements(self, request, tag, metrics=None):
+        started = clock()
+        response = self._execute(request, stream=True)
+
+        try:
+            if response.status_code != 200:
+                self.process_exception(response)
+
+            # Save the response object for user inspection
+            self._server_response = response
+
+            stream = ElementStream(tag, self.xml_parser)
+            chunks, feed, close = response.iter_content(STREAM_CHUNK_SIZE), stream.feed, stream.close
+            if metrics is not None:
+                metrics.status = response.status_code
+                metrics.connect = clock() - started
+                metrics.add('network', metrics.connect)
+                chunks = metrics.receive(chunks)
+                feed, close = metrics.timed('parse', feed), metrics.timed('parse', close)
+
+            for data in chunks:
+                for element in feed(data):
+                    yield element
+            for element in close():
+                yield element
+        finally:
+            response.close()
+
+    '''
+    Gets the root's children with the given tag from an XML response. Uses `iter_server_response`
+    when the courier is `streaming`, otherwise parses the whole response first.
+
+    ## Parameters
+    `build` - Function building the response objects from the elements, timed apart from parsing.
+    `items` - Number of items the call is made for, reported to the instrumentation hooks.
+    `each` - Function converting every element as soon as it is parsed, `build` then gets the converted
+        elements. Lets a streamed element be dropped before the next one arrives.
+
+    ## Returns
+    `Iterable` - XMLElements with the given tag, in document order, or what `build` made of them.
+    '''
+    def get_server_elements(self, endpoint='', params={}, tag=None, method='default', build=None, items=1, each=None):
+        if self.streaming:
+            return self._build_elements(self.iter_server_response(endpoint, params, tag, method, items), build, each)
+
+        return self.get_server_response(
+            endpoint, params, method, lambda root: self._build_elements(root.findall(tag), build or list, each), items
+        )
+
+    # Converts the elements with `each`, lazily, then hands them to `build`, either being optional
+    @staticmethod
+    def _build_elements(elements, build=None, each=None):
+        if each is not None:
+            elements = (each(element) for element in elements)
+        return elements if build is None else build(elements)
+
+    # Renders the endpoint with the request and authentication parameters into the `HTTPRequest` to send
+    def _prepare_request(self, endpoint, params, method):
         # Checks to make sure that the carrier overrode the endpoint
         if not endpoint:
             raise NotImplementedError('Failed to specify the %s service endpoint.' % method)
 
         # Add default params
-        params.update({'username': self.username, 'password': self.password})
+        params = dict(params, username=self.username, password=self.password)
+
+        # Compiled endpoints render themselves, plain URLs are formatted as they are
+        if hasattr(endpoint, 'prepare'):
+            request = endpoint.prepare(self.base_url, params, self.post_threshold)
+        else:
+            request = HTTPRequest('GET', endpoint.format(**params))
+
+        self.last_endpoint = request.url
+        self.last_request = request
+        return request
+
+    '''
+    Sends a request following the courier's `policy`. Connection errors, timeouts and retryable statuses of
+    idempotent requests are retried, and slow idempotent requests may be hedged with a second copy.
+
+    ## Parameters
+    `request` - The `HTTPRequest` to send.
+    `stream` - Leave the body to be read from the response, instead of downloading it. Streams are never hedged.
+
+    ## Returns
+    `Response` - The final response, which might still not be a success.
+    '''
+    def _execute(self, request, stream=False):
+        policy = self.policy
+        policy.count('requests')
+        expires = policy.expires(clock())
+
+        attempt = 0
+        while True:
+            timeout = policy.timeout(self.timeout, expires)
+            try:
+                response = self._attempt(request, timeout, stream)
+            except self._retryable_errors:
+                delay = policy.retry_delay(request, attempt, expires)
+                if delay is None:
+                    raise
+            else:
+                if not policy.retry_status(response.status_code):
+                    return response
+                delay = policy.retry_delay(request, attempt, expires)
+                if delay is None:
+                    return response
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    # Sends a single attempt, hedged when the policy asks for it
+    def _attempt(self, request, timeout, stream):
+        policy = self.policy
+        policy.count('attempts')
+        delay = None if stream else policy.hedge_delay(request)
+
+        started = clock()
+        if delay is None:
+            response = self._send(request, timeout, stream)
+        else:
+            response = self._hedged_send(request, timeout, delay)
+        policy.record_latency(clock() - started)
+        return response
+
+    def _send(self, request, timeout, stream=False):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.rate_limit_key)
+        return self.transport.send(request, timeout, stream)
+
+    # Sends a request, and a second copy if the first hasn't been answered after `delay` seconds.
+    # The first successful reply is returned, the other one is closed whenever it arrives.
+    def _hedged_send(self, request, timeout, delay):
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_size)
+            executor = self._hedge_executor
+
+        primary = executor.submit(self._send, request, timeout)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        self.policy.count('hedges')
+        hedge = executor.submit(self._send, request, timeout)
+        pending = [primary, hedge]
+        while True:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is not None and pending:
+                    continue
 
-        # Make a request to the specified URL
-        self.last_endpoint = endpoint.format(**params)
-        response = requests.get(self.last_endpoint)
+                if future is hedge and future.exception() is None:
+                    self.policy.count('hedge_wins')
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return future.result()
 
+    # Parses a completed HTTP response, shared by every transport. Works with any response exposing
+    # `status_code` and `content`.
+    def _handle_response(self, response):
         # Check if we got a success, parse the results and construct the TrackingResponse object
         if response.status_code == 200:
             # Save the response object for user inspection
@@ -98,6 +558,6 @@ class BaseCourier(object):
             # We have no idea what the response looks like for the general case, so pass it up
             return parsed_response
         else:
-            self.process_exception()
+            self.process_exception(response)
 
         # If we got an error, return None, there was probably an exception thrown along the way too
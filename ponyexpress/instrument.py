@@ -0,0 +1,158 @@
+'''
+Instrumentation of the courier request pipeline. Each call to the carrier is timed phase by phase, and
+the measurements are handed to every registered hook. Without hooks nothing is measured at all.
+'''
+import logging
+import requests
+import threading
+from collections import defaultdict
+
+from ponyexpress.policy import clock
+
+logger = logging.getLogger(__name__)
+
+# Hooks called with the `CallMetrics` of every call made by any courier
+HOOKS = []
+
+
+# Registers a hook for the calls of every courier, any callable taking a `CallMetrics`
+def add_hook(hook):
+    HOOKS.append(hook)
+
+
+# Unregisters a hook added with `add_hook`
+def remove_hook(hook):
+    HOOKS.remove(hook)
+
+
+class CallMetrics(object):
+    '''
+    Measurements of a single call to the carrier. Times are in seconds, None when a phase didn't happen.
+
+    ## Attributes
+    `api` - Name of the API called, the `method` given to `get_server_response`, such as Tracking.
+    `courier` - Class name of the courier which made the call.
+    `http_method` - GET or POST.
+    `url` - The requested URL.
+    `build_request` - Time spent rendering the request.
+    `connect` - Time until the response headers arrived, connection setup and server time included.
+        None when the transport doesn't report it.
+    `transfer` - Time spent downloading the response body.
+    `network` - Total time spent sending and receiving, retries and hedges included.
+    `parse` - Time spent parsing the response body.
+    `build` - Time spent building the response objects, such as `TrackingEvent`s.
+    `total` - Time of the whole call.
+    `request_bytes` - Size of the URL and body sent.
+    `response_bytes` - Size of the body received.
+    `items` - Number of items, such as tracking ids, the call was made for.
+    `status` - HTTP status of the response.
+    `coalesced` - Whether the call shared the HTTP call of an identical one instead of making its own.
+    `error` - The exception which ended the call, otherwise None.
+    '''
+    __slots__ = (
+        'api', 'courier', 'http_method', 'url', 'build_request', 'connect', 'transfer', 'network', 'parse', 'build',
+        'total', 'request_bytes', 'response_bytes', 'items', 'status', 'coalesced', 'error', '_started'
+    )
+
+    def __init__(self, api, courier):
+        self.api = api
+        self.courier = courier
+        self.http_method = self.url = None
+        self.build_request = self.connect = self.transfer = self.network = self.parse = self.build = self.total = None
+        self.request_bytes = self.response_bytes = 0
+        self.items = 0
+        self.status = None
+        self.coalesced = False
+        self.error = None
+        self._started = clock()
+
+    # Records the request about to be sent
+    def request(self, request):
+        self.http_method = request.method
+        self.url = request.url
+        self.request_bytes = len(request.url) + len(request.body or '')
+        self.build_request = clock() - self._started
+
+    # Records a downloaded response, `network` being the seconds spent on it
+    def response(self, response, network):
+        self.status = response.status_code
+        self.response_bytes = len(response.content)
+        self.network = network
+
+        # requests reports the time until the headers arrived, httpx only the time until the body was read
+        if isinstance(response, requests.Response):
+            self.connect = min(response.elapsed.total_seconds(), network)
+            self.transfer = network - self.connect
+
+    # Adds to a phase measured in several pieces, such as a streamed response
+    def add(self, phase, seconds):
+        setattr(self, phase, (getattr(self, phase) or 0) + seconds)
+
+    # Wraps the chunks of a streamed response body, adding the wait for each one to `network`
+    def receive(self, chunks):
+        chunks = iter(chunks)
+        while True:
+            started = clock()
+            data = next(chunks, None)
+            self.add('network', clock() - started)
+            if data is None:
+                return
+            self.response_bytes += len(data)
+            yield data
+
+    # Wraps a function, adding the time spent in every call to `phase`
+    def timed(self, phase, function):
+        def call(*args):
+            started = clock()
+            try:
+                return function(*args)
+            finally:
+                self.add(phase, clock() - started)
+        return call
+
+    # For streamed responses, whatever time wasn't spent sending, receiving or parsing went to the consumer
+    def consumed(self):
+        spent = (self.build_request or 0) + (self.network or 0) + (self.parse or 0)
+        self.build = max(0, clock() - self._started - spent)
+        if self.connect is not None:
+            self.transfer = self.network - self.connect
+
+    # Completes the measurements, handing them to every hook. A failing hook is logged and skipped, so monitoring
+    # never fails the call, nor hides the error it raised.
+    def finish(self, hooks, error=None):
+        self.error = error
+        self.total = clock() - self._started
+        for hook in hooks:
+            try:
+                hook(self)
+            except Exception:
+                logger.exception('Instrumentation hook %r failed', hook)
+
+
+class StatsSink(object):
+    '''
+    A hook aggregating calls by API, for periodic reporting.
+
+    ## Attributes
+    `totals` - Per API name, the number of calls, errors and coalesced calls, the summed phase timings,
+        bytes and items.
+    '''
+    _summed = ('network', 'parse', 'build', 'total', 'request_bytes', 'response_bytes', 'items')
+
+    def __init__(self):
+        self.totals = defaultdict(lambda: dict.fromkeys(('calls', 'errors', 'coalesced') + self._summed, 0))
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics):
+        with self._lock:
+            totals = self.totals[metrics.api]
+            totals['calls'] += 1
+            totals['errors'] += metrics.error is not None
+            totals['coalesced'] += metrics.coalesced
+            for name in self._summed:
+                totals[name] += getattr(metrics, name) or 0
+
+    # Totals as plain dictionaries, for reporting
+    def stats(self):
+        with self._lock:
+            return dict((api, dict(totals)) for api, totals in self.totals.items())
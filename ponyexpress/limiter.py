@@ -0,0 +1,150 @@
+'''
+Token bucket rate limiting of the requests sent with each carrier credential. Buckets live in the process by
+default, shared by every thread, or in a SQLite file to share them between the processes of a host.
+'''
+import os
+import sqlite3
+import threading
+import time
+
+from ponyexpress.policy import clock
+
+
+class RateLimitExceeded(Exception):
+    '''
+    Raised when a request would have to wait longer for a token than the limiter allows.
+    '''
+    pass
+
+
+# Refills a bucket and takes `cost` tokens from it. The bucket may go into debt, which later requests wait out,
+# so waiting requests are served in order. Returns the new token count and the seconds to wait before sending,
+# or None when the wait would be longer than `max_wait`.
+def _take(tokens, updated, now, cost, rate, burst, max_wait):
+    tokens = min(burst, tokens + max(0, now - updated) * rate)
+    remaining = tokens - cost
+    wait = max(0, -remaining / rate)
+    if max_wait is not None and wait > max_wait:
+        return None
+    return remaining, wait
+
+
+class MemoryBucketStore(object):
+    '''
+    Buckets kept in the process, shared by every thread using the store.
+    '''
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    # Takes tokens from a bucket, see `_take`
+    def take(self, key, cost, rate, burst, max_wait):
+        with self._lock:
+            now = clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            taken = _take(tokens, updated, now, cost, rate, burst, max_wait)
+            if taken is not None:
+                self._buckets[key] = (taken[0], now)
+            return taken
+
+
+class SQLiteBucketStore(object):
+    '''
+    Buckets kept in a SQLite database, shared by every process on the host using the same file.
+
+    ## Parameters
+    `path` - Location of the database file, created if it does not exist.
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+        # sqlite3 connections can't be shared between threads
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    # Opens, or re-uses, this thread's connection to the database. Transactions are managed by hand.
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    # Takes tokens from a bucket, see `_take`. The write lock is held from read to write, so processes
+    # never hand out the same tokens.
+    def take(self, key, cost, rate, burst, max_wait):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Wall clock time, since monotonic clocks aren't comparable between processes
+            now = time.time()
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key, )).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            taken = _take(tokens, updated, now, cost, rate, burst, max_wait)
+            if taken is not None:
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, taken[0], now)
+                )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return taken
+
+
+# Buckets of every in-process limiter, so couriers created by different threads share their limits
+_shared_store = MemoryBucketStore()
+
+
+class RateLimiter(object):
+    '''
+    Limits the requests sent under each key, such as a courier's `rate_limit_key`, to a sustained rate with bursts.
+    Pass it to a courier as `rate_limiter`. Every attempt, retries and hedges included, takes a token.
+
+    ## Parameters
+    `rate` - Requests per second allowed under each key.
+    `burst` - Requests which may be sent at once after a quiet period, defaults to `rate`, at least 1.
+    `block` - Wait for a token when there is none. Otherwise `RateLimitExceeded` is raised straight away.
+    `timeout` - Longest wait for a token in seconds, `RateLimitExceeded` is raised instead of waiting longer.
+        None waits as long as it takes.
+    `path` - SQLite file to keep the buckets in, sharing them with other processes. Kept in this process when not given.
+    `store` - Any bucket store to use instead, overrides `path`.
+    '''
+
+    # Init for a new RateLimiter
+    def __init__(self, rate, burst=None, block=True, timeout=None, path=None, store=None):
+        if rate <= 0:
+            raise ValueError('The rate must be positive (received %r)' % rate)
+
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self.block = block
+        self.timeout = timeout
+        if store is None:
+            store = SQLiteBucketStore(path) if path else _shared_store
+        self.store = store
+
+    '''
+    Takes a token for a request without waiting for it.
+
+    ## Parameters
+    `key` - The bucket to take from.
+    `tokens` - Number of tokens the request costs.
+
+    ## Returns
+    `Float` - Seconds to wait before sending the request. Raises `RateLimitExceeded` if that is too long.
+    '''
+    def reserve(self, key, tokens=1):
+        taken = self.store.take(key, tokens, self.rate, self.burst, self.timeout if self.block else 0)
+        if taken is None:
+            raise RateLimitExceeded('Rate limit of %s requests per second reached for %s' % (self.rate, key))
+        return taken[1]
+
+    # Takes a token for a request, sleeping until it may be sent
+    def acquire(self, key, tokens=1):
+        wait = self.reserve(key, tokens)
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,236 @@
+'''
+Offline rating from the carrier's published zone chart and price grid. The tables are written once to a file,
+then memory-mapped by every process using them, so workers share one copy and quotes take microseconds.
+'''
+import json
+import math
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from ponyexpress.rates import DOMESTIC, RateCalculation, RateCalculationResponse
+
+# Identifies rate table files, followed by the format version
+MAGIC = b'PONYRATE'
+VERSION = 1
+
+# Price of weight/zone combinations a service is not available for
+UNAVAILABLE = float('nan')
+
+# Every size and shape, the default coverage of a service
+SIZES = ('REGULAR', 'LARGE')
+SHAPES = ('RECTANGULAR', 'NONRECTANGULAR')
+
+
+# Memoryviews can be cast to typed views of the mapped file from Python 3.3
+_CAN_CAST = hasattr(memoryview, 'cast')
+
+
+# Pads a section to a multiple of 8 bytes, keeping the sections after it aligned
+def _pad(data, fill=b'\0'):
+    return data + fill * (-len(data) % 8)
+
+
+# The bytes of an array, `tostring` before Python 3.2
+def _tobytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+'''
+Writes zone and price tables to a file for `LocalRateEngine`.
+
+## Parameters
+`path` - File to write.
+`zones` - Iterable of (origin ZIP3, first destination ZIP3, last destination ZIP3, zone) ranges, as published in
+    the zone chart. ZIP3s are integers, 112 for 112xx.
+`services` - List of dictionaries describing each service:
+    `service` - The service code used in rate requests, such as PRIORITY.
+    `name` - The name given to its `RateCalculation`s.
+    `rate_type` - DOMESTIC or INTERNATIONAL, defaults to DOMESTIC.
+    `unit` - 'lb' when priced per started pound, 'oz' when priced per started ounce.
+    `sizes`, `shapes` - The package sizes and shapes the service is priced for, defaults to all of them.
+    `prices` - One row per weight unit, 1 lb or 1 oz first, each holding the price for zone 1 onwards.
+        None where the service is not available.
+`complete` - Whether `services` lists every service of the carrier, so a quote for all services can be
+    answered locally. Otherwise only quotes for a single covered service are.
+'''
+def write_rate_tables(path, zones, services, complete=False):
+    zones = sorted(zones)
+    starts = array('I', [origin * 1000 + first for origin, first, _, _ in zones])
+    ends = array('H', [last for _, _, last, _ in zones])
+    zone_numbers = array('B', [zone for _, _, _, zone in zones])
+
+    prices = array('f')
+    header_services = []
+    for service in services:
+        rows = service['prices']
+        zone_count = max(len(row) for row in rows)
+        header_services.append({
+            'service': service['service'].upper(),
+            'name': service['name'],
+            'rate_type': service.get('rate_type', DOMESTIC),
+            'unit': service.get('unit', 'lb'),
+            'sizes': list(service.get('sizes', SIZES)),
+            'shapes': list(service.get('shapes', SHAPES)),
+            'weights': len(rows),
+            'zones': zone_count,
+            'offset': len(prices),
+        })
+        for row in rows:
+            row = list(row) + [None] * (zone_count - len(row))
+            prices.extend(UNAVAILABLE if price is None else price for price in row)
+
+    sections = [_pad(_tobytes(starts)), _pad(_tobytes(ends)), _pad(_tobytes(zone_numbers)), _tobytes(prices)]
+    header = _pad(json.dumps({
+        'byteorder': sys.byteorder,
+        'complete': complete,
+        'ranges': len(starts),
+        'services': header_services,
+        'sections': [len(section) for section in sections],
+    }).encode('utf-8'), fill=b' ')
+
+    with open(path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack('II', VERSION, len(header)))
+        handle.write(header)
+        for section in sections:
+            handle.write(section)
+
+
+class LocalRateEngine(object):
+    '''
+    Rates packages from a file written by `write_rate_tables`, without calling the carrier.
+    Pass it to a courier as `local_rates`, and only quotes the tables don't cover are sent to the API.
+
+    ## Parameters
+    `path` - The rate table file. It is memory-mapped read only, so processes share the pages. Python 2 can't
+        view the mapped pages as typed arrays, and copies the tables into memory instead.
+    '''
+
+    # Init for a new LocalRateEngine
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a rate table file' % path)
+        version, header_size = struct.unpack_from('II', self._mmap, len(MAGIC))
+        if version != VERSION:
+            raise ValueError('Unsupported rate table version %d in %s' % (version, path))
+
+        position = len(MAGIC) + 8
+        header = json.loads(self._mmap[position:position + header_size].decode('utf-8'))
+        position += header_size
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('%s was written on a %s endian machine' % (path, header['byteorder']))
+
+        # Views straight onto the mapped file, nothing is copied
+        view = memoryview(self._mmap) if _CAN_CAST else None
+        sections = []
+        for size, code in zip(header['sections'], ('I', 'H', 'B', 'f')):
+            if view is not None:
+                sections.append(view[position:position + size].cast(code))
+            else:
+                sections.append(array(code, self._mmap[position:position + size]))
+            position += size
+        ranges = header['ranges']
+        self._starts, self._ends, self._zones = sections[0][:ranges], sections[1][:ranges], sections[2][:ranges]
+        self._prices = sections[3]
+        # Every view has to be released before the file can be unmapped
+        self._views = [view] + sections + [self._starts, self._ends, self._zones] if view is not None else []
+
+        self.complete = header['complete']
+        self.services = header['services']
+        for service in self.services:
+            service['sizes'] = frozenset(service['sizes'])
+            service['shapes'] = frozenset(service['shapes'])
+
+    # Releases the mapped file
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    '''
+    Looks up the zone between two ZIP codes.
+
+    ## Returns
+    `Integer` - The zone, or None if the zone chart does not cover the pair.
+    '''
+    def zone(self, origin, destination):
+        try:
+            key = int(str(origin)[:3]) * 1000 + int(str(destination)[:3])
+        except ValueError:
+            return None
+
+        index = bisect_right(self._starts, key) - 1
+        if index < 0 or self._starts[index] // 1000 != key // 1000 or key % 1000 > self._ends[index]:
+            return None
+        return self._zones[index]
+
+    # Price of a package with a service, or None when the service doesn't cover it
+    def _price(self, service, package, zone):
+        if package.size not in service['sizes'] or package.shape not in service['shapes']:
+            return None
+        if not 1 <= zone <= service['zones']:
+            return None
+
+        ounces = package.weight[0] * 16 + package.weight[1]
+        units = max(int(math.ceil(ounces / 16.0 if service['unit'] == 'lb' else ounces)), 1)
+        if units > service['weights']:
+            return None
+
+        price = self._prices[service['offset'] + (units - 1) * service['zones'] + zone - 1]
+        return None if price != price else price
+
+    '''
+    Rates a package locally.
+
+    ## Parameters
+    `package` - The `Package` to rate.
+    `rate_type` - Either `DOMESTIC` or `INTERNATIONAL`.
+    `method` - The service code to rate, or ALL for every service.
+    `package_id` - The id to give the `RateCalculation`s.
+
+    ## Returns
+    `RateCalculationResponse` - The rates, or None when the tables can't answer the quote in full and the
+        carrier has to be asked.
+    '''
+    def rate(self, package, rate_type=DOMESTIC, method='ALL', package_id='0'):
+        zone = self.zone(package.origin, package.destination)
+        if zone is None:
+            return None
+
+        method = method.upper()
+        if method == 'ALL':
+            if not self.complete:
+                return None
+            services = [service for service in self.services if service['rate_type'] == rate_type]
+        else:
+            services = [
+                service for service in self.services if service['rate_type'] == rate_type and service['service'] == method
+            ]
+            if not services:
+                return None
+
+        response = RateCalculationResponse()
+        for service in services:
+            price = self._price(service, package, zone)
+            if price is None:
+                # A covered service which doesn't price this package can't be answered for a single service
+                if method != 'ALL':
+                    return None
+                continue
+            response.add(RateCalculation(package, round(price, 2), service['name'], destination_type=rate_type, package_id=package_id))
+
+        return response if response.rates else None
@@ -0,0 +1,140 @@
+'''
+Parser backends for courier responses. The fastest installed library is used by default, lxml for XML and
+orjson or ujson for JSON, falling back to the standard library. Every backend builds the same objects.
+'''
+import json
+import xml.etree.ElementTree as et
+from collections import OrderedDict
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class XMLBackend(object):
+    '''
+    An XML parsing library.
+
+    ## Attributes
+    `name` - Name the backend is registered under.
+    `errors` - Exceptions the library raises for malformed documents.
+    `streams` - Whether the library can parse incrementally, needed by streaming couriers.
+    '''
+    def __init__(self, name, fromstring, pull_parser, errors):
+        self.name = name
+        self.errors = errors
+        self._fromstring = fromstring
+        self._pull_parser = pull_parser
+
+    @property
+    def streams(self):
+        return self._pull_parser is not None
+
+    # Parses a whole document, returning its root element
+    def fromstring(self, data):
+        return self._fromstring(data)
+
+    # Creates an incremental parser with the `feed`, `read_events` and `close` methods of `XMLPullParser`
+    def pull_parser(self, events=('start', 'end')):
+        if self._pull_parser is None:
+            raise ImportError(
+                'The %s XML backend can\'t parse incrementally on this Python, install lxml with '
+                '`pip install ponyexpress[fast]`' % self.name
+            )
+        return self._pull_parser(events=events)
+
+
+class JSONBackend(object):
+    '''
+    A JSON parsing library.
+
+    ## Attributes
+    `name` - Name the backend is registered under.
+    `errors` - Exceptions the library raises for malformed documents.
+    '''
+    def __init__(self, name, loads, errors):
+        self.name = name
+        self.errors = errors
+        self._loads = loads
+
+    # Parses a whole document
+    def loads(self, data):
+        return self._loads(data)
+
+
+# lxml refuses unicode strings carrying an encoding declaration, so text is handed over as UTF-8
+def _lxml_fromstring(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return lxml_etree.fromstring(data, _lxml_parser)
+
+
+# Backends by name, in order of preference
+XML_BACKENDS = OrderedDict()
+JSON_BACKENDS = OrderedDict()
+
+if lxml_etree is not None:
+    # Entities declared in the document are expanded and external ones refused, matching the standard library.
+    # Whole documents and pull parsers share the options, so streamed responses build the same elements.
+    _LXML_OPTIONS = {'resolve_entities': 'internal', 'no_network': True}
+    _lxml_parser = lxml_etree.XMLParser(**_LXML_OPTIONS)
+    XML_BACKENDS['lxml'] = XMLBackend(
+        'lxml', _lxml_fromstring, lambda events: lxml_etree.XMLPullParser(events, **_LXML_OPTIONS),
+        (lxml_etree.XMLSyntaxError, )
+    )
+# The standard library only parses incrementally from Python 3.4
+XML_BACKENDS['etree'] = XMLBackend('etree', et.fromstring, getattr(et, 'XMLPullParser', None), (et.ParseError, ))
+
+if orjson is not None:
+    JSON_BACKENDS['orjson'] = JSONBackend('orjson', orjson.loads, (ValueError, ))
+if ujson is not None:
+    JSON_BACKENDS['ujson'] = JSONBackend('ujson', ujson.loads, (ValueError, ))
+JSON_BACKENDS['json'] = JSONBackend('json', json.loads, (ValueError, ))
+
+
+'''
+Looks up an XML backend.
+
+## Parameters
+`name` - Name of the backend, or None for the fastest one installed. A backend instance is returned as is.
+
+## Returns
+`XMLBackend` - The requested backend. Raises `ValueError` when it is not installed.
+'''
+def get_xml_backend(name=None):
+    return _get_backend(XML_BACKENDS, XMLBackend, name, 'XML')
+
+
+'''
+Looks up a JSON backend.
+
+## Parameters
+`name` - Name of the backend, or None for the fastest one installed. A backend instance is returned as is.
+
+## Returns
+`JSONBackend` - The requested backend. Raises `ValueError` when it is not installed.
+'''
+def get_json_backend(name=None):
+    return _get_backend(JSON_BACKENDS, JSONBackend, name, 'JSON')
+
+
+def _get_backend(backends, backend_class, name, kind):
+    if isinstance(name, backend_class):
+        return name
+    if name is None:
+        return next(iter(backends.values()))
+    try:
+        return backends[name]
+    except KeyError:
+        raise ValueError('Unknown %s parser backend %r, installed backends are: %s' % (kind, name, ', '.join(backends)))
@@ -0,0 +1,154 @@
+'''
+Request execution policy for the couriers: a deadline per call, retries with jittered exponential
+backoff for idempotent requests, and hedged requests for calls which take longer than usual.
+'''
+import random
+import threading
+import time
+from collections import deque
+
+from ponyexpress.config import (
+    DEFAULT_BACKOFF,
+    DEFAULT_HEDGE_MIN_SAMPLES,
+    DEFAULT_LATENCY_WINDOW,
+    DEFAULT_MAX_BACKOFF,
+    DEFAULT_RETRIES,
+    DEFAULT_RETRY_STATUSES
+)
+
+# Monotonic clock where there is one, so deadlines don't jump with the wall clock
+clock = getattr(time, 'monotonic', time.time)
+
+
+class DeadlineExceeded(Exception):
+    '''
+    Raised when a call ran out of time before the carrier answered, across every retry and hedge.
+    '''
+    pass
+
+
+class RequestPolicy(object):
+    '''
+    Decides how a courier executes each request. One policy may be shared by several couriers,
+    which then share its latency history and metrics.
+
+    ## Parameters
+    `deadline` - Seconds a whole call may take, retries and backoff included. None for no limit besides the
+        courier's connect and read timeouts.
+    `retries` - Number of times an idempotent request is retried after a connection error, timeout or one of
+        `retry_statuses`.
+    `backoff` - Base of the exponential backoff between retries, in seconds.
+    `max_backoff` - Upper bound of the backoff between retries, in seconds.
+    `retry_statuses` - HTTP statuses which are retried.
+    `hedge_percentile` - When set, an idempotent request still unanswered after this percentile of recent
+        latencies is sent a second time, and the first reply is used.
+    `hedge_after` - Seconds to wait before hedging until enough latencies were seen for `hedge_percentile`.
+        Without `hedge_percentile`, every idempotent request is hedged after this fixed delay.
+    `latency_window` - Number of recent latencies kept for `hedge_percentile`.
+    `hedge_min_samples` - Number of latencies needed before `hedge_percentile` is used.
+
+    ## Attributes
+    `metrics` - Number of times each path fired: requests, attempts, retries, hedges, hedge_wins,
+        deadline_exceeded and failures.
+    '''
+
+    # Init for a new RequestPolicy
+    def __init__(self, deadline=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 retry_statuses=DEFAULT_RETRY_STATUSES, hedge_percentile=None, hedge_after=None,
+                 latency_window=DEFAULT_LATENCY_WINDOW, hedge_min_samples=DEFAULT_HEDGE_MIN_SAMPLES):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.hedge_min_samples = hedge_min_samples
+
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.metrics = dict.fromkeys(
+            ('requests', 'attempts', 'retries', 'hedges', 'hedge_wins', 'deadline_exceeded', 'failures'), 0
+        )
+
+    # Adds to one of the `metrics`
+    def count(self, name, amount=1):
+        with self._lock:
+            self.metrics[name] += amount
+
+    # Metrics as a new dictionary, for reporting
+    def stats(self):
+        with self._lock:
+            return dict(self.metrics)
+
+    # Latest point in time a call started at `started` may finish by, or None
+    def expires(self, started):
+        return None if self.deadline is None else started + self.deadline
+
+    '''
+    Connect and read timeouts of the next attempt, shortened to what is left of the deadline.
+
+    ## Parameters
+    `timeout` - The courier's (connect, read) timeouts.
+    `expires` - When the call has to be finished by, from `expires`.
+
+    ## Returns
+    `Tuple` - The (connect, read) timeouts. Raises `DeadlineExceeded` when no time is left.
+    '''
+    def timeout(self, timeout, expires):
+        if expires is None:
+            return timeout
+
+        remaining = expires - clock()
+        if remaining <= 0:
+            self.count('deadline_exceeded')
+            raise DeadlineExceeded('The carrier did not answer within %s seconds' % self.deadline)
+        return (min(timeout[0], remaining), min(timeout[1], remaining))
+
+    '''
+    Decides whether a failed attempt is retried.
+
+    ## Parameters
+    `request` - The `ponyexpress.request.HTTPRequest` which failed.
+    `attempt` - Number of the attempt which failed, 0 for the first one.
+    `expires` - When the call has to be finished by, from `expires`.
+
+    ## Returns
+    `Float` - Seconds to wait before retrying, or None to give up.
+    '''
+    def retry_delay(self, request, attempt, expires):
+        if not request.idempotent or attempt >= self.retries:
+            self.count('failures')
+            return None
+
+        # Full jitter, so clients which failed together don't retry together. Never sleeps past the deadline,
+        # the next attempt reports it instead.
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if expires is not None:
+            delay = max(0, min(delay, expires - clock()))
+
+        self.count('retries')
+        return delay
+
+    # Whether a response's status is worth retrying
+    def retry_status(self, status_code):
+        return status_code in self.retry_statuses
+
+    # Seconds to wait for an answer before hedging a request, or None to not hedge it
+    def hedge_delay(self, request):
+        if not request.idempotent:
+            return None
+        if self.hedge_percentile is None:
+            return self.hedge_after
+
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return self.hedge_after
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100.0))
+        return latencies[index]
+
+    # Remembers how long an answered attempt took
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
@@ -1,3 +1,7 @@
+from collections import OrderedDict
+
+from ponyexpress.config import RATE_OPTION_MAX_EXTRAS
+
 # Static variables for Rates
 DOMESTIC = 'domestic'
 INTERNATIONAL = 'international'
@@ -17,12 +21,22 @@ class Package(object):
     `width` - The secondary dimension of the `Package` in US Inches.
     `height` - The tertiary dimension of the `Package` in US Inches.
     `rectangular` - Is the `Package` shape rectuangular? Use your best judgement for this one :).
+    `zone_index` - Zone chart of this `Package`, any object with a `zone(origin, destination)` method such as
+        a `ponyexpress.zones.ZoneMatrix`. None to use `Package.default_zone_index`.
+    `zone` - The zone between `origin` and `destination`, looked up in the `zone_index`.
     '''
+    __slots__ = (
+        'rectangular', '_weight', 'length', 'width', 'height', 'origin', 'destination', 'tracking_id', 'zone_index',
+        '_xml'
+    )
+
+    # Zone chart used by every `Package` without a `zone_index` of its own
+    default_zone_index = None
 
     # Init method for creating a new Package instance.
     # Weight should be provided in US Ozs and will be converted automatically.
     def __init__(self, weight, length, width, height, rectangular,
-                 origin, destination, tracking_id=''):
+                 origin, destination, tracking_id='', zone_index=None):
         # Physical attributes of the `Package`
         self.rectangular = rectangular
         self.weight = weight
@@ -32,6 +46,9 @@ class Package(object):
         self.origin = origin
         self.destination = destination
         self.tracking_id = tracking_id
+        self.zone_index = zone_index
+        # The XML of the latest request for this `Package`, kept for debugging
+        self._xml = None
 
     # Simply returns the weight in Lbs to the user
     @property
@@ -55,6 +72,15 @@ class Package(object):
             return 'LARGE'
         return 'REGULAR'
 
+    # Returns the zone the `Package` travels, without calling the carrier. None if it is unknown, or no
+    # zone chart was set.
+    @property
+    def zone(self):
+        zone_index = self.default_zone_index if self.zone_index is None else self.zone_index
+        if zone_index is None:
+            return None
+        return zone_index.zone(self.origin, self.destination)
+
     # Returns the 'Shape' of the `Package`, which could be RECTANGULAR or NONRECTANGULAR.
     @property
     def shape(self):
@@ -72,11 +98,16 @@ class RateCalculationResponse(object):
 
     ## Attributes
     `rates` - List of `RateCalculation` objects for each requested shipping method.
+    `errors` - Maps the id of each package the carrier could not rate to its error message.
     '''
 
     # Init for new RateCalculationResponse instance.
     def __init__(self, *rates):
         self.rates = []
+        self.errors = OrderedDict()
+        # Rates and cheapest rate of each package, kept up to date as rates are added
+        self._package_rates = OrderedDict()
+        self._cheapest = {}
         self.add(*rates)
 
     # Adds `RateCalculations` to the response
@@ -85,11 +116,27 @@ class RateCalculationResponse(object):
         if rates:
             self.rates.extend(rates)
 
+        # Index each rate under its package
+        for rate in rates:
+            self._package_rates.setdefault(rate.package_id, []).append(rate)
+            cheapest = self._cheapest.get(rate.package_id)
+            if cheapest is None or rate.price < cheapest.price:
+                self._cheapest[rate.package_id] = rate
+
+    # The ids of every package with at least one rate, in the order they were added
+    @property
+    def package_ids(self):
+        return list(self._package_rates.keys())
+
+    # Returns all of the `RateCalculations` for a single package
+    def rates_for(self, package_id='0'):
+        return list(self._package_rates.get(package_id, []))
+
     # Returns the `RateCalculation` associated with the lowest price
     # Since multiple rate requests can be made for several packages, we
     # default to using the first package.
     def cheapest(self, package_id='0'):
-        return sorted(self.rates, key=lambda x: x.price)[0]
+        return self._cheapest.get(package_id)
 
 
 class RateOption(object):
@@ -99,16 +146,26 @@ class RateOption(object):
     ## Attributes
     `name` - The title of the service being provided.
     `price` - How much does this service cost?
+    `extras` - Any other values the carrier provided, which are also readable as attributes.
     '''
+    __slots__ = ('name', 'price', 'extras')
 
     # Init method for a new `RateOption`.
     def __init__(self, name, price, **kwargs):
         self.name = name
         self.price = float(price)
 
-        # Unpack potentially unknow values
-        for key, val in kwargs.items():
-            setattr(self, key, val)
+        # Potentially unknown values, bounded so an option stays small
+        if len(kwargs) > RATE_OPTION_MAX_EXTRAS:
+            raise ValueError('A RateOption holds at most %d extra values (received %d)' % (RATE_OPTION_MAX_EXTRAS, len(kwargs)))
+        self.extras = kwargs
+
+    # Reads extra values as attributes
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, 'extras')[name]
+        except (AttributeError, KeyError):
+            raise AttributeError(name)
 
 
 class RateCalculation(object):
@@ -120,12 +177,15 @@ class RateCalculation(object):
     `item` - The `Package` associated with the calculated rate.
     `price` - The cost, in USD, for the specified shipping method when used with `item`.
     `method` - The specified shipping method for the `Package`.
+    `package_id` - The id the `Package` was sent under in the rate request.
     '''
+    __slots__ = ('package', 'price', 'method', 'type', 'package_id', 'options')
 
     # Init method for creating a new `RateCalculation instance.
-    def __init__(self, package, price, method, destination_type=DOMESTIC):
+    def __init__(self, package, price, method, destination_type=DOMESTIC, package_id='0'):
         self.package = package
         self.price = float(price)
         self.method = method
         self.type = destination_type
+        self.package_id = package_id
         self.options = []
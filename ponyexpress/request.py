@@ -0,0 +1,135 @@
+'''
+Request building for XML based carrier APIs. Templates are compiled once, when the courier class is
+defined, and every value is XML escaped as it is rendered in.
+'''
+from builtins import str
+from string import Formatter
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+
+class Markup(str):
+    '''
+    XML which was already rendered, and is inserted into other templates without being escaped again.
+    '''
+    pass
+
+
+# Escapes a value for use in XML text and attributes. Chained replaces run in C, which beats a per character map.
+def escape(value):
+    if isinstance(value, Markup):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+class XMLTemplate(object):
+    '''
+    An XML snippet with `{name}` placeholders, parsed once into its literal text and fields.
+
+    ## Parameters
+    `template` - The XML, with a `{name}` placeholder for each value.
+    '''
+    def __init__(self, template):
+        self.template = template
+        self._parts = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(template)
+        ]
+
+    '''
+    Fills in the template. Values are escaped, unless they are `Markup` rendered by another template.
+
+    ## Parameters
+    `values` - Value of every field of the template, by name.
+
+    ## Returns
+    `Markup` - The rendered XML.
+    '''
+    def render(self, **values):
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(escape(values[field]))
+        return Markup(''.join(pieces))
+
+    '''
+    Renders the template once per item and joins the results.
+
+    ## Parameters
+    `items` - Iterable of dictionaries, each holding the values of one rendering.
+
+    ## Returns
+    `Markup` - The rendered XML of every item.
+    '''
+    def render_many(self, items):
+        return Markup(''.join([self.render(**values) for values in items]))
+
+
+class HTTPRequest(object):
+    '''
+    A rendered request, ready to be sent.
+
+    ## Attributes
+    `method` - The HTTP method, GET or POST.
+    `url` - The full URL, including the query string of GET requests.
+    `body` - The form encoded body of POST requests, otherwise None.
+    `idempotent` - Whether sending the request twice is harmless, so it may be retried or hedged.
+        Defaults to True for GET and HEAD requests.
+    '''
+    def __init__(self, method, url, body=None, idempotent=None):
+        self.method = method
+        self.url = url
+        self.body = body
+        self.idempotent = method in ('GET', 'HEAD') if idempotent is None else idempotent
+
+    # Headers describing the body
+    @property
+    def headers(self):
+        if self.body is None:
+            return {}
+        return {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    # Identifies identical requests
+    @property
+    def key(self):
+        return (self.method, self.url, self.body)
+
+
+class XMLEndpoint(object):
+    '''
+    An API which takes its XML request as a form field, such as the USPS Web Tools. The XML is sent in the
+    query string of a GET, or as a POST body once the URL would grow past the courier's `post_threshold`.
+    Either way the request only reads data, so it is idempotent.
+
+    ## Parameters
+    `path` - Path of the API on the carrier's `base_url`.
+    `api` - Name of the API, sent in the `API` field.
+    `template` - The request XML, see `XMLTemplate`.
+    '''
+    def __init__(self, path, api, template):
+        self.path = path
+        self.api = api
+        self.template = XMLTemplate(template)
+
+    '''
+    Renders a request to the endpoint.
+
+    ## Parameters
+    `base_url` - Root URL of the carrier.
+    `params` - Values of the template's fields.
+    `post_threshold` - URL length past which the request is sent as a POST body.
+
+    ## Returns
+    `HTTPRequest` - The rendered request.
+    '''
+    def prepare(self, base_url, params, post_threshold):
+        url = base_url + self.path
+        query = urlencode((('API', self.api), ('XML', self.template.render(**params))))
+        if len(url) + len(query) + 1 > post_threshold:
+            return HTTPRequest('POST', url, query, idempotent=True)
+        return HTTPRequest('GET', url + '?' + query)
@@ -0,0 +1,234 @@
+'''
+Columnar view of rate results, for analysing thousands of quotes at once with NumPy instead of
+looping over `RateCalculation` objects.
+'''
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ponyexpress.rates import RateCalculation, RateCalculationResponse
+
+# Aggregations available to `RateTable.aggregate`
+_AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+
+class RateTable(object):
+    '''
+    Rates from one or many `RateCalculationResponse`s, stored as one NumPy array per column.
+    Every query is vectorized and returns a new `RateTable`, or plain values, never `RateCalculation`s
+    unless they are asked for with `to_rates`.
+
+    Package ids only identify a package within its own response, so packages are grouped on the
+    `response` and `package_id` columns together.
+
+    ## Attributes
+    `response` - Position of the response each rate came from, in the order they were given.
+    `package_id` - The id the package was sent under in its rate request.
+    `method` - The shipping method of the rate.
+    `price` - The cost, in USD, as floats.
+    `destination_type` - DOMESTIC or INTERNATIONAL.
+    `package` - The `Package` each rate was quoted for.
+    '''
+
+    # Columns in the order they are stored
+    columns = ('response', 'package_id', 'method', 'price', 'destination_type', 'package')
+
+    # Init for a new RateTable from any number of `RateCalculationResponse`s
+    def __init__(self, *responses):
+        if np is None:
+            raise ImportError('RateTable requires numpy, install it with `pip install ponyexpress[table]`')
+
+        rates = [(index, rate) for index, response in enumerate(responses) for rate in response.rates]
+        self._set_columns(
+            response=np.array([index for index, _ in rates], dtype=np.int32),
+            package_id=np.array([rate.package_id for _, rate in rates], dtype=str),
+            method=np.array([rate.method for _, rate in rates], dtype=str),
+            price=np.array([rate.price for _, rate in rates], dtype=np.float64),
+            destination_type=np.array([rate.type for _, rate in rates], dtype=str),
+            package=self._object_array([rate.package for _, rate in rates])
+        )
+
+    # Builds a table directly from its column arrays
+    @classmethod
+    def _from_columns(cls, **columns):
+        table = cls.__new__(cls)
+        table._set_columns(**columns)
+        return table
+
+    def _set_columns(self, **columns):
+        for name in self.columns:
+            setattr(self, name, columns[name])
+
+    # numpy would unpack sequences into extra dimensions, so objects are placed one by one
+    @staticmethod
+    def _object_array(values):
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    def __len__(self):
+        return len(self.price)
+
+    '''
+    Selects rows of the table.
+
+    ## Parameters
+    `rows` - A boolean mask, or array of row positions, over the table.
+
+    ## Returns
+    `RateTable` - A new table holding only the selected rows.
+    '''
+    def take(self, rows):
+        return self._from_columns(**dict((name, getattr(self, name)[rows]) for name in self.columns))
+
+    '''
+    Filters the rates on any combination of conditions.
+
+    ## Parameters
+    `max_price` - Only keep rates costing at most this much.
+    `min_price` - Only keep rates costing at least this much.
+    `method` - Only keep these shipping methods, a single method or a list of them.
+    `destination_type` - Only keep rates of this destination type.
+    `package_id` - Only keep rates of packages with this id, or list of ids.
+
+    ## Returns
+    `RateTable` - A new table holding only the matching rates.
+    '''
+    def where(self, max_price=None, min_price=None, method=None, destination_type=None, package_id=None):
+        mask = np.ones(len(self), dtype=bool)
+        if max_price is not None:
+            mask &= self.price <= max_price
+        if min_price is not None:
+            mask &= self.price >= min_price
+        if method is not None:
+            mask &= np.isin(self.method, self._values(method))
+        if destination_type is not None:
+            mask &= self.destination_type == destination_type
+        if package_id is not None:
+            mask &= np.isin(self.package_id, self._values(package_id))
+        return self.take(mask)
+
+    @staticmethod
+    def _values(value):
+        return [value] if isinstance(value, str) else list(value)
+
+    '''
+    Splits the rows into groups.
+
+    ## Parameters
+    `by` - Name of the column, or tuple of names, to group on. 'package' groups on `response` and `package_id`.
+
+    ## Returns
+    `Tuple` - The key of every group in order of first appearance, and the group number of every row.
+    '''
+    def groups(self, by='package'):
+        names = ('response', 'package_id') if by == 'package' else ((by, ) if isinstance(by, str) else tuple(by))
+
+        # Combine the codes of each column into a single code per row
+        codes = np.zeros(len(self), dtype=np.int64)
+        for name in names:
+            _, inverse = np.unique(getattr(self, name), return_inverse=True)
+            codes = codes * (inverse.max() + 1 if len(inverse) else 1) + inverse.ravel()
+
+        # Number the groups in order of first appearance, rather than sorted order
+        _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        renumber = np.empty_like(order)
+        renumber[order] = np.arange(len(order))
+
+        keys = [
+            tuple(getattr(self, name)[row].item() for name in names) if len(names) > 1 else getattr(self, names[0])[row].item()
+            for row in first[order]
+        ]
+        return keys, renumber[inverse.ravel()]
+
+    '''
+    Finds the cheapest rate of every package at once. Ties go to the rate added first, like `RateCalculationResponse.cheapest`.
+
+    ## Parameters
+    `by` - Columns to find the cheapest rate within, see `groups`.
+
+    ## Returns
+    `RateTable` - One row per group, in order of each group's first appearance.
+    '''
+    def cheapest(self, by='package'):
+        if not len(self):
+            return self.take(np.zeros(0, dtype=np.intp))
+
+        _, group = self.groups(by)
+        # Sort by group, then price, keeping the original order of ties
+        order = np.lexsort((np.arange(len(self)), self.price, group))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = group[order][1:] != group[order][:-1]
+        return self.take(order[first])
+
+    '''
+    Aggregates the prices of each group.
+
+    ## Parameters
+    `by` - Columns to group on, see `groups`.
+    `how` - One of count, sum, mean, min or max.
+
+    ## Returns
+    `OrderedDict` - The aggregated price of each group, keyed by the group's key.
+    '''
+    def aggregate(self, by='method', how='mean'):
+        if how not in _AGGREGATES:
+            raise ValueError('Unknown aggregation %r, expected one of: %s' % (how, ', '.join(_AGGREGATES)))
+
+        keys, group = self.groups(by)
+        counts = np.bincount(group, minlength=len(keys))
+        if how == 'count':
+            values = counts
+        elif how in ('sum', 'mean'):
+            values = np.bincount(group, weights=self.price, minlength=len(keys))
+            if how == 'mean':
+                values = values / counts
+        else:
+            values = np.full(len(keys), np.inf if how == 'min' else -np.inf)
+            (np.minimum if how == 'min' else np.maximum).at(values, group, self.price)
+
+        return OrderedDict(zip(keys, values.tolist()))
+
+    '''
+    Price percentiles of each group.
+
+    ## Parameters
+    `q` - Percentile, or list of percentiles, between 0 and 100.
+    `by` - Columns to group on, see `groups`.
+
+    ## Returns
+    `OrderedDict` - The percentile, or list of percentiles, of each group keyed by the group's key.
+    '''
+    def percentiles(self, q, by='method'):
+        keys, group = self.groups(by)
+        order = np.argsort(group, kind='stable')
+        bounds = np.searchsorted(group[order], np.arange(len(keys) + 1))
+        prices = self.price[order]
+
+        return OrderedDict(
+            (key, np.percentile(prices[bounds[index]:bounds[index + 1]], q).tolist())
+            for index, key in enumerate(keys)
+        )
+
+    '''
+    Converts rows back into objects. Options of detailed rates are not kept in the table.
+
+    ## Returns
+    `List` - A new `RateCalculation` per row.
+    '''
+    def to_rates(self):
+        return [
+            RateCalculation(package, price, method, destination_type=destination_type, package_id=package_id)
+            for package, price, method, destination_type, package_id in zip(
+                self.package, self.price.tolist(), self.method.tolist(),
+                self.destination_type.tolist(), self.package_id.tolist()
+            )
+        ]
+
+    # Converts the table back into a single `RateCalculationResponse`
+    def to_response(self):
+        return RateCalculationResponse(*self.to_rates())
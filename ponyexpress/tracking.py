@@ -1,24 +1,125 @@
-from datetime import datetime as dt
+import re
+from collections import OrderedDict
+from datetime import date as date_type, datetime as dt, time as time_type
+
+try:
+    from sys import intern
+except ImportError:
+    pass
+
+from ponyexpress.config import DATETIME_MEMO_SIZE, EVENT_TYPE_MEMO_SIZE
 
 # Lookup lists for keywords which specify a type of event. Parsed from response text.
 ACCEPTANCE_METHODS = ['ACCEPTED', 'PICKED UP']
 DELIVERED_METHODS = ['DELIVERED', ]
+# Keywords for events after which a package/letter will not move again, besides being delivered
+TERMINAL_METHODS = ['DISPOSED', ]
+# Keywords for events where something went wrong, and the package/letter may need attention
+EXCEPTION_METHODS = [
+    'ALERT', 'DELIVERY ATTEMPTED', 'NOTICE LEFT', 'UNDELIVERABLE', 'RETURN TO SENDER', 'REFUSED',
+    'MISSENT', 'DAMAGED', 'INSUFFICIENT ADDRESS', 'NO SUCH NUMBER', 'DELAYED',
+]
+OUT_FOR_DELIVERY_METHODS = ['OUT FOR DELIVERY', ]
+
+# Keyword lists of every event category, by category name
+EVENT_CATEGORIES = OrderedDict([
+    ('accepted', ACCEPTANCE_METHODS),
+    ('delivered', DELIVERED_METHODS),
+    ('terminal', TERMINAL_METHODS),
+    ('exception', EXCEPTION_METHODS),
+    ('out_for_delivery', OUT_FOR_DELIVERY_METHODS),
+])
+
+
+class _EventMatcher(object):
+    '''
+    Classifies event types into categories with one regular expression over the keywords of every category.
+    Event types repeat a lot, so the categories of each are remembered.
+    '''
+    def __init__(self, categories):
+        self._categories = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                self._categories.setdefault(keyword, []).append(category)
+
+        # The lookahead finds every position a keyword starts at, even inside another match. It only captures
+        # the longest keyword there, so the others sharing its first character are tried at that position too.
+        keywords = sorted(self._categories, key=len, reverse=True)
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))')
+        self._by_first = {}
+        for keyword in keywords:
+            self._by_first.setdefault(keyword[0], []).append(keyword)
+        self._memo = {}
+
+    # Returns the categories of an event type, as a tuple
+    def categories(self, etype):
+        try:
+            return self._memo[etype]
+        except KeyError:
+            pass
+
+        found = []
+        for match in self._pattern.finditer(etype):
+            start = match.start()
+            for keyword in self._by_first[etype[start]]:
+                if not etype.startswith(keyword, start):
+                    continue
+                for category in self._categories[keyword]:
+                    if category not in found:
+                        found.append(category)
+
+        if len(self._memo) >= EVENT_TYPE_MEMO_SIZE:
+            self._memo.clear()
+        self._memo[etype] = found = tuple(found)
+        return found
+
+
+_matcher = _EventMatcher(EVENT_CATEGORIES)
+
+
+'''
+Adds keywords to an event category, or creates a new category. Only responses built afterwards use them.
+
+## Parameters
+`category` - Name of the category, such as 'exception'.
+`keywords` - Upper cased text which marks an event as part of the category.
+'''
+def register_event_keywords(category, *keywords):
+    global _matcher
+    EVENT_CATEGORIES.setdefault(category, []).extend(keywords)
+    _matcher = _EventMatcher(EVENT_CATEGORIES)
 
 
 class TrackingResponse(object):
     '''
     Response object containing all of the tracking events and helper methods for formating data.
+    Each event is classified once, as it is added, so status lookups don't rescan the events.
 
     ## Attributes
-    `events` - List of `TrackingEvent` objects in reverse chronological order.
+    `events` - List of `TrackingEvent` objects in reverse chronological order. Use `add` to add events.
     `status` - Current status of the package/letter, corresponds to the latest `TrackingEvent.type`.
+    `error` - The carrier's error message when the tracking id could not be looked up, otherwise None.
     '''
 
     # Init for new TrackingResponse
     def __init__(self, *events):
         self.events = []
+        self.error = None
+        # Events of each category, in the same order as `events`
+        self._index = {}
         self.add(*events)
 
+    # The index is rebuilt when unpickled, so it follows the keyword tables of the current process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index = {}
+        self._index_events(self.events)
+
     # The current status of the tracked package/letter
     @property
     def status(self):
@@ -27,33 +128,152 @@ class TrackingResponse(object):
             return self.events[0].type
         return 'UNKNOWN'
 
+    '''
+    Returns the events of a category.
+
+    ## Parameters
+    `category` - Name of the category, any key of `EVENT_CATEGORIES`.
+
+    ## Returns
+    `List` - The `TrackingEvent`s of the category, latest first.
+    '''
+    def events_in(self, category):
+        return list(self._index.get(category, ()))
+
+    # The datetime of the latest event in a category, or None
+    def _latest(self, category):
+        events = self._index.get(category)
+        return events[0].datetime if events else None
+
     # If the package/letter has been accepted by the carrier.
-    # Returns an datetime object if so
+    # Returns an datetime object of the earliest acceptance if so
     @property
     def accepted(self):
-        # Check all of the events for an ACCEPTANCE one
-        for event in reversed(self.events):
-            for method in ACCEPTANCE_METHODS:
-                if method in event.type:
-                    return event.datetime
-        return None
+        events = self._index.get('accepted')
+        return events[-1].datetime if events else None
 
     # If the package/letter has been delivered by the carrier.
     # Returns an datetime object if so
     @property
     def delivered(self):
-        # Check all of the events for an DELIVERED one
-        for event in self.events:
-            for method in DELIVERED_METHODS:
-                if method in event.type:
-                    return event.datetime
-        return None
+        return self._latest('delivered')
+
+    # If the package/letter is out for delivery. Returns the latest datetime it went out for delivery
+    @property
+    def out_for_delivery(self):
+        return self._latest('out_for_delivery')
+
+    # If something went wrong on the way, such as a failed delivery. Returns the latest datetime it happened
+    @property
+    def exception(self):
+        return self._latest('exception')
+
+    # If the package/letter has reached a final state, such as delivered, and will not be updated again
+    @property
+    def terminal(self):
+        if self._index.get('delivered'):
+            return True
+        events = self._index.get('terminal')
+        return bool(events) and events[0] is self.events[0]
 
     # Adds tracking events to the response
     def add(self, *events):
         # Extend the list of results with the new ones
         if len(events):
             self.events.extend(events)
+            self._index_events(events)
+
+    def _index_events(self, events):
+        categories = _matcher.categories
+        for event in events:
+            for category in categories(event.type):
+                self._index.setdefault(category, []).append(event)
+
+
+# Month numbers by lower cased full name, for `%B`
+_MONTHS = dict(
+    (dt(1970, month, 1).strftime('%B').lower(), month) for month in range(1, 13)
+)
+
+
+# `%m-%d-%Y`, 06-29-2015
+def _parse_numeric_date(value):
+    month, day, year = value.split('-')
+    return date_type(int(year), int(month), int(day))
+
+
+# `%B %d, %Y`, January 8, 2016
+def _parse_named_date(value):
+    month, day, year = value.replace(',', ' ').split()
+    return date_type(int(year), _MONTHS[month.lower()], int(day))
+
+
+# `%H:%M:%S`, 17:35:59
+def _parse_24_hour_time(value):
+    hour, minute, second = value.split(':')
+    return time_type(int(hour), int(minute), int(second))
+
+
+# `%I:%M %p`, 2:48 pm
+def _parse_12_hour_time(value):
+    clock, meridiem = value.split()
+    hour, minute = clock.split(':')
+    hour = int(hour)
+    if not 1 <= hour <= 12:
+        raise ValueError(value)
+    meridiem = meridiem.lower()
+    if meridiem not in ('am', 'pm'):
+        raise ValueError(value)
+    return time_type(hour % 12 + (12 if meridiem == 'pm' else 0), int(minute))
+
+
+# Hand written parsers for the formats the couriers use, which skip the overhead of strptime
+_DATE_PARSERS = {
+    '%m-%d-%Y': _parse_numeric_date,
+    '%B %d, %Y': _parse_named_date,
+}
+_TIME_PARSERS = {
+    '%H:%M:%S': _parse_24_hour_time,
+    '%I:%M %p': _parse_12_hour_time,
+}
+
+# Already parsed dates and times by (string, format). Responses repeat the same handful of values.
+_date_memo = {}
+_time_memo = {}
+
+
+# Parses a date or time with a fast parser when there is one, falling back to strptime for
+# any other format or anything the fast parser rejects, so errors read the same as strptime's
+def _memoized_parse(memo, parsers, value, fmt, convert):
+    key = (value, fmt)
+    try:
+        return memo[key]
+    except KeyError:
+        pass
+
+    parsed = None
+    parser = parsers.get(fmt)
+    if parser is not None:
+        try:
+            parsed = parser(value)
+        except (ValueError, KeyError):
+            pass
+    if parsed is None:
+        parsed = convert(dt.strptime(value, fmt))
+
+    # Bounded by starting over, which is cheaper than tracking recency on every hit
+    if len(memo) >= DATETIME_MEMO_SIZE:
+        memo.clear()
+    memo[key] = parsed
+    return parsed
+
+
+def parse_date(value, fmt='%m-%d-%Y'):
+    return _memoized_parse(_date_memo, _DATE_PARSERS, value, fmt, dt.date)
+
+
+def parse_time(value, fmt='%H:%M:%S'):
+    return _memoized_parse(_time_memo, _TIME_PARSERS, value, fmt, dt.time)
 
 
 class TrackingEvent(object):
@@ -67,23 +287,23 @@ class TrackingEvent(object):
     `state` - The state/province/region which this event happend in.
     `city` - The city within the above state whic this event happend in.
     `postal_code` - The zip/postal code associated with the particular area within the above city.
+    `datetime` - The combined `date` and `time`.
     '''
+    __slots__ = ('type', 'date', 'time', 'datetime', 'state', 'city', 'postal_code')
 
     # Init method for creating a new instance of the TrackingEvent.
     def __init__(self, state, city, postal_code, etype='UNDEFINED',
                  date='01-01-1970', time='00:00:00',
                  date_format='%m-%d-%Y', time_format='%H:%M:%S'):
-        self.type = etype.upper()
-        self.date = dt.strptime(date, date_format).date()
-        self.time = dt.strptime(time, time_format).time()
-        self.state = state.title()
-        self.city = city.title()
+        # Events repeat the same few types and places, so their strings are shared
+        self.type = intern(etype.upper())
+        self.date = parse_date(date, date_format)
+        self.time = parse_time(time, time_format)
+        self.datetime = dt.combine(self.date, self.time)
+        self.state = intern(state.title())
+        self.city = intern(city.title())
         self.postal_code = postal_code
 
-    @property
-    def datetime(self):
-        return dt.combine(self.date, self.time)
-
     # Returns a nice string representation of the date and time
     def isoDatetime(self, date_format='%B %d, %Y', time_format='%I:%M %p'):
         return self.datetime.strftime(' '.join([date_format, time_format]))
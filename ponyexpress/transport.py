@@ -0,0 +1,210 @@
+'''
+Transports carrying a courier's `HTTPRequest`s to the carrier. A transport owns the connection pool, the
+compression negotiated with the server and the enforcement of timeouts, so couriers only deal in requests
+and responses.
+
+Every transport has a `send(request, timeout, stream)` method returning a response with `status_code`,
+`content`, `iter_content(chunk_size)` and `close()`. The asynchronous transports, whose `send` returns an
+awaitable of a response with `aiter_bytes(chunk_size)` and `aclose()` instead, are in `ponyexpress.aio`.
+'''
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from ponyexpress.config import DEFAULT_POOL_SIZE
+
+
+# Headers asking for the response body as it is, for servers which compress poorly
+IDENTITY_ENCODING = {'Accept-Encoding': 'identity'}
+
+
+# Converts a (connect, read) timeout pair to the httpx equivalent
+def _httpx_timeout(timeout):
+    return httpx.Timeout(timeout[1], connect=timeout[0])
+
+
+def _require_httpx(http2):
+    if httpx is None:
+        raise ImportError(
+            'Asynchronous couriers and httpx transports require httpx, install it with `pip install ponyexpress[async]`'
+        )
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            raise ImportError('HTTP/2 requires h2, install it with `pip install ponyexpress[http2]`')
+
+
+class RequestsTransport(object):
+    '''
+    HTTP/1.1 transport over a pooled `requests.Session`, the default of the blocking couriers.
+    Each connection carries one request at a time, so the pool holds a connection per concurrent call.
+
+    ## Parameters
+    `pool_size` - Maximum number of connections kept open to each host.
+    `keep_alive` - Whether connections are kept open between requests.
+    `compression` - Ask for compressed responses, which the session decompresses as they are read.
+    '''
+    # Errors of a single attempt which are worth retrying
+    retryable_errors = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, compression=True):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        if not compression:
+            self.session.headers.update(IDENTITY_ENCODING)
+
+    '''
+    Sends a request.
+
+    ## Parameters
+    `request` - The `HTTPRequest` to send.
+    `timeout` - Seconds to wait, as a (connect, read) pair.
+    `stream` - Leave the body to be read from the response, instead of downloading it.
+
+    ## Returns
+    `Response` - The `requests.Response`.
+    '''
+    def send(self, request, timeout, stream=False):
+        return self.session.request(
+            request.method, request.url, data=request.body, headers=request.headers, timeout=timeout, stream=stream
+        )
+
+    # Opens a connection to the URL ahead of time. Best effort, failures are left for the real requests to report.
+    def warm(self, url, timeout):
+        try:
+            self.session.head(url, timeout=timeout)
+        except requests.RequestException:
+            pass
+
+    # Releases every pooled connection
+    def close(self):
+        self.session.close()
+
+
+class HTTPXResponse(object):
+    '''
+    An `httpx.Response` exposing the `requests.Response` methods couriers use.
+    '''
+    __slots__ = ('response', )
+
+    def __init__(self, response):
+        self.response = response
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def content(self):
+        return self.response.content
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    def iter_content(self, chunk_size):
+        return self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()
+
+
+class HTTPXTransport(object):
+    '''
+    Transport over a pooled `httpx.Client`. With `http2`, concurrent calls are multiplexed as streams of a few
+    HTTP/2 connections, instead of needing a connection each. Servers without HTTP/2 are spoken to in HTTP/1.1.
+
+    ## Parameters
+    `pool_size` - Maximum number of connections kept open.
+    `keep_alive` - Whether connections are kept open between requests.
+    `compression` - Ask for compressed responses, which the client decompresses as they are read.
+    `http2` - Negotiate HTTP/2 with the server, requires the h2 package.
+    '''
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, compression=True, http2=True):
+        _require_httpx(http2)
+        self.session = httpx.Client(
+            http2=http2, headers=None if compression else IDENTITY_ENCODING, limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size if keep_alive else 0
+            )
+        )
+
+    # Errors of a single attempt which are worth retrying
+    @property
+    def retryable_errors(self):
+        return (httpx.TransportError, )
+
+    # Sends a request, see `RequestsTransport.send`, returning an `HTTPXResponse`
+    def send(self, request, timeout, stream=False):
+        built = self.session.build_request(
+            request.method, request.url, content=request.body, headers=request.headers, timeout=_httpx_timeout(timeout)
+        )
+        return HTTPXResponse(self.session.send(built, stream=stream))
+
+    # Opens a connection to the URL ahead of time. Best effort, failures are left for the real requests to report.
+    def warm(self, url, timeout):
+        try:
+            self.session.head(url, timeout=_httpx_timeout(timeout))
+        except httpx.HTTPError:
+            pass
+
+    # Releases every pooled connection
+    def close(self):
+        self.session.close()
+
+
+class MemoryResponse(object):
+    '''
+    A response produced in memory.
+    '''
+    __slots__ = ('status_code', 'content', 'headers')
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class MemoryTransport(object):
+    '''
+    Transport answering requests from a function instead of the network, for load tests and offline runs of a
+    courier. Nothing is pooled, compressed or timed out.
+
+    ## Parameters
+    `handler` - Called with each `HTTPRequest`, returns the response body, or a (status, body) pair. Exceptions
+        it raises are raised by `send`, `OSError`s being retried like connection errors, socket errors included.
+    '''
+    # Errors of a single attempt which are worth retrying, connection errors of every library are OSErrors.
+    # EnvironmentError is OSError on Python 3, and also covers the socket errors of Python 2.
+    retryable_errors = (EnvironmentError, )
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    # Answers a request, see `RequestsTransport.send`, returning a `MemoryResponse`
+    def send(self, request, timeout=None, stream=False):
+        answer = self.handler(request)
+        if isinstance(answer, tuple):
+            return MemoryResponse(*answer)
+        return MemoryResponse(200, answer)
+
+    def warm(self, url, timeout):
+        pass
+
+    def close(self):
+        pass
@@ -1,9 +1,15 @@
 import re
+from collections import OrderedDict
 from html.parser import HTMLParser
 from builtins import str
 
+try:
+    from html import unescape
+except ImportError:
+    unescape = HTMLParser().unescape
+
 from ponyexpress.address import AddressValidationResponse, Address
-from ponyexpress.config import XML_RESPONSE
+from ponyexpress.config import DEFAULT_RATE_CACHE_TTL, XML_RESPONSE
 from ponyexpress.courier import BaseCourier
 from ponyexpress.rates import (
     DOMESTIC,
@@ -13,7 +19,9 @@ from ponyexpress.rates import (
     RateCalculationResponse,
     RateOption
 )
+from ponyexpress.request import Markup, XMLEndpoint, XMLTemplate
 from ponyexpress.tracking import TrackingResponse, TrackingEvent
+from ponyexpress.utils import chunked, pipelined, unique
 
 
 # USPSTracking is a class which is able to interface with the USPS Package Tracking API
@@ -27,37 +35,94 @@ class USPSCourier(BaseCourier):
         r'(FIRST CLASS)',
     )
 
-    # Initialization of a new port office
-    def __init__(self, username, password=''):
+    # Maximum number of tracking ids the TrackV2 API accepts in one request
+    MAX_TRACK_IDS = 35
+
+    # XML for a single tracking id within a TrackFieldRequest
+    _track_id_xml = XMLTemplate('<TrackID ID="{id}"></TrackID>')
+
+    # Maximum number of addresses the Verify API accepts in one request
+    MAX_ADDRESSES = 5
+
+    # XML for a single address within an AddressValidateRequest
+    _address_xml = XMLTemplate(
+        '<Address ID="{id}">' +
+            '<FirmName>{name}</FirmName>' +
+            '<Address1>{address_1}</Address1>' +
+            '<Address2>{address_2}</Address2>' +
+            '<City>{city}</City>' +
+            '<State>{state}</State>' +
+            '<Zip5>{zip5}</Zip5>' +
+            '<Zip4>{zip4}</Zip4>' +
+        '</Address>'
+    )
+
+    # Maximum number of packages the RateV4 and IntlRateV2 APIs accept in one request
+    MAX_PACKAGES = 25
+
+    # XML for a single package within a rate request
+    _package_xml = XMLTemplate(
+        '<Package ID="{id}">' +
+            '<Service>{method}</Service>' +
+            '<ZipOrigination>{origin_zip}</ZipOrigination>' +
+            '<ZipDestination>{destination_zip}</ZipDestination>' +
+            '<Pounds>{weight_lb}</Pounds>' +
+            '<Ounces>{weight_oz}</Ounces>' +
+            '<Container>{shape}</Container>' +
+            '<Size>{size}</Size>' +
+            '<Width>{width}</Width>' +
+            '<Length>{length}</Length>' +
+            '<Height>{height}</Height>' +
+            '<Machinable>true</Machinable>' +
+        '</Package>'
+    )
+
+    # Production URL
+    base_url = 'http://production.shippingapis.com'
+    carrier = 'USPS'
+
+    # Production endpoints, compiled once for every USPSCourier
+    tracking_endpoint = XMLEndpoint(
+        '/ShippingAPI.dll', 'TrackV2',
+        '<TrackFieldRequest USERID="{username}">' +
+            '{track_ids}' +
+        '</TrackFieldRequest>'
+    )
+    address_validation_endpoint = XMLEndpoint(
+        '/ShippingAPI.dll', 'Verify',
+        '<AddressValidateRequest USERID="{username}">' +
+            '<IncludeOptionalElements>true</IncludeOptionalElements>' +
+            '<ReturnCarrierRoute>true</ReturnCarrierRoute>' +
+            '{addresses}' +
+        '</AddressValidateRequest>'
+    )
+    _base_rate_xml = '<{api}Request USERID="{{username}}">' + \
+            '<Revision>2</Revision>' + \
+            '{{package}}' + \
+        '</{api}Request>'
+    domestic_rate_endpoint = XMLEndpoint('/ShippingAPI.dll', 'RateV4', _base_rate_xml.format(api='RateV4'))
+    international_rate_endpoint = XMLEndpoint('/ShippingAPI.dll', 'IntlRateV2', _base_rate_xml.format(api='IntlRateV2'))
+
+    # Initialization of a new port office. Connection pool options are passed through to `BaseCourier`.
+    # Rate quotes are looked up in `rate_cache`, any `ponyexpress.cache` backend, before calling the API. Quotes
+    # are kept for the backend's TTL, or `DEFAULT_RATE_CACHE_TTL` when it has none.
+    # Addresses are looked up in `address_cache`, a `ponyexpress.cache.AddressCache`, before being validated.
+    # Tracking results are looked up in `tracking_cache`, a `ponyexpress.cache.TrackingCache`, before calling the API.
+    # Rate quotes the `local_rates` tables, a `ponyexpress.local.LocalRateEngine`, cover are never sent to the API.
+    def __init__(self, username, password='', rate_cache=None, address_cache=None, tracking_cache=None,
+                 local_rates=None, **kwargs):
         # Call super
-        super(USPSCourier, self).__init__(username, password)
-
-        # Production URL
-        self.tracking_endpoint = 'http://production.shippingapis.com/ShippingAPI.dll?API=TrackV2&XML=' + \
-            '<TrackFieldRequest USERID="{username}">' + \
-                '<TrackID ID="{tracking_id}"></TrackID>' + \
-            '</TrackFieldRequest>'
-        self.address_validation_endpoint = 'http://production.shippingapis.com/ShippingAPI.dll?API=Verify&XML=' + \
-            '<AddressValidateRequest USERID="{username}">' + \
-                '<IncludeOptionalElements>true</IncludeOptionalElements>' + \
-                '<ReturnCarrierRoute>true</ReturnCarrierRoute>' + \
-                '<Address ID="0">' + \
-                    '<FirmName>{name}</FirmName>' + \
-                    '<Address1>{address_1}</Address1>' + \
-                    '<Address2>{address_2}</Address2>' + \
-                    '<City>{city}</City>' + \
-                    '<State>{state}</State>' + \
-                    '<Zip5>{zip5}</Zip5>' + \
-                    '<Zip4>{zip4}</Zip4>' + \
-                '</Address>' + \
-            '</AddressValidateRequest>'
-        self._base_rate_endpoint = 'http://production.shippingapis.com/ShippingAPI.dll?API={api}&XML=' + \
-            '<{api}Request USERID="{{username}}">' + \
-                '<Revision>2</Revision>' + \
-                '{{package}}' + \
-            '</{api}Request>'
-        self.domestic_rate_endpoint = self._base_rate_endpoint.format(api='RateV4')
-        self.international_rate_endpoint = self._base_rate_endpoint.format(api='IntlRateV2')
+        super(USPSCourier, self).__init__(username, password, **kwargs)
+
+        # Optional cache of rate quotes, keyed on the rate type and package request
+        self.rate_cache = rate_cache
+        # Optional cache of address validation results, keyed on the normalized address
+        self.address_cache = address_cache
+        # Optional cache of tracking results, keyed on the tracking id
+        self.tracking_cache = tracking_cache
+        # Optional offline zone and price tables
+        self.local_rates = local_rates
+
         # Set the response type to XML
         self.response_type = XML_RESPONSE
 
@@ -67,7 +132,7 @@ class USPSCourier(BaseCourier):
     ## Parameters
     `error` - The unparsed error message from the server.
     '''
-    def process_exception(self, error):
+    def process_exception(self, error=None):
         super(USPSCourier, self).process_exception(error)
 
     '''
@@ -87,9 +152,100 @@ class USPSCourier(BaseCourier):
     `Validity` - Whether the provided address was valid.
     '''
     def validateAddress(self, state, city, postal_code, street_2, street_1='', name=''):
+        fields = self._address_fields(state, city, postal_code, street_2, street_1, name)
+
+        # Addresses validated before are answered from the cache
+        response = self._cached_address(fields)
+        if response is not None:
+            return response
+
+        # Make a request for address information
+        response = self.get_server_response(
+            self.address_validation_endpoint, self._address_params([fields]), method='Address Validation',
+            build=self._address_response
+        )
+        self._cache_address(fields, response)
+        return response
+
+    '''
+    USPS Address Validation V4 API for many addresses at once. Addresses are sent `MAX_ADDRESSES` at a time
+    and the results are matched back to their input by the request's `Address ID`.
+
+    ## Parameters
+    `addresses` - Iterable of addresses. Each item is either a tuple of the positional `validateAddress`
+        arguments or a dictionary of its keyword arguments.
+
+    ## Returns
+    `List` - One `AddressValidationResponse` per input, in input order. Addresses the carrier rejected get an
+        empty response with `error` set, without affecting the rest of their request.
+    '''
+    def validate_addresses(self, addresses):
+        responses = []
+        for chunk in self._address_chunks(addresses, responses):
+            # Make a request for address information
+            params = self._address_params([fields for _, fields in chunk])
+            self.get_server_elements(
+                self.address_validation_endpoint, params, 'Address', method='Address Validation',
+                build=lambda results: self._address_chunk_response(chunk, results, responses),
+                each=self._address_result, items=len(chunk)
+            )
+
+        return responses
+
+    '''
+    Streaming version of `validate_addresses`, for inputs too large to hold. Addresses are read lazily and
+    validated in batches, several at once, so memory is bounded by `batch_size` and `concurrency` instead of
+    the input's size.
+
+    ## Parameters
+    `addresses` - Iterable of addresses, as taken by `validate_addresses`.
+    `batch_size` - Addresses per batch, defaults to `MAX_ADDRESSES`. Larger batches are sent in several requests.
+    `concurrency` - Batches in flight at once, defaults to the courier's `pool_size`.
+
+    ## Returns
+    `Generator` - Yields an (address, `AddressValidationResponse`) pair per input, in input order, as each
+        batch completes.
+    '''
+    def iter_validate(self, addresses, batch_size=None, concurrency=None):
+        batches = pipelined(
+            lambda batch: zip(batch, self.validate_addresses(batch)),
+            chunked(addresses, batch_size or self.MAX_ADDRESSES),
+            concurrency or self.pool_size
+        )
+        for pairs in batches:
+            for pair in pairs:
+                yield pair
+
+    # Splits the addresses missing from the address cache into API sized chunks of (position, fields) pairs.
+    # `responses` gets a slot for every address, cached addresses fill theirs straight away.
+    def _address_chunks(self, addresses, responses):
+        chunk = []
+        for address in addresses:
+            fields = self._address_fields(**address) if isinstance(address, dict) else self._address_fields(*address)
+            responses.append(self._cached_address(fields))
+            if responses[-1] is not None:
+                continue
+
+            chunk.append((len(responses) - 1, fields))
+            if len(chunk) == self.MAX_ADDRESSES:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    # Composes the request parameters for a list of normalized addresses, the position in the list is the address id
+    def _address_params(self, addresses):
+        return {
+            'addresses': self._address_xml.render_many(
+                dict(fields, id=index) for index, fields in enumerate(addresses)
+            )
+        }
+
+    # Normalizes the `validateAddress` arguments into the XML formatting parameters of a single address
+    def _address_fields(self, state, city, postal_code, street_2, street_1='', name=''):
         postal_code = postal_code.split('-')
-        # Compose the URL formatting parameters
-        params = {
+        return {
             'state': state.upper(),
             'city': city.upper(),
             'zip5': postal_code[0],
@@ -99,9 +255,8 @@ class USPSCourier(BaseCourier):
             'name': name.upper()
         }
 
-        # Make a request for address information
-        raw_response = super(USPSCourier, self).get_server_response(self.address_validation_endpoint, params, method='Address Validation')
-
+    # Builds the `AddressValidationResponse` for a single address request
+    def _address_response(self, raw_response):
         # Extract the XML data for the parsed response
         raw_addresses = raw_response.findall('Address')
 
@@ -109,29 +264,71 @@ class USPSCourier(BaseCourier):
         error = raw_addresses[0].find('Error')
         if error is not None:
             # Return an empty response
-            return AddressValidationResponse()
+            response = AddressValidationResponse()
+            response.error = error.findtext('Description', 'Unknown address error')
+            return response
 
         # Create the AddressValidationResponse and Addresses
         response = AddressValidationResponse()
         for address in raw_addresses:
-            # Used to combine since None might be present
-            zip5 = address.find('Zip5').text
-            zip4 = address.find('Zip4').text
-
-            # Create the address object
-            response.add(
-                Address(
-                    address.find('State').text,
-                    address.find('City').text,
-                    '-'.join([zip5, zip4]) if zip4 else zip5,
-                    address.find('Address2').text,
-                    address.find('DeliveryPoint').text,
-                    address.find('CarrierRoute').text,
-                )
-            )
+            response.add(self._build_address(address))
 
         return response
 
+    # Builds the result of a single Address element of a batch request: the address id, and its error or `Address`
+    def _address_result(self, address):
+        index = int(address.get('ID', 0))
+        error = address.find('Error')
+        if error is not None:
+            return index, error.findtext('Description', 'Unknown address error'), None
+        return index, None, self._build_address(address)
+
+    # Builds one `AddressValidationResponse` per address of a batch request from the `_address_result`s, grouped by
+    # the returned address id, and places each in its input position of `responses`
+    def _address_chunk_response(self, chunk, address_results, responses):
+        results = [AddressValidationResponse() for _ in chunk]
+        for index, error, address in address_results:
+            if index >= len(results):
+                continue
+
+            response = results[index]
+            if error is not None:
+                response.error = error
+            else:
+                response.add(address)
+
+        for (position, fields), response in zip(chunk, results):
+            responses[position] = response
+            self._cache_address(fields, response)
+
+        return responses
+
+    # Returns the cached validation result of an address, or None if it isn't cached
+    def _cached_address(self, fields):
+        if self.address_cache is None:
+            return None
+        return self.address_cache.get(fields)
+
+    # Stores the validation result of an address
+    def _cache_address(self, fields, response):
+        if self.address_cache is not None and response is not None:
+            self.address_cache.set(fields, response)
+
+    # Builds an `Address` from a single validated Address element
+    def _build_address(self, address):
+        # Used to combine since None might be present
+        zip5 = address.find('Zip5').text
+        zip4 = address.find('Zip4').text
+
+        return Address(
+            address.find('State').text,
+            address.find('City').text,
+            '-'.join([zip5, zip4]) if zip4 else zip5,
+            address.find('Address2').text,
+            address.find('DeliveryPoint').text,
+            address.find('CarrierRoute').text,
+        )
+
     '''
     USPS Tracking Detail V2 API.
 
@@ -142,14 +339,100 @@ class USPSCourier(BaseCourier):
     `TrackingResponse` - Wrapper object for the server response and `TrackingEvents` associated with the provided tracking id.
     '''
     def track(self, tracking_id):
-        # Compose the URL formatting parameters
-        params = {
-            'tracking_id': tracking_id
-        }
+        # Shipments which can't have changed yet are answered from the cache
+        response = self._cached_tracking(tracking_id)
+        if response is not None:
+            return response
 
         # Make a request for the event-level information
-        raw_response = super(USPSCourier, self).get_server_response(self.tracking_endpoint, params, method='Tracking')
+        response = self.get_server_response(
+            self.tracking_endpoint, self._track_params([tracking_id]), method='Tracking', build=self._track_response
+        )
+        self._cache_tracking(tracking_id, response)
+        return response
+
+    '''
+    USPS Tracking Detail V2 API for many packages at once. Duplicate ids are only looked up once, and the
+    remaining ids are sent `MAX_TRACK_IDS` at a time.
+
+    ## Parameters
+    `tracking_ids` - Iterable of USPS tracking ids. Must be String types.
+
+    ## Returns
+    `OrderedDict` - Maps each distinct tracking id, in input order, to its `TrackingResponse`. Ids the
+        carrier could not look up get an empty `TrackingResponse` with `error` set, instead of failing the batch.
+    '''
+    def track_many(self, tracking_ids):
+        responses = OrderedDict()
+        for chunk in self._track_chunks(tracking_ids, responses):
+            # Make a request for the event-level information
+            responses.update(self.get_server_elements(
+                self.tracking_endpoint, self._track_params(chunk), 'TrackInfo', method='Tracking',
+                build=lambda found: self._track_chunk_response(chunk, found), each=self._track_info,
+                items=len(chunk)
+            ))
+
+        return responses
+
+    '''
+    Streaming version of `track_many`, for inputs too large to hold. Ids are read lazily and tracked in batches,
+    several at once, so memory is bounded by `batch_size` and `concurrency` instead of the input's size.
+    Duplicates are only looked up once within a batch.
+
+    ## Parameters
+    `tracking_ids` - Iterable of USPS tracking ids.
+    `batch_size` - Ids per batch, defaults to `MAX_TRACK_IDS`. Larger batches are sent in several requests.
+    `concurrency` - Batches in flight at once, defaults to the courier's `pool_size`.
 
+    ## Returns
+    `Generator` - Yields a (tracking id, `TrackingResponse`) pair per input, in input order, as each batch completes.
+    '''
+    def iter_track(self, tracking_ids, batch_size=None, concurrency=None):
+        batches = pipelined(
+            lambda batch: (batch, self.track_many(batch)),
+            chunked(tracking_ids, batch_size or self.MAX_TRACK_IDS),
+            concurrency or self.pool_size
+        )
+        for batch, responses in batches:
+            for tracking_id in batch:
+                yield tracking_id, responses[tracking_id]
+
+    # Splits the distinct tracking ids missing from the tracking cache into API sized chunks.
+    # `responses` gets an entry for every id, in input order, cached ids fill theirs straight away.
+    def _track_chunks(self, tracking_ids, responses):
+        chunk = []
+        for tracking_id in unique(tracking_ids):
+            responses[tracking_id] = self._cached_tracking(tracking_id)
+            if responses[tracking_id] is not None:
+                continue
+
+            chunk.append(tracking_id)
+            if len(chunk) == self.MAX_TRACK_IDS:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    # Returns the cached `TrackingResponse` of a tracking id, or None if it isn't cached
+    def _cached_tracking(self, tracking_id):
+        if self.tracking_cache is None:
+            return None
+        return self.tracking_cache.get(tracking_id)
+
+    # Stores the `TrackingResponse` of a tracking id
+    def _cache_tracking(self, tracking_id, response):
+        if self.tracking_cache is not None and response is not None:
+            self.tracking_cache.set(tracking_id, response)
+
+    # Composes the request parameters for a list of tracking ids
+    def _track_params(self, tracking_ids):
+        return {
+            'track_ids': self._track_id_xml.render_many({'id': tracking_id} for tracking_id in tracking_ids)
+        }
+
+    # Builds the `TrackingResponse` for a single id request, raising if the carrier returned an error
+    def _track_response(self, raw_response):
         # Extract the XML data from the parsed response
         track_info = raw_response.find('TrackInfo')
 
@@ -158,13 +441,44 @@ class USPSCourier(BaseCourier):
         if error is not None:
             return self.process_exception(error)
 
+        return self._build_tracking_response(track_info)
+
+    # Builds the `TrackingResponse` of a single TrackInfo element of a batch request, paired with its id
+    def _track_info(self, track_info):
+        return track_info.get('ID'), self._build_tracking_response(track_info)
+
+    # Maps each id of a batch request to its `TrackingResponse`, from the `_track_info` pairs. Each id gets its
+    # own TrackInfo, errors included.
+    def _track_chunk_response(self, chunk, found):
+        found = dict(found)
+
+        responses = OrderedDict()
+        for tracking_id in chunk:
+            response = found.get(tracking_id)
+            if response is None:
+                response = TrackingResponse()
+                response.error = 'No tracking information returned for %s' % tracking_id
+            responses[tracking_id] = response
+            self._cache_tracking(tracking_id, response)
+
+        return responses
+
+    # Builds the `TrackingResponse` for a single TrackInfo element, recording the error message if it has one
+    def _build_tracking_response(self, track_info):
+        response = TrackingResponse()
+
+        # Check to see if we got a valid response
+        error = track_info.find('Error')
+        if error is not None:
+            response.error = error.findtext('Description', 'Unknown tracking error')
+            return response
+
         # Current event/summary
         raw_events = [track_info.find('TrackSummary')]
         # Remaining past events
         raw_events.extend(track_info.findall('TrackDetail'))
 
-        # Create the TrackingResponse and TrackingEvents
-        response = TrackingResponse()
+        # Create the TrackingEvents
         for event in raw_events:
             response.add(
                 TrackingEvent(
@@ -198,48 +512,149 @@ class USPSCourier(BaseCourier):
     `RateCalculationResponse` - Wrapper object for the server response and `Rates` associated with the provided metrics.
     '''
     def getRate(self, rate_type=DOMESTIC, method='ALL', detailed=False, **kwargs):
-        # Extract the package item and compose the XML version of it
-        package_xml = '<Package ID="{id}">' + \
-                        '<Service>{{method}}</Service>' + \
-                        '<ZipOrigination>{origin_zip}</ZipOrigination>' + \
-                        '<ZipDestination>{destination_zip}</ZipDestination>' + \
-                        '<Pounds>{weight_lb}</Pounds>' + \
-                        '<Ounces>{weight_oz}</Ounces>' + \
-                        '<Container>{shape}</Container>' + \
-                        '<Size>{size}</Size>' + \
-                        '<Width>{width}</Width>' + \
-                        '<Length>{length}</Length>' + \
-                        '<Height>{height}</Height>' + \
-                        '<Machinable>true</Machinable>' + \
-                    '</Package>'
         package = kwargs.get('package', None)
+        params = self._rate_params(package, method)
+
+        # Quotes the local tables cover, or identical to earlier ones, are answered without the API
+        response = self._known_rates(package, rate_type, method)
+        if response is not None:
+            return response
+
+        # Make a request for the rate-level information
+        response = self.get_server_response(
+            getattr(self, rate_type + '_rate_endpoint'), params, method='Rate',
+            build=lambda raw_response: self._rate_response(raw_response, package, rate_type)
+        )
+        self._cache_rates(response, package, rate_type, method)
+        return response
 
+    '''
+    USPS Rate Calculator V4 and International V2 API for many packages at once. Packages are sent `MAX_PACKAGES`
+    per request, and each one is identified by its position in `packages`.
+
+    ## Parameters
+    `Packages` - Iterable of `Package` objects to rate.
+    `Rate Type` - Either `DOMESTIC` or `INTERNATIONAL`, applied to every package.
+    `Method` - The service to rate every package with, defaults to all of them.
+
+    ## Returns
+    `RateCalculationResponse` - Every rate of every package. Use `rates_for(package_id)` and `cheapest(package_id)`
+        with the package's position as a String to look up a single package. Packages the carrier could not rate
+        are listed in `errors` instead.
+    '''
+    def getRates(self, packages, rate_type=DOMESTIC, method='ALL'):
+        response = RateCalculationResponse()
+        for ids in self._rate_chunks(packages, response, rate_type, method):
+            # Make a request for the rate-level information
+            params = self._rates_params(ids, method)
+            self.get_server_elements(
+                getattr(self, rate_type + '_rate_endpoint'), params, 'Package', method='Rate',
+                build=lambda package_rates: self._rates_chunk_response(response, ids, package_rates, rate_type, method),
+                each=lambda package_info: self._package_rates(package_info, ids, rate_type), items=len(ids)
+            )
+
+        return response
+
+    # Composes the request parameters for a single package
+    def _rate_params(self, package, method):
         # Make sure we got a valid package before continuing
         if package is None:
             raise TypeError('`package` is a required argument (received None)')
 
-        # Store the packages XML representatiojn for later use/debugging
-        package._xml = package_xml.format(
-                id='0',
-                origin_zip=package.origin,
-                destination_zip=package.destination,
-                weight_lb=str(package.weight[0]),
-                weight_oz=str(package.weight[1]),
-                shape=package.shape,
-                size=package.size,
-                width=str(package.width),
-                length=str(package.length),
-                height=str(package.height)
-            )
+        return {
+            'package': self._package_request_xml(package, '0', method)   # We only allow a single method type since documentation for multiple is poor :/.
+        }
 
-        # The reason we format the method second is so that the getDetailedRates code can speicify without going crazy with string parsing.
-        params = {
-            'package': package._xml.format(method=method)   # We only allow a single method type since documentation for multiple is poor :/.
+    # Splits the packages the local tables and rate cache can't answer into API sized chunks, each mapping package
+    # ids to packages. Known packages are added to the response straight away. Ids are the package's position in
+    # `packages`, so they stay unique within the whole response.
+    def _rate_chunks(self, packages, response, rate_type, method):
+        ids = OrderedDict()
+        for index, package in enumerate(packages):
+            package_id = str(index)
+            cached = self._known_rates(package, rate_type, method, package_id)
+            if cached is not None:
+                self._package_request_xml(package, package_id, method)
+                response.add(*cached.rates)
+                continue
+
+            ids[package_id] = package
+            if len(ids) == self.MAX_PACKAGES:
+                yield ids
+                ids = OrderedDict()
+
+        if ids:
+            yield ids
+
+    # Composes the request parameters for a chunk of packages keyed by id
+    def _rates_params(self, ids, method):
+        return {
+            'package': Markup(''.join([
+                self._package_request_xml(package, package_id, method) for package_id, package in ids.items()
+            ]))
         }
 
-        # Make a request for the rate-level information
-        raw_response = super(USPSCourier, self).get_server_response(getattr(self, rate_type + '_rate_endpoint'), params, method='Rate')
+    # Composes and stores the XML representation of a package
+    def _package_request_xml(self, package, package_id, method):
+        # Store the packages XML representatiojn for later use/debugging
+        package._xml = self._package_xml.render(id=package_id, method=method, **self._package_fields(package))
+        return package._xml
+
+    # The XML formatting parameters of a single package
+    def _package_fields(self, package):
+        return {
+            'origin_zip': package.origin,
+            'destination_zip': package.destination,
+            'weight_lb': package.weight[0],
+            'weight_oz': package.weight[1],
+            'shape': package.shape,
+            'size': package.size,
+            'width': package.width,
+            'length': package.length,
+            'height': package.height
+        }
 
+    # Cache key of a rate quote, the canonical package request under a fixed id
+    def _rate_cache_key(self, package, rate_type, method):
+        return rate_type + ':' + self._package_xml.render(id='0', method=method, **self._package_fields(package))
+
+    # Rates a package from the local tables, or else the rate cache. Returns None if the API has to be asked.
+    def _known_rates(self, package, rate_type, method, package_id='0'):
+        if self.local_rates is not None and package is not None:
+            response = self.local_rates.rate(package, rate_type, method, package_id)
+            if response is not None:
+                return response
+
+        return self._cached_rates(package, rate_type, method, package_id)
+
+    # Rebuilds a package's cached quote as a `RateCalculationResponse`, or returns None if it isn't cached
+    def _cached_rates(self, package, rate_type, method, package_id='0'):
+        if self.rate_cache is None or package is None:
+            return None
+
+        quotes = self.rate_cache.get(self._rate_cache_key(package, rate_type, method))
+        if quotes is None:
+            return None
+
+        return RateCalculationResponse(*[
+            RateCalculation(package, price, service, destination_type=rate_type, package_id=package_id)
+            for price, service in quotes
+        ])
+
+    # Stores the (price, service) pairs quoted for a package, so they can be rebound to any equal package.
+    # Prices change, so quotes expire after `DEFAULT_RATE_CACHE_TTL` unless the backend has its own TTL.
+    def _cache_rates(self, response, package, rate_type, method, package_id='0'):
+        if self.rate_cache is None or response is None:
+            return
+
+        self.rate_cache.set(
+            self._rate_cache_key(package, rate_type, method),
+            [(rate.price, rate.method) for rate in response.rates_for(package_id)],
+            ttl=DEFAULT_RATE_CACHE_TTL if self.rate_cache.ttl is None else None
+        )
+
+    # Builds the `RateCalculationResponse` for a single package request, raising if the carrier returned an error
+    def _rate_response(self, raw_response, package, rate_type):
         # Extract the XML data from the parsed response
         package_info = raw_response.find('Package')
 
@@ -248,22 +663,52 @@ class USPSCourier(BaseCourier):
         if error is not None:
             return self.process_exception(error)
 
-        # Gather all of the rates that got returned
-        raw_rates = package_info.findall('Postage')
-
-        # Create the TrackingResponse and TrackingEvents
+        # Create the RateCalculationResponse and RateCalculations
         response = RateCalculationResponse()
-        for rate in raw_rates:
-            response.add(
-                RateCalculation(
-                    package,
-                    rate.find('Rate').text,
-                    HTMLParser().unescape(rate.find('MailService').text)
-                )
-            )
+        self._add_rates(response, package_info, package, rate_type, '0')
+
+        return response
+
+    # Builds the rates of a single Package element of a batch request: the package id, and its error or
+    # `RateCalculation`s
+    def _package_rates(self, package_info, ids, rate_type):
+        package_id = package_info.get('ID')
+        error = package_info.find('Error')
+        if error is not None:
+            return package_id, error.findtext('Description', 'Unknown rate error'), []
+        if package_id not in ids:
+            return package_id, None, []
+        return package_id, None, self._build_rates(package_info, ids[package_id], rate_type, package_id)
+
+    # Adds the `_package_rates` of a batch request to the response. Each package is answered on its own,
+    # errors included.
+    def _rates_chunk_response(self, response, ids, package_rates, rate_type, method):
+        for package_id, error, rates in package_rates:
+            if error is not None:
+                response.errors[package_id] = error
+            elif package_id in ids:
+                response.add(*rates)
+                self._cache_rates(response, ids[package_id], rate_type, method, package_id)
 
         return response
 
+    # Adds a `RateCalculation` to the response for every Postage element of a single Package element
+    def _add_rates(self, response, package_info, package, rate_type, package_id):
+        response.add(*self._build_rates(package_info, package, rate_type, package_id))
+
+    # Builds a `RateCalculation` for every Postage element of a single Package element
+    def _build_rates(self, package_info, package, rate_type, package_id):
+        return [
+            RateCalculation(
+                package,
+                rate.find('Rate').text,
+                unescape(rate.find('MailService').text),
+                destination_type=rate_type,
+                package_id=package_id
+            )
+            for rate in package_info.findall('Postage')
+        ]
+
     '''
     USPS Detailed Rate Calculator V4 and International V2 API.
 
@@ -274,21 +719,29 @@ class USPSCourier(BaseCourier):
     `RateOption` - Wrapper object for the extra service option provided for a specific `RateCalculation`.
     '''
     def getDetailedRate(self, rate):
+        # Make a request for the detailed-rate information.
+        params = self._detailed_rate_params(rate)
+        return self.get_server_response(
+            getattr(self, rate.type + '_rate_endpoint'), params, method='Rate',
+            build=lambda raw_response: self._detailed_rate_response(raw_response, rate)
+        )
+
+    # Composes the request parameters for the detailed rate of a single service
+    def _detailed_rate_params(self, rate):
         # Purify the shipping method, there is a lot of junk in there...
         for service in self._services:
-            match = re.search(service, re.sub(r'<([a-zA-Z]+)></\1>', '', rate.method.encode('ascii', 'ignore')).upper())
+            match = re.search(service, re.sub(r'<([a-zA-Z]+)></\1>', '', rate.method.encode('ascii', 'ignore').decode('ascii')).upper())
             if match is not None:
                 break
         method = match.group(1)
 
         # We have all the data we need for the request, already parsed, how nice!
-        params = {
-            'package': rate.package._xml.format(method=method)
+        return {
+            'package': self._package_request_xml(rate.package, rate.package_id, method)
         }
 
-        # Make a request for the detailed-rate information.
-        raw_response = super(USPSCourier, self).get_server_response(getattr(self, rate.type + '_rate_endpoint'), params, method='Rate')
-
+    # Builds the new `RateCalculation`, with its service options, from a detailed rate response
+    def _detailed_rate_response(self, raw_response, rate):
         # Extract the XML data from the parsed response
         package_info = raw_response.find('Package')
 
@@ -302,7 +755,9 @@ class USPSCourier(BaseCourier):
         new_rate = RateCalculation(
             rate.package,
             postage_info.find('Rate').text,
-            HTMLParser().unescape(postage_info.find('MailService').text)
+            unescape(postage_info.find('MailService').text),
+            destination_type=rate.type,
+            package_id=rate.package_id
         )
 
         # For each of the options provided, add it to the options
@@ -311,7 +766,7 @@ class USPSCourier(BaseCourier):
                 RateOption(
                     service.find('ServiceName').text,
                     service.find('Price').text,
-                    id=service.find('ServiceID'),
+                    id=service.find('ServiceID').text,
                 )
             )
 
@@ -0,0 +1,62 @@
+'''
+Small helpers shared by the couriers.
+'''
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+'''
+Splits an iterable into lists of at most `size` items. The input is consumed lazily,
+so only one chunk is held in memory at a time.
+
+## Parameters
+`iterable` - Any iterable of items to split.
+`size` - Maximum number of items per chunk.
+
+## Returns
+`Generator` - Yields lists of items, in input order.
+'''
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+'''
+Removes duplicate items while keeping the order they were first seen in.
+
+## Parameters
+`iterable` - Any iterable of hashable items.
+
+## Returns
+`List` - The distinct items in input order.
+'''
+def unique(iterable):
+    return list(OrderedDict.fromkeys(iterable))
+
+
+'''
+Runs `function` on every item, `concurrency` items at a time in a thread pool, and yields the results in input
+order. Items are only read as fast as results are consumed, so at most `concurrency` are held at once.
+
+## Parameters
+`function` - Called with each item.
+`iterable` - Any iterable of items, read lazily.
+`concurrency` - Number of items processed at once.
+
+## Returns
+`Generator` - Yields the result of each item, in input order. Errors are raised when their result is reached.
+'''
+def pipelined(function, iterable, concurrency):
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,144 @@
+'''
+Zone chart as a dense origin ZIP3 by destination ZIP3 matrix, for looking up the zones of millions of
+origin/destination pairs at once without calling the carrier.
+'''
+import csv
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of ZIP3 prefixes, 000 through 999
+ZIP3_COUNT = 1000
+
+# Stored for pairs the chart does not cover
+UNKNOWN_ZONE = 0
+
+
+class ZoneMatrix(object):
+    '''
+    Zones between every pair of ZIP3 prefixes, one byte each, 1MB in total.
+
+    ## Parameters
+    `matrix` - A 1000 by 1000 array of zones, indexed by origin then destination ZIP3. 0 marks unknown pairs.
+    '''
+
+    # Init for a new ZoneMatrix, an empty one when no matrix is given
+    def __init__(self, matrix=None):
+        if np is None:
+            raise ImportError('ZoneMatrix requires numpy, install it with `pip install ponyexpress[table]`')
+
+        if matrix is None:
+            matrix = np.zeros((ZIP3_COUNT, ZIP3_COUNT), dtype=np.uint8)
+        if matrix.shape != (ZIP3_COUNT, ZIP3_COUNT):
+            raise ValueError('A zone matrix is %d by %d (received %r)' % (ZIP3_COUNT, ZIP3_COUNT, matrix.shape))
+        self.matrix = matrix
+
+    '''
+    Builds a matrix from zone chart ranges.
+
+    ## Parameters
+    `ranges` - Iterable of (origin ZIP3, first destination ZIP3, last destination ZIP3, zone), or
+        (origin ZIP3, destination ZIP3, zone) for single pairs. ZIP3s may be integers or strings.
+
+    ## Returns
+    `ZoneMatrix` - The matrix of the chart.
+    '''
+    @classmethod
+    def from_ranges(cls, ranges):
+        zones = cls()
+        for row in ranges:
+            if len(row) == 3:
+                origin, first, zone = row
+                last = first
+            else:
+                origin, first, last, zone = row
+            zones.matrix[int(origin), int(first):int(last) + 1] = int(zone)
+        return zones
+
+    '''
+    Builds a matrix from a CSV zone chart, with rows of origin ZIP3, first destination ZIP3,
+    last destination ZIP3 and zone, or origin ZIP3, destination ZIP3 and zone. Rows which don't
+    start with a number, such as a header, are skipped.
+
+    ## Parameters
+    `path` - Location of the CSV file.
+
+    ## Returns
+    `ZoneMatrix` - The matrix of the chart.
+    '''
+    @classmethod
+    def from_csv(cls, path):
+        with open(path) as handle:
+            return cls.from_ranges(
+                row for row in csv.reader(handle) if row and row[0].strip().isdigit()
+            )
+
+    '''
+    Loads a matrix written by `save`.
+
+    ## Parameters
+    `path` - Location of the file.
+    `mmap` - Map the file read only instead of reading it, so processes share one copy.
+
+    ## Returns
+    `ZoneMatrix` - The loaded matrix.
+    '''
+    @classmethod
+    def load(cls, path, mmap=True):
+        if np is None:
+            raise ImportError('ZoneMatrix requires numpy, install it with `pip install ponyexpress[table]`')
+        return cls(np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False))
+
+    # Writes the matrix in NumPy's binary format
+    def save(self, path):
+        with open(path, 'wb') as handle:
+            np.save(handle, np.ascontiguousarray(self.matrix, dtype=np.uint8), allow_pickle=False)
+
+    '''
+    Looks up the zones of many origin/destination pairs at once.
+
+    ## Parameters
+    `origins` - Array or sequence of origin ZIP codes, as strings or integers.
+    `destinations` - Array or sequence of destination ZIP codes, the same length as `origins`.
+
+    ## Returns
+    `Array` - The zone of every pair as unsigned bytes, 0 where it is unknown or a ZIP code is invalid.
+    '''
+    def lookup(self, origins, destinations):
+        origins = self.zip3(origins)
+        destinations = self.zip3(destinations)
+
+        zones = np.zeros(origins.shape, dtype=np.uint8)
+        valid = (origins >= 0) & (destinations >= 0)
+        zones[valid] = self.matrix[origins[valid], destinations[valid]]
+        return zones
+
+    # Zone between two ZIP codes, or None if it is unknown
+    def zone(self, origin, destination):
+        zone = int(self.lookup([origin], [destination])[0])
+        return None if zone == UNKNOWN_ZONE else zone
+
+    '''
+    Extracts the ZIP3 prefix of many ZIP codes.
+
+    ## Parameters
+    `codes` - Array or sequence of ZIP codes. Strings are 5 digit or ZIP+4, integers are 5 digit ZIP codes.
+
+    ## Returns
+    `Array` - The integer prefix of every code, -1 for codes which aren't ZIP codes.
+    '''
+    @staticmethod
+    def zip3(codes):
+        codes = np.asarray(codes)
+        if codes.dtype.kind in 'iu':
+            prefixes = codes.astype(np.int64) // 100
+            return np.where((codes >= 0) & (codes < 100000), prefixes, -1)
+
+        # Casting to a 3 character string keeps the first 3 characters
+        prefixes = codes.astype('U3')
+        valid = np.char.isdigit(prefixes) & (np.char.str_len(prefixes) == 3)
+        result = np.full(prefixes.shape, -1, dtype=np.int64)
+        result[valid] = prefixes[valid].astype(np.int64)
+        return result
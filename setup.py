@@ -28,6 +28,17 @@ setup(
     version=find_version('ponyexpress', '__init__.py'),
     packages=['ponyexpress', ],
     include_package_data=True,
+    # concurrent.futures is backported to Python 2.7 by the futures package
+    install_requires=['requests', 'future', 'futures; python_version < "3"'],
+    extras_require={
+        'async': ['httpx'],
+        'http2': ['httpx[http2]'],
+        'fast': ['lxml>=5', 'orjson'],
+        'table': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': ['ponyexpress = ponyexpress.cli:main'],
+    },
     license='MIT License',  # example license
     description='Python-based shipping package. Integrates with USPS, UPS, FedEx services.',
     long_description=README,
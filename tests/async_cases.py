@@ -0,0 +1,209 @@
+'''
+Tests of the asynchronous couriers, collected through `test_aio`.
+'''
+import asyncio
+from datetime import datetime as dt
+from unittest import TestCase
+
+import httpx
+
+from ponyexpress.aio import AsyncMemoryResponse, AsyncMemoryTransport, AsyncUSPSCourier
+from ponyexpress.policy import RequestPolicy
+from ponyexpress.rates import Package
+from ponyexpress.usps import USPSCourier
+from test_usps import FixtureAdapter, RATE_MANY_RESPONSE, TRACK_MANY_RESPONSE, VERIFY_MANY_RESPONSE
+
+
+class AsyncUSPSTests(TestCase):
+    # Serve recorded responses instead of the live API, counting requests in flight
+    def respond_with(self, body, delay=0):
+        self.requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        async def handler(request):
+            self.requests.append(request)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            await asyncio.sleep(delay)
+            self.in_flight -= 1
+            return httpx.Response(200, content=body)
+
+        self.usps.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def setUp(self):
+        self.usps = AsyncUSPSCourier('user', concurrency=2)
+
+    def run_async(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await self.usps.close()
+        return asyncio.run(run())
+
+    # Test single tracking matches the blocking courier
+    def test_track(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+
+        response = self.run_async(self.usps.track('9374889949010711251710'))
+
+        self.assertEqual(dt(2016, 1, 6, 22, 8), response.accepted)
+        self.assertEqual(dt(2016, 1, 8, 14, 48), response.delivered)
+
+    # Test batch tracking sends chunks concurrently, within the concurrency limit
+    def test_track_many_bounded_concurrency(self):
+        self.respond_with(TRACK_MANY_RESPONSE, delay=0.01)
+
+        ids = [str(i) for i in range(USPSCourier.MAX_TRACK_IDS * 4)]
+        responses = self.run_async(self.usps.track_many(ids))
+
+        self.assertEqual(list(responses.keys()), ids)
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual(self.peak_in_flight, 2)
+
+    # Test async results are identical to the blocking courier's
+    def test_matches_blocking_courier(self):
+        packages = [Package((1, 8), 12, 12, 13, True, '11218', '11780')]
+
+        blocking = USPSCourier('user')
+        blocking.session.mount('http://', FixtureAdapter(RATE_MANY_RESPONSE))
+        expected = blocking.getRates(packages)
+
+        self.respond_with(RATE_MANY_RESPONSE)
+        response = self.run_async(self.usps.getRates(packages))
+
+        self.assertEqual(
+            [(rate.package_id, rate.method, rate.price) for rate in response.rates],
+            [(rate.package_id, rate.method, rate.price) for rate in expected.rates]
+        )
+        self.assertEqual(response.errors, expected.errors)
+
+    # Test batch validation keeps input order
+    def test_validate_addresses(self):
+        self.respond_with(VERIFY_MANY_RESPONSE)
+
+        responses = self.run_async(self.usps.validate_addresses([
+            ('CA', 'Cupertino', '9501', '1 Infinite Circle'),
+            ('CA', '', '', '1 Infinite'),
+        ]))
+
+        self.assertEqual(responses[0].address.zip, '95014-2083')
+        self.assertEqual(responses[1].error, 'Address Not Found.')
+
+    # Test streaming tracking pairs every input with its result, in input order
+    def test_iter_track(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+        self.usps.coalesce = False
+        ids = ['9374889949010711251710', '93748899490101251710'] * 3
+
+        async def collect():
+            return [pair async for pair in self.usps.iter_track(iter(ids), batch_size=2)]
+
+        pairs = self.run_async(collect())
+
+        self.assertEqual([tracking_id for tracking_id, _ in pairs], ids)
+        self.assertEqual(dt(2016, 1, 8, 14, 48), pairs[4][1].delivered)
+        self.assertIsNotNone(pairs[5][1].error)
+        self.assertEqual(len(self.requests), 3)
+
+    # Test streaming mode parses the body as it arrives, with the same results
+    def test_streaming_track_many(self):
+        self.usps = AsyncUSPSCourier('user', streaming=True)
+        self.respond_with(TRACK_MANY_RESPONSE)
+
+        responses = self.run_async(self.usps.track_many(['9374889949010711251710', '93748899490101251710']))
+
+        self.assertEqual(dt(2016, 1, 8, 14, 48), responses['9374889949010711251710'].delivered)
+        self.assertIn('not yet available', responses['93748899490101251710'].error)
+
+    # Test streamed elements are built as soon as they are parsed, not once the whole body arrived
+    def test_streaming_builds_as_parsed(self):
+        second = TRACK_MANY_RESPONSE.index(b'<TrackInfo', TRACK_MANY_RESPONSE.index(b'<TrackInfo') + 1)
+        steps = []
+
+        class SplitResponse(AsyncMemoryResponse):
+            async def aiter_bytes(self, chunk_size):
+                yield self.content[:second]
+                steps.append('received')
+                yield self.content[second:]
+
+        class SplitTransport(AsyncMemoryTransport):
+            async def send(self, request, timeout=None, stream=False):
+                return SplitResponse(200, TRACK_MANY_RESPONSE)
+
+        self.usps = AsyncUSPSCourier('user', streaming=True, transport=SplitTransport(None))
+        track_info = self.usps._track_info
+        self.usps._track_info = lambda element: steps.append('built') or track_info(element)
+        responses = self.run_async(self.usps.track_many(['9374889949010711251710', '93748899490101251710']))
+
+        self.assertEqual(steps, ['built', 'received', 'built'])
+        self.assertIsNotNone(responses['9374889949010711251710'].delivered)
+
+    # Test failed attempts are retried, and slow ones hedged, like the blocking courier
+    def test_retry_and_hedge(self):
+        self.usps = AsyncUSPSCourier('user', policy=RequestPolicy(backoff=0.001, hedge_after=0.05))
+        steps = [httpx.ConnectError('reset'), 503, 2, 200]
+
+        async def handler(request):
+            step = steps.pop(0)
+            if isinstance(step, Exception):
+                raise step
+            if step == 2:
+                await asyncio.sleep(step)
+                step = 200
+            return httpx.Response(step, content=TRACK_MANY_RESPONSE)
+
+        self.usps.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        response = self.run_async(self.usps.track('9374889949010711251710'))
+
+        self.assertIsNotNone(response.delivered)
+        stats = self.usps.policy.stats()
+        self.assertEqual((stats['retries'], stats['hedges'], stats['hedge_wins']), (2, 1, 1))
+
+    # Test the asynchronous couriers take the in-memory transport too
+    def test_memory_transport(self):
+        self.usps = AsyncUSPSCourier('user', transport=AsyncMemoryTransport(lambda request: TRACK_MANY_RESPONSE))
+
+        responses = self.run_async(self.usps.track_many(['9374889949010711251710', '93748899490101251710']))
+
+        self.assertIsNotNone(responses['9374889949010711251710'].delivered)
+
+    # Test the blocking entry points point to their asynchronous versions instead of running synchronously
+    def test_blocking_entry_points(self):
+        with self.assertRaisesRegex(TypeError, 'async with'):
+            with self.usps:
+                pass
+        with self.assertRaisesRegex(TypeError, 'get_server_elements'):
+            self.usps.iter_server_response(tag='TrackInfo')
+        asyncio.run(self.usps.close())
+
+    # Test concurrent identical tasks share one HTTP request
+    def test_coalesced(self):
+        self.respond_with(TRACK_MANY_RESPONSE, delay=0.05)
+
+        async def track():
+            return await asyncio.gather(*[self.usps.track('9374889949010711251710') for _ in range(5)])
+
+        responses = self.run_async(track())
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.usps.coalesced, 4)
+        self.assertTrue(all(response.delivered is not None for response in responses))
+
+    # Test calls answered by an identical one in flight are flagged, and only the leader measures the network
+    def test_instrumented_coalesced(self):
+        calls = []
+        self.usps.hooks.append(calls.append)
+        self.respond_with(TRACK_MANY_RESPONSE, delay=0.05)
+
+        async def track():
+            return await asyncio.gather(*[self.usps.track('9374889949010711251710') for _ in range(3)])
+
+        self.run_async(track())
+
+        self.assertEqual(sorted(metrics.coalesced for metrics in calls), [False, True, True])
+        leader, = [metrics for metrics in calls if not metrics.coalesced]
+        self.assertGreaterEqual(leader.network, 0.05)
+        self.assertIsNone(leader.connect)
+        self.assertTrue(all(metrics.network is None for metrics in calls if metrics.coalesced))
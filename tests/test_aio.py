@@ -0,0 +1,14 @@
+# The asynchronous couriers need httpx and Python 3.7. The cases live in `async_cases`, which older
+# interpreters can't even compile, and are only imported where they can run.
+import sys
+from unittest import SkipTest
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+if httpx is None or sys.version_info < (3, 7):
+    raise SkipTest('The asynchronous couriers need httpx and Python 3.7 or later')
+
+from async_cases import *  # noqa: E402,F401,F403
@@ -1,12 +1,13 @@
 import os
 from datetime import datetime as dt
-from unittest import TestCase
+from unittest import TestCase, skipIf
 
 from ponyexpress.address import Address
 from ponyexpress.config import XML_RESPONSE
-from ponyexpress.courier import BaseCourier
+from ponyexpress.courier import BaseCourier, ElementStream
+from ponyexpress.parsers import JSON_BACKENDS, XML_BACKENDS, XMLBackend, get_xml_backend
 from ponyexpress.rates import Package, RateCalculation, RateCalculationResponse, RateOption
-from ponyexpress.tracking import TrackingResponse, TrackingEvent
+from ponyexpress.tracking import EVENT_CATEGORIES, TrackingResponse, TrackingEvent, parse_date, parse_time, register_event_keywords
 
 
 class BaseTests(TestCase):
@@ -40,6 +41,93 @@ class BaseTests(TestCase):
         except SyntaxError:
             self.assertTrue(True)
 
+    # Test every installed backend parses, and reports malformed responses, the same way
+    def test_parser_backends(self):
+        for name in XML_BACKENDS:
+            courier = BaseCourier('user', xml_parser=name)
+            self.assertEqual(courier.xml_parser.name, name)
+            self.assertEqual(courier.parse_xml('<hello type="world"><a>1</a></hello>').findtext('a'), '1')
+            with self.assertRaises(SyntaxError):
+                courier.parse_xml('<hello type="world"><hello>')
+
+        # Whole and streamed documents build the same elements with every backend, entities included
+        document = b'<!DOCTYPE Response [<!ENTITY name "AMP">]><Response><Item ID="0">a &name; b</Item></Response>'
+        parsed = []
+        for name in XML_BACKENDS:
+            parsed.append(BaseCourier('user', xml_parser=name).parse_xml(document).find('Item').text)
+            if XML_BACKENDS[name].streams:
+                stream = ElementStream('Item', name)
+                parsed.extend(element.text for element in stream.feed(document) + stream.close())
+        self.assertEqual(set(parsed), {'a AMP b'})
+
+        for name in JSON_BACKENDS:
+            courier = BaseCourier('user', json_parser=name)
+            self.assertEqual(courier.parse_json('{"hello": [1, 2.5, "a"]}'), {'hello': [1, 2.5, 'a']})
+            with self.assertRaises(SyntaxError):
+                courier.parse_json('{"hello": tru}')
+
+    # Test a backend without an incremental parser only fails when one is needed
+    def test_backend_without_pull_parser(self):
+        backend = XMLBackend('plain', XML_BACKENDS['etree'].fromstring, None, XML_BACKENDS['etree'].errors)
+        self.assertFalse(backend.streams)
+        self.assertEqual(backend.fromstring('<hello><a>1</a></hello>').findtext('a'), '1')
+        with self.assertRaises(ImportError):
+            backend.pull_parser()
+
+        # Streaming couriers refuse it up front rather than on their first call
+        self.assertFalse(BaseCourier('user', xml_parser=backend).streaming)
+        with self.assertRaises(ImportError):
+            BaseCourier('user', xml_parser=backend, streaming=True)
+
+    # Test unknown backends are refused
+    def test_unknown_parser_backend(self):
+        with self.assertRaises(ValueError):
+            BaseCourier('user', xml_parser='missing')
+
+    # Test the element stream hands out finished elements, byte by byte, without keeping them in the tree
+    @skipIf(not get_xml_backend().streams, 'Streaming needs lxml on this Python')
+    def test_element_stream(self):
+        body = b'<Response><Item ID="0"><Name>a</Name></Item><Other/><Item ID="1"><Name>b</Name></Item></Response>'
+        stream = ElementStream('Item')
+
+        elements = []
+        for index in range(len(body)):
+            elements.extend(stream.feed(body[index:index + 1]))
+            self.assertLessEqual(len(stream._root) if stream._root is not None else 0, 1)
+        elements.extend(stream.close())
+
+        self.assertEqual([element.get('ID') for element in elements], ['0', '1'])
+        self.assertEqual(elements[1].findtext('Name'), 'b')
+        self.assertEqual(len(stream._root), 0)
+
+    # Test the element stream reports malformed XML like parse_xml
+    @skipIf(not get_xml_backend().streams, 'Streaming needs lxml on this Python')
+    def test_element_stream_invalid(self):
+        stream = ElementStream('Item')
+        stream.feed(b'<Response><Item>')
+        with self.assertRaises(SyntaxError):
+            stream.feed(b'</Response>')
+
+    # Test the connection pool is built from the constructor options
+    def test_connection_pool_options(self):
+        courier = BaseCourier('user', pool_size=4, keep_alive=False, connect_timeout=1, read_timeout=5)
+
+        # Both schemes share the sized adapter
+        adapter = courier.session.get_adapter('http://production.shippingapis.com')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertIs(adapter, courier.session.get_adapter('https://production.shippingapis.com'))
+
+        # Timeouts and keep-alive are applied to every request
+        self.assertEqual(courier.timeout, (1, 5))
+        self.assertEqual(courier.session.headers['Connection'], 'close')
+
+        courier.close()
+
+    # Test pre-warming without a base URL is a no-op
+    def test_prewarm_without_base_url(self):
+        with BaseCourier('user', prewarm=True) as courier:
+            self.assertIsNone(courier.base_url)
+
 
 class BaseTrackingTests(TestCase):
     # Create a base carrier
@@ -85,6 +173,18 @@ class BaseTrackingTests(TestCase):
         # Alternate formatting works
         self.assertEqual('July 03, 2015 01:21 PM', event.isoDatetime())
 
+    # Test the fast date and time parsers agree with strptime, and fall back to it for anything else
+    def test_tracking_event_parsing(self):
+        for value, fmt in (('January 8, 2016', '%B %d, %Y'), ('december 31, 1999', '%B %d, %Y'), ('07-03-2015', '%m-%d-%Y'), ('2015/07/03', '%Y/%m/%d')):
+            self.assertEqual(parse_date(value, fmt), dt.strptime(value, fmt).date())
+        for value, fmt in (('12:00 am', '%I:%M %p'), ('12:30 PM', '%I:%M %p'), ('2:48 pm', '%I:%M %p'), ('13:21:00', '%H:%M:%S'), ('1321', '%H%M')):
+            self.assertEqual(parse_time(value, fmt), dt.strptime(value, fmt).time())
+
+        # Bad values raise the same error as strptime
+        for value, fmt in (('Smarch 8, 2016', '%B %d, %Y'), ('02-30-2015', '%m-%d-%Y')):
+            self.assertRaises(ValueError, parse_date, value, fmt)
+        self.assertRaises(ValueError, parse_time, '13:00 pm', '%I:%M %p')
+
     # Test the TrackingResponse object
     def test_tracking_response_null(self):
         # Make an empty tracking response
@@ -109,6 +209,48 @@ class BaseTrackingTests(TestCase):
         self.assertEqual('DELIVERED', response.status)
         self.assertEqual(dt(2015, 7, 3, 13, 21), response.accepted)
         self.assertEqual(dt(2015, 7, 6, 7, 47), response.delivered)
+        self.assertTrue(response.terminal)
+        self.assertFalse(TrackingResponse(event1).terminal)
+
+    # Test events are indexed by category as they are added
+    def test_tracking_response_categories(self):
+        response = TrackingResponse(
+            TrackingEvent('NY', 'Brooklyn', '11218', 'Out for Delivery', '01-09-2016', '08:00:00'),
+            TrackingEvent('NY', 'Brooklyn', '11218', 'Notice Left (No Authorized Recipient Available)', '01-08-2016', '14:48:00'),
+            TrackingEvent('NY', 'Brooklyn', '11218', 'Out for Delivery', '01-08-2016', '08:00:00'),
+        )
+        response.add(TrackingEvent('IL', 'Chicago', '60701', 'Accepted at USPS Origin Facility', '01-06-2016', '22:08:00'))
+
+        self.assertEqual(response.out_for_delivery, dt(2016, 1, 9, 8))
+        self.assertEqual(response.exception, dt(2016, 1, 8, 14, 48))
+        self.assertEqual(response.accepted, dt(2016, 1, 6, 22, 8))
+        self.assertIsNone(response.delivered)
+        self.assertFalse(response.terminal)
+        self.assertEqual(len(response.events_in('out_for_delivery')), 2)
+        self.assertEqual(response.events_in('unknown'), [])
+
+    # Test the keyword tables can be extended with new categories
+    def test_register_event_keywords(self):
+        try:
+            register_event_keywords('customs', 'CUSTOMS')
+            response = TrackingResponse(TrackingEvent('NY', 'New York', '11430', 'Held in Customs', '01-08-2016', '14:48:00'))
+            self.assertEqual(len(response.events_in('customs')), 1)
+        finally:
+            # Recompile without the category
+            del EVENT_CATEGORIES['customs']
+            register_event_keywords('accepted')
+
+    # Test a keyword overlapping a shorter one that starts at the same position matches both
+    def test_overlapping_event_keywords(self):
+        try:
+            register_event_keywords('mailbox', 'DELIVERED, IN/AT MAILBOX')
+            response = TrackingResponse(TrackingEvent('NY', 'New York', '11430', 'DELIVERED, IN/AT MAILBOX', '01-08-2016', '14:48:00'))
+            self.assertEqual(len(response.events_in('mailbox')), 1)
+            self.assertEqual(response.delivered, dt(2016, 1, 8, 14, 48))
+            self.assertTrue(response.terminal)
+        finally:
+            del EVENT_CATEGORIES['mailbox']
+            register_event_keywords('accepted')
 
 
 class BaseAddressTests(TestCase):
@@ -181,6 +323,21 @@ class BaseRateTests(TestCase):
 
         self.assertEqual(response.cheapest().price, 24.50)
 
+    # Test the RateCalculationResponse indexes rates by package
+    def test_rate_calculation_response_packages(self):
+        package = Package(24, 8, 8, 8, False, '11218', '11780')
+        rate_1 = RateCalculation(package, 24.50, 'Priority 2-Day', package_id='0')
+        rate_2 = RateCalculation(package, 42.50, 'Priority 1-Day', package_id='1')
+        rate_3 = RateCalculation(package, 12.50, 'First Class', package_id='1')
+
+        response = RateCalculationResponse(rate_1, rate_2, rate_3)
+
+        # Each package has its own cheapest rate
+        self.assertEqual(response.package_ids, ['0', '1'])
+        self.assertEqual(response.cheapest('0').price, 24.50)
+        self.assertEqual(response.cheapest('1').price, 12.50)
+        self.assertEqual(response.rates_for('1'), [rate_2, rate_3])
+
     # Test the RateOption object
     def test_rate_option(self):
         # Make a new instance of the rate option
@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime as dt, timedelta
+from unittest import TestCase
+
+try:
+    from urllib.parse import unquote_plus
+except ImportError:
+    from urllib import unquote_plus
+
+from ponyexpress.cache import FOREVER, AddressCache, MemoryCache, SQLiteCache, TrackingCache
+from ponyexpress.config import DEFAULT_RATE_CACHE_TTL
+from ponyexpress.rates import Package
+from ponyexpress.tracking import TrackingEvent, TrackingResponse
+from ponyexpress.usps import USPSCourier
+from test_usps import FixtureAdapter, RATE_MANY_RESPONSE, TRACK_MANY_RESPONSE, VERIFY_MANY_RESPONSE
+
+
+class MemoryCacheTests(TestCase):
+    # Test values are returned until they expire, and the counters follow
+    def test_ttl(self):
+        cache = MemoryCache(ttl=60)
+        cache.set('fresh', 1)
+        cache.set('stale', 2, ttl=-1)
+
+        self.assertEqual(cache.get('fresh'), 1)
+        self.assertIsNone(cache.get('stale'))
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2})
+
+    # Test the least recently used entry is evicted first
+    def test_lru(self):
+        cache = MemoryCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Test entries are visible to every cache opened on the same file
+    def test_shared_file(self):
+        SQLiteCache(self.path).set('key', {'price': 7.15})
+
+        cache = SQLiteCache(self.path)
+        self.assertEqual(cache.get('key'), {'price': 7.15})
+        self.assertEqual(cache.hits, 1)
+
+    # Test expiry and least recently used eviction
+    def test_ttl_and_lru(self):
+        cache = SQLiteCache(self.path, maxsize=2, ttl=60)
+        cache.set('stale', 1, ttl=-1)
+        self.assertIsNone(cache.get('stale'))
+
+        cache.set('a', 1)
+        time.sleep(0.01)
+        cache.set('b', 2)
+        time.sleep(0.01)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+class RateCacheTests(TestCase):
+    def setUp(self):
+        self.adapter = FixtureAdapter(RATE_MANY_RESPONSE)
+        self.usps = USPSCourier('user', rate_cache=MemoryCache())
+        self.usps.session.mount('http://', self.adapter)
+
+    # Test identical quotes only hit the API once
+    def test_get_rate_cached(self):
+        first = self.usps.getRate(package=Package((1, 8), 12, 12, 13, True, '11218', '11780'))
+        package = Package((1, 8), 12, 12, 13, True, '11218', '11780')
+        second = self.usps.getRate(package=package)
+
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertEqual(self.usps.rate_cache.stats(), {'hits': 1, 'misses': 1})
+
+        # The cached quote is bound to the package that asked for it
+        self.assertEqual([rate.price for rate in second.rates], [rate.price for rate in first.rates])
+        self.assertIs(second.cheapest().package, package)
+
+    # Test bulk rating only requests the packages missing from the cache
+    def test_get_rates_cached(self):
+        packages = [
+            Package((1, 8), 12, 12, 13, True, '11218', '11780'),
+            Package((1, 8), 12, 12, 13, True, '11218', '00000'),
+        ]
+        self.usps.getRates(packages)
+        response = self.usps.getRates(packages)
+
+        # The package which failed is asked for again, the other one is cached
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertNotIn('<ZipDestination>11780', unquote_plus(self.adapter.requests[1].url))
+        self.assertEqual(response.cheapest('0').price, 7.15)
+
+    # Test quotes expire after the default rate TTL, unless the cache has its own
+    def test_rate_ttl(self):
+        self.usps.getRate(package=Package((1, 8), 12, 12, 13, True, '11218', '11780'))
+        (expires, quotes), = self.usps.rate_cache._entries.values()
+        self.assertAlmostEqual(expires, time.time() + DEFAULT_RATE_CACHE_TTL, delta=60)
+
+        self.usps.rate_cache = MemoryCache(ttl=60)
+        self.usps.getRate(package=Package((1, 8), 12, 12, 13, True, '11218', '11780'))
+        (expires, quotes), = self.usps.rate_cache._entries.values()
+        self.assertAlmostEqual(expires, time.time() + 60, delta=30)
+
+
+class AddressCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'addresses.db')
+        self.adapter = FixtureAdapter(VERIFY_MANY_RESPONSE)
+        self.addresses = [
+            ('CA', 'Cupertino', '9501', '1 Infinite Circle'),
+            ('CA', '', '', '1 Infinite'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Courier whose address cache persists to the test file
+    def courier(self):
+        usps = USPSCourier('user', address_cache=AddressCache(self.path))
+        usps.session.mount('http://', self.adapter)
+        return usps
+
+    # Test validated and rejected addresses survive a restart
+    def test_persistent_validation(self):
+        self.courier().validate_addresses(self.addresses)
+
+        # A new courier, on the same file, answers both addresses locally
+        usps = self.courier()
+        responses = usps.validate_addresses(self.addresses)
+
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertEqual(usps.address_cache.hits, 2)
+        self.assertEqual(responses[0].address.zip, '95014-2083')
+        self.assertEqual(responses[0].address.delivery_point, '01')
+        self.assertEqual(responses[0].address.carrier_route, 'C067')
+        self.assertFalse(responses[1].validated)
+        self.assertEqual(responses[1].error, 'Address Not Found.')
+
+    # Test the key ignores case and repeated whitespace
+    def test_normalized_key(self):
+        usps = self.courier()
+        usps.validate_addresses(self.addresses)
+
+        response = usps.validateAddress('ca', 'cupertino', '9501', '1  infinite circle')
+
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertTrue(response.validated)
+
+    # Test rejected addresses use the negative TTL
+    def test_negative_ttl(self):
+        usps = USPSCourier('user', address_cache=AddressCache(negative_ttl=-1))
+        usps.session.mount('http://', self.adapter)
+
+        usps.validate_addresses(self.addresses)
+        usps.validate_addresses(self.addresses)
+
+        # Only the rejected address was sent again
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertNotIn('CUPERTINO', self.adapter.requests[1].url)
+
+
+class TrackingCacheTests(TestCase):
+    # Response with a single event which happened `hours` ago
+    def response(self, etype, hours):
+        when = dt.now() - timedelta(hours=hours)
+        return TrackingResponse(
+            TrackingEvent('NY', 'New York', '12345', etype, when.strftime('%m-%d-%Y'), when.strftime('%H:%M:%S'))
+        )
+
+    # Test delivered shipments are kept forever, moving ones for a TTL growing with their age
+    def test_ttl(self):
+        cache = TrackingCache(min_ttl=60, max_ttl=3600, ttl_factor=0.1)
+
+        self.assertEqual(cache.ttl(self.response('DELIVERED', 1)), FOREVER)
+        self.assertEqual(cache.ttl(TrackingResponse()), 60)
+        self.assertEqual(cache.ttl(self.response('IN TRANSIT', 0)), 60)
+        self.assertAlmostEqual(cache.ttl(self.response('IN TRANSIT', 5)), 1800, delta=1)
+        self.assertEqual(cache.ttl(self.response('IN TRANSIT', 48)), 3600)
+
+    # Test terminal shipments are never fetched again, and the memory used is bounded
+    def test_track_cached(self):
+        adapter = FixtureAdapter(TRACK_MANY_RESPONSE)
+        usps = USPSCourier('user', tracking_cache=TrackingCache(maxsize=10))
+        usps.session.mount('http://', adapter)
+
+        ids = ['9374889949010711251710', '93748899490101251710']
+        usps.track_many(ids)
+        response = usps.track(ids[0])
+        responses = usps.track_many(ids)
+
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertTrue(response.terminal)
+        self.assertEqual(list(responses.keys()), ids)
+        self.assertIsNotNone(responses[ids[1]].error)
+        self.assertEqual(usps.tracking_cache.backend.maxsize, 10)
@@ -0,0 +1,144 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from ponyexpress.cli import main
+from test_usps import RATE_MANY_RESPONSE, TRACK_MANY_RESPONSE, VERIFY_MANY_RESPONSE
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Answers every request with the server's body, or a server error once it runs out of `successes`
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.successes -= 1
+            failed = server.successes < 0
+
+        body = b'Service Unavailable' if failed else server.body
+        self.send_response(503 if failed else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CommandLineTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        self.server.body = TRACK_MANY_RESPONSE
+        self.server.successes = float('inf')
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def run_command(self, *args):
+        return main(list(args) + [
+            '--username', 'user', '--base-url', 'http://127.0.0.1:%d' % self.server.server_address[1]
+        ])
+
+    # Test tracking a CSV file, every row is written back in input order with its result
+    def test_track_csv(self):
+        with open(self.path('ids.csv'), 'w', newline='') as ids:
+            writer = csv.writer(ids)
+            writer.writerow(['tracking_id', 'reference'])
+            for number in range(7):
+                writer.writerow(['9374889949010711251710' if number % 2 else '93748899490101251710', number])
+
+        status = self.run_command('track', self.path('ids.csv'), '-o', self.path('out.csv'), '--batch', '2')
+
+        self.assertEqual(status, 0)
+        with open(self.path('out.csv'), newline='') as output:
+            rows = list(csv.DictReader(output))
+        self.assertEqual([row['reference'] for row in rows], [str(number) for number in range(7)])
+        self.assertEqual(rows[1]['delivered'], '2016-01-08T14:48:00')
+        self.assertTrue(rows[0]['error'])
+
+    # Test an interrupted run resumes after the last finished batch, without writing any row twice
+    def test_resume(self):
+        with open(self.path('ids.jsonl'), 'w') as ids:
+            for number in range(10):
+                ids.write(json.dumps({'tracking_id': '9374889949010711251710', 'reference': number}) + '\n')
+        args = ['track', self.path('ids.jsonl'), '-o', self.path('out.jsonl'), '--batch', '2', '--concurrency', '1',
+                '--checkpoint', self.path('checkpoint')]
+
+        # The carrier goes down after three batches, the retries of the fourth fail too
+        self.server.successes = 3
+        self.assertEqual(self.run_command(*args), 1)
+        with open(self.path('checkpoint')) as checkpoint:
+            self.assertEqual(json.load(checkpoint)['rows'], 6)
+
+        # Output written after the last checkpoint is cut off
+        with open(self.path('out.jsonl'), 'a') as output:
+            output.write('{"partial": ')
+
+        self.server.successes = float('inf')
+        self.assertEqual(self.run_command(*args), 0)
+        with open(self.path('out.jsonl')) as output:
+            rows = [json.loads(line) for line in output]
+        self.assertEqual([row['reference'] for row in rows], list(range(10)))
+
+    # Test validating addresses, rows the carrier rejected keep its error
+    def test_validate(self):
+        self.server.body = VERIFY_MANY_RESPONSE
+        with open(self.path('addresses.jsonl'), 'w') as addresses:
+            for street in ('1 Infinite Loop', '2 Nowhere'):
+                addresses.write(json.dumps({
+                    'state': 'CA', 'city': 'Cupertino', 'postal_code': '95014', 'street_2': street
+                }) + '\n')
+
+        status = self.run_command('validate', self.path('addresses.jsonl'), '-o', self.path('out.jsonl'))
+
+        self.assertEqual(status, 0)
+        with open(self.path('out.jsonl')) as output:
+            valid, invalid = [json.loads(line) for line in output]
+        self.assertEqual((valid['validated'], valid['valid_zip']), (True, '95014-2083'))
+        self.assertEqual((invalid['validated'], invalid['error']), (False, 'Address Not Found.'))
+
+    # Test a malformed row is written with its error, while the valid rows of its batch are still sent
+    def test_malformed_rows(self):
+        self.server.body = VERIFY_MANY_RESPONSE
+        with open(self.path('addresses.jsonl'), 'w') as addresses:
+            for address in ({'street_2': '1 Infinite Loop'}, {}, {'street_2': '2 Nowhere'}):
+                addresses.write(json.dumps(dict(address, state='CA', city='Cupertino', postal_code=95014)) + '\n')
+
+        status = self.run_command('validate', self.path('addresses.jsonl'), '-o', self.path('out.jsonl'))
+
+        self.assertEqual(status, 0)
+        with open(self.path('out.jsonl')) as output:
+            valid, malformed, invalid = [json.loads(line) for line in output]
+        self.assertEqual(valid['valid_zip'], '95014-2083')
+        self.assertEqual((malformed['validated'], malformed['error']), (None, 'missing street_2'))
+        self.assertEqual((invalid['validated'], invalid['error']), (False, 'Address Not Found.'))
+
+        # Packages are numbered among the valid rows only, so each row still gets its own rates
+        self.server.body = RATE_MANY_RESPONSE
+        with open(self.path('packages.csv'), 'w', newline='') as packages:
+            writer = csv.writer(packages)
+            writer.writerow(['weight', 'length', 'width', 'height', 'origin', 'destination'])
+            writer.writerow(['abc', 12, 12, 13, '11218', '11780'])
+            writer.writerow([24, 12, 12, 13, '11218', '11780'])
+            writer.writerow([24, 12, 12, 13, '11218', '1'])
+
+        status = self.run_command('rate', self.path('packages.csv'), '-o', self.path('rates.csv'))
+
+        self.assertEqual(status, 0)
+        with open(self.path('rates.csv'), newline='') as output:
+            malformed, rated, rejected = list(csv.DictReader(output))
+        self.assertEqual((malformed['service'], malformed['error']), ('', "weight is not a number: 'abc'"))
+        self.assertTrue(rated['price'])
+        self.assertIn('ZIP Code', rejected['error'])
@@ -0,0 +1,82 @@
+import threading
+from unittest import TestCase
+
+import requests
+
+from ponyexpress.coalesce import SingleFlight
+from ponyexpress.policy import RequestPolicy
+from ponyexpress.usps import USPSCourier
+from test_policy import ScriptedAdapter
+from test_usps import TRACK_MANY_RESPONSE
+
+
+class CoalesceTests(TestCase):
+    # Runs `target` in several threads at once, returning each thread's result or error
+    def run_threads(self, target, count=8):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(index):
+            barrier.wait()
+            try:
+                results[index] = target()
+            except Exception as error:
+                results[index] = error
+
+        threads = [threading.Thread(target=run, args=(index, )) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    # Test concurrent identical tracking calls share one HTTP request
+    def test_track(self):
+        usps = USPSCourier('user')
+        adapter = ScriptedAdapter((0.2, 200))
+        usps.session.mount('http://', adapter)
+
+        responses = self.run_threads(lambda: usps.track('9374889949010711251710'))
+
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertEqual(usps.coalesced, 7)
+        self.assertTrue(all(response.delivered == responses[0].delivered for response in responses))
+        # Each caller still gets its own response object
+        self.assertEqual(len(set(id(response) for response in responses)), 8)
+
+        # Different requests are not coalesced
+        usps.track('9374889949010711251710')
+        usps.track('93748899490101251710')
+        self.assertEqual(len(adapter.requests), 3)
+        usps.close()
+
+    # Test an error reaches every caller waiting on the call
+    def test_error(self):
+        usps = USPSCourier('user', policy=RequestPolicy(retries=0))
+        adapter = ScriptedAdapter((0.2, requests.ConnectionError('reset')))
+        usps.session.mount('http://', adapter)
+
+        errors = self.run_threads(lambda: usps.track('9374889949010711251710'))
+
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertTrue(all(isinstance(error, requests.ConnectionError) for error in errors))
+        usps.close()
+
+    # Test coalescing can be turned off
+    def test_disabled(self):
+        usps = USPSCourier('user', coalesce=False)
+        adapter = ScriptedAdapter((0.1, 200))
+        usps.session.mount('http://', adapter)
+
+        self.run_threads(lambda: usps.track('9374889949010711251710'), count=3)
+
+        self.assertEqual(len(adapter.requests), 3)
+        self.assertEqual(usps.coalesced, 0)
+        usps.close()
+
+    # Test the single flight group directly, calls after the first finished run again
+    def test_single_flight(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.do('key', lambda: 1), 1)
+        self.assertEqual(flights.do('key', lambda: 2), 2)
+        self.assertEqual(flights.coalesced, 0)
@@ -0,0 +1,91 @@
+from unittest import TestCase, skipIf
+
+import requests
+
+from ponyexpress import instrument
+from ponyexpress.policy import RequestPolicy
+from ponyexpress.usps import USPSCourier
+from test_policy import ScriptedAdapter
+from test_usps import FixtureAdapter, STREAMS, STREAMS_REASON, TRACK_MANY_RESPONSE
+
+
+class InstrumentTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def courier(self, adapter, **kwargs):
+        usps = USPSCourier('user', hooks=[self.calls.append], **kwargs)
+        usps.session.mount('http://', adapter)
+        return usps
+
+    # Test every phase of a call is measured and handed to the courier's hooks
+    def test_track(self):
+        usps = self.courier(FixtureAdapter(TRACK_MANY_RESPONSE))
+        usps.track('9374889949010711251710')
+
+        metrics, = self.calls
+        self.assertEqual((metrics.api, metrics.courier, metrics.http_method), ('Tracking', 'USPSCourier', 'GET'))
+        self.assertEqual((metrics.status, metrics.items, metrics.coalesced, metrics.error), (200, 1, False, None))
+        self.assertEqual(metrics.response_bytes, len(TRACK_MANY_RESPONSE))
+        self.assertEqual(metrics.request_bytes, len(metrics.url))
+        for phase in ('build_request', 'network', 'parse', 'build'):
+            self.assertGreaterEqual(getattr(metrics, phase), 0)
+        self.assertGreaterEqual(metrics.total, metrics.network + metrics.parse + metrics.build)
+
+    # Test streamed batches count their items and report the consumer's time as the build time
+    @skipIf(not STREAMS, STREAMS_REASON)
+    def test_streaming(self):
+        usps = self.courier(FixtureAdapter(TRACK_MANY_RESPONSE), streaming=True)
+        usps.track_many(['9374889949010711251710', '93748899490101251710'])
+
+        metrics, = self.calls
+        self.assertEqual((metrics.items, metrics.status), (2, 200))
+        self.assertEqual(metrics.response_bytes, len(TRACK_MANY_RESPONSE))
+        self.assertAlmostEqual(metrics.network, metrics.connect + metrics.transfer)
+        self.assertGreaterEqual(metrics.build, 0)
+
+    # Test failed calls are reported with their error
+    def test_error(self):
+        usps = self.courier(ScriptedAdapter(requests.ConnectionError('reset')), policy=RequestPolicy(retries=0))
+        self.assertRaises(requests.ConnectionError, usps.track, '9374889949010711251710')
+
+        metrics, = self.calls
+        self.assertIsInstance(metrics.error, requests.ConnectionError)
+        self.assertIsNone(metrics.network)
+        self.assertIsNotNone(metrics.total)
+
+    # Test a failing hook is logged, without failing the call or hiding its error
+    def test_failing_hook(self):
+        def broken(metrics):
+            raise RuntimeError('sink is down')
+
+        usps = USPSCourier('user', hooks=[broken, self.calls.append])
+        usps.session.mount('http://', FixtureAdapter(TRACK_MANY_RESPONSE))
+        with self.assertLogs('ponyexpress.instrument', 'ERROR'):
+            responses = usps.track_many(['9374889949010711251710', '93748899490101251710'])
+        self.assertIsNotNone(responses['9374889949010711251710'].delivered)
+
+        usps.session.mount('http://', ScriptedAdapter(requests.ConnectionError('reset')))
+        usps.policy = RequestPolicy(retries=0)
+        with self.assertLogs('ponyexpress.instrument', 'ERROR'):
+            self.assertRaises(requests.ConnectionError, usps.track, '9374889949010711251710')
+        self.assertEqual(len(self.calls), 2)
+
+    # Test global hooks see every courier, and nothing is measured without hooks
+    def test_global_hooks(self):
+        usps = USPSCourier('user')
+        usps.session.mount('http://', FixtureAdapter(TRACK_MANY_RESPONSE))
+        self.assertIsNone(usps._metrics('Tracking', 1))
+
+        sink = instrument.StatsSink()
+        instrument.add_hook(sink)
+        try:
+            usps.track('9374889949010711251710')
+            usps.track_many(['9374889949010711251710', '93748899490101251710'])
+        finally:
+            instrument.remove_hook(sink)
+        usps.track('9374889949010711251710')
+
+        totals = sink.stats()['Tracking']
+        self.assertEqual((totals['calls'], totals['items'], totals['errors']), (2, 3, 0))
+        self.assertEqual(totals['response_bytes'], 2 * len(TRACK_MANY_RESPONSE))
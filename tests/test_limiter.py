@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from ponyexpress.limiter import MemoryBucketStore, RateLimiter, RateLimitExceeded
+from ponyexpress.usps import USPSCourier
+from test_usps import FixtureAdapter, TRACK_MANY_RESPONSE
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Test a burst goes out at once, then requests wait for the rate
+    def test_burst_then_wait(self):
+        limiter = RateLimiter(100, burst=3, store=MemoryBucketStore())
+
+        self.assertEqual([limiter.reserve('key') for _ in range(3)], [0, 0, 0])
+        # Waiting requests queue up behind each other
+        self.assertAlmostEqual(limiter.reserve('key'), 0.01, places=2)
+        self.assertAlmostEqual(limiter.reserve('key'), 0.02, places=2)
+        # Other keys have their own bucket
+        self.assertEqual(limiter.reserve('other'), 0)
+
+    # Test failing instead of waiting, and waiting only up to a timeout
+    def test_fail(self):
+        limiter = RateLimiter(1, block=False, store=MemoryBucketStore())
+        limiter.acquire('key')
+        self.assertRaises(RateLimitExceeded, limiter.acquire, 'key')
+
+        limiter = RateLimiter(10, burst=1, timeout=0.15, store=MemoryBucketStore())
+        self.assertEqual([limiter.reserve('key') for _ in range(2)][0], 0)
+        self.assertRaises(RateLimitExceeded, limiter.reserve, 'key')
+
+        self.assertRaises(ValueError, RateLimiter, 0)
+
+    # Test limiters in one process share their buckets by default, across threads
+    def test_shared_between_threads(self):
+        key = 'shared-%s' % id(self)
+        limiters = [RateLimiter(50, burst=5) for _ in range(4)]
+        started = time.time()
+
+        threads = [
+            threading.Thread(target=lambda limiter=limiter: [limiter.acquire(key) for _ in range(5)])
+            for limiter in limiters
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 20 requests, 5 of which burst, at 50 per second
+        self.assertGreaterEqual(time.time() - started, 0.25)
+
+    # Test the SQLite store shares buckets between processes, each with their own connection
+    def test_sqlite_shared(self):
+        path = os.path.join(self.directory, 'limits.db')
+        first = RateLimiter(1, burst=2, block=False, path=path)
+        second = RateLimiter(1, burst=2, block=False, path=path)
+
+        first.acquire('USPS:user')
+        second.acquire('USPS:user')
+        self.assertRaises(RateLimitExceeded, first.acquire, 'USPS:user')
+        self.assertRaises(RateLimitExceeded, second.acquire, 'USPS:user')
+        second.acquire('USPS:other')
+
+    # Test every request of a courier takes a token under its carrier and username
+    def test_courier(self):
+        limiter = RateLimiter(1, burst=1, block=False, store=MemoryBucketStore())
+        usps = USPSCourier('user', rate_limiter=limiter)
+        usps.session.mount('http://', FixtureAdapter(TRACK_MANY_RESPONSE))
+
+        self.assertEqual(usps.rate_limit_key, 'USPS:user')
+        usps.track('9374889949010711251710')
+        self.assertRaises(RateLimitExceeded, usps.track, '9374889949010711251710')
+        usps.close()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+try:
+    from urllib.parse import unquote_plus
+except ImportError:
+    from urllib import unquote_plus
+
+from ponyexpress.local import LocalRateEngine, write_rate_tables
+from ponyexpress.rates import INTERNATIONAL, Package
+from ponyexpress.usps import USPSCourier
+from test_usps import FixtureAdapter, RATE_MANY_RESPONSE
+
+# Brooklyn to Long Island is zone 1, to the west coast zone 8
+ZONES = [
+    (112, 100, 119, 1),
+    (112, 900, 961, 8),
+]
+
+SERVICES = [
+    {
+        'service': 'PRIORITY',
+        'name': 'Priority Mail 2-Day',
+        'prices': [
+            [7.15, 7.35, 7.60, 8.05, 8.30, 8.50, 8.75, 9.35],
+            [7.90, 8.50, 9.85, 11.70, 13.15, 14.45, 15.50, 17.20],
+        ],
+    },
+    {
+        'service': 'FIRST CLASS',
+        'name': 'First-Class Package Service',
+        'unit': 'oz',
+        'sizes': ['REGULAR'],
+        'prices': [[2.66] * 8] * 4 + [[3.47] * 8] * 4 + [[None] * 8] * 5,
+    },
+]
+
+
+class LocalRateEngineTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'usps.rates')
+        write_rate_tables(self.path, ZONES, SERVICES, complete=True)
+        self.engine = LocalRateEngine(self.path)
+
+    def tearDown(self):
+        self.engine.close()
+        shutil.rmtree(self.directory)
+
+    # Test zones are looked up from the ZIP3 ranges
+    def test_zone(self):
+        self.assertEqual(self.engine.zone('11218', '11780'), 1)
+        self.assertEqual(self.engine.zone('11218', '95014'), 8)
+        self.assertIsNone(self.engine.zone('11218', '60701'))
+        self.assertIsNone(self.engine.zone('60701', '11780'))
+        self.assertIsNone(self.engine.zone('11218', 'H0H0H0'))
+
+    # Test every service covering the package is rated by started weight unit
+    def test_rate_all(self):
+        response = self.engine.rate(Package((1, 2), 8, 8, 8, True, '11218', '95014'))
+
+        # First class stops at 13 oz, so only priority is quoted
+        self.assertEqual([(rate.method, rate.price) for rate in response.rates], [('Priority Mail 2-Day', 17.20)])
+
+        response = self.engine.rate(Package((0, 7), 8, 8, 8, True, '11218', '11780'), package_id='3')
+        self.assertEqual(
+            sorted((rate.method, rate.price, rate.package_id) for rate in response.rates),
+            [('First-Class Package Service', 3.47, '3'), ('Priority Mail 2-Day', 7.15, '3')]
+        )
+
+    # Test quotes the tables don't cover are left for the API
+    def test_rate_not_covered(self):
+        package = Package((0, 7), 13, 8, 8, True, '11218', '11780')
+
+        # First class isn't priced for large packages, or past its weight limit
+        self.assertIsNone(self.engine.rate(package, method='FIRST CLASS'))
+        self.assertIsNone(self.engine.rate(Package((0, 10), 8, 8, 8, True, '11218', '11780'), method='FIRST CLASS'))
+        self.assertIsNone(self.engine.rate(Package((3, 0), 8, 8, 8, True, '11218', '11780'), method='PRIORITY'))
+        self.assertIsNone(self.engine.rate(package, method='MEDIA'))
+        self.assertIsNone(self.engine.rate(package, rate_type=INTERNATIONAL))
+        self.assertIsNone(self.engine.rate(Package((0, 7), 8, 8, 8, True, '11218', '60701')))
+        self.assertEqual(len(self.engine.rate(package, method='PRIORITY').rates), 1)
+
+    # Test only a complete set of services answers quotes for all services
+    def test_incomplete_tables(self):
+        write_rate_tables(self.path + '.partial', ZONES, SERVICES)
+        with LocalRateEngine(self.path + '.partial') as engine:
+            package = Package((0, 7), 8, 8, 8, True, '11218', '11780')
+            self.assertIsNone(engine.rate(package))
+            self.assertEqual(engine.rate(package, method='PRIORITY').cheapest().price, 7.15)
+
+    # Test the courier only calls the API for packages the tables don't cover
+    def test_courier_fallback(self):
+        usps = USPSCourier('user', local_rates=self.engine)
+        adapter = FixtureAdapter(RATE_MANY_RESPONSE)
+        usps.session.mount('http://', adapter)
+
+        response = usps.getRate(package=Package((1, 0), 8, 8, 8, True, '11218', '11780'))
+        self.assertEqual(response.cheapest().price, 7.15)
+        self.assertEqual(len(adapter.requests), 0)
+
+        response = usps.getRates([
+            Package((1, 0), 8, 8, 8, True, '11218', '95014'),
+            Package((1, 8), 12, 12, 13, True, '11218', '60701'),
+        ])
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertEqual(response.cheapest('0').price, 9.35)
+        self.assertIn('<Package ID="1">', unquote_plus(adapter.requests[0].url))
+        self.assertNotIn('<Package ID="0">', unquote_plus(adapter.requests[0].url))
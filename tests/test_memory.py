@@ -0,0 +1,82 @@
+import pickle
+from unittest import TestCase, skipIf
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from ponyexpress.address import Address
+from ponyexpress.rates import Package, RateCalculation, RateOption
+from ponyexpress.tracking import TrackingEvent
+
+
+class ModelMemoryTests(TestCase):
+    '''
+    Memory benchmark of the response models, which are held by the million in reconciliation jobs.
+    The limits are bytes per instance, including everything the instance allocates.
+    '''
+    count = 10000
+
+    # Average bytes allocated per object built by `factory`
+    def measure(self, factory):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            objects = [factory(i) for i in range(self.count)]
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(objects), self.count)
+        return (after - before) / float(self.count)
+
+    # Test tracking events, which repeat the same dates, times and places
+    @skipIf(tracemalloc is None, 'Measuring memory needs tracemalloc, new in Python 3.4')
+    def test_tracking_event_memory(self):
+        size = self.measure(lambda i: TrackingEvent(
+            'NY', 'BROOKLYN', '11218', 'Arrived at Unit',
+            'January %d, 2016' % (i % 28 + 1), '2:48 pm', '%B %d, %Y', '%I:%M %p'
+        ))
+        self.assertLess(size, 200)
+
+    # Test rate calculations, which share their package
+    @skipIf(tracemalloc is None, 'Measuring memory needs tracemalloc, new in Python 3.4')
+    def test_rate_calculation_memory(self):
+        package = Package(24, 8, 8, 8, False, '11218', '11780')
+        size = self.measure(lambda i: RateCalculation(package, 24.50, 'Priority Mail 2-Day'))
+        self.assertLess(size, 200)
+
+    # Test addresses
+    @skipIf(tracemalloc is None, 'Measuring memory needs tracemalloc, new in Python 3.4')
+    def test_address_memory(self):
+        size = self.measure(lambda i: Address('CA', 'CUPERTINO', '95014-2083', '1 INFINITE LOOP', '01', 'C067'))
+        self.assertLess(size, 350)
+
+    # Test none of the models carry a per instance dictionary
+    def test_no_instance_dict(self):
+        package = Package(24, 8, 8, 8, False, '11218', '11780')
+        for model in (
+            package,
+            Address('CA', 'Cupertino', '95014', '1 Infinite Loop'),
+            TrackingEvent('NY', 'New York', '12345', 'ACCEPTED', '07-03-2015', '13:21:00'),
+            RateCalculation(package, 24.50, 'Priority 2-Day'),
+            RateOption('Tracking', '2.50', id='123'),
+        ):
+            self.assertFalse(hasattr(model, '__dict__'), type(model).__name__)
+
+    # Test slotted models still pickle, as the caches rely on it
+    def test_pickle(self):
+        option = pickle.loads(pickle.dumps(RateOption('Tracking', '2.50', id='123'), pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(option.id, '123')
+
+        event = pickle.loads(pickle.dumps(TrackingEvent('NY', 'New York', '12345', 'ACCEPTED', '07-03-2015', '13:21:00')))
+        self.assertEqual(event.city, 'New York')
+        self.assertEqual(event.datetime.hour, 13)
+
+    # Test extra option values are bounded
+    def test_rate_option_extras(self):
+        option = RateOption('Tracking', '2.50', id='123')
+        self.assertEqual(option.extras, {'id': '123'})
+        self.assertRaises(AttributeError, getattr, option, 'missing')
+        self.assertRaises(ValueError, RateOption, 'Tracking', '2.50', **dict(('key%d' % i, i) for i in range(100)))
@@ -0,0 +1,132 @@
+import threading
+import time
+from io import BytesIO
+from unittest import TestCase
+
+import requests
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from ponyexpress.policy import DeadlineExceeded, RequestPolicy
+from ponyexpress.request import HTTPRequest
+from ponyexpress.usps import USPSCourier
+from test_usps import TRACK_MANY_RESPONSE
+
+
+class ScriptedAdapter(BaseAdapter):
+    '''
+    Transport adapter which answers each request with the next step of a script. A step is a status code,
+    an exception to raise, or a (seconds, step) pair to answer after a delay.
+    '''
+    def __init__(self, *steps):
+        super(ScriptedAdapter, self).__init__()
+        self.steps = list(steps)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests.append(request)
+            step = self.steps.pop(0) if len(self.steps) > 1 else self.steps[0]
+
+        if isinstance(step, tuple):
+            time.sleep(step[0])
+            step = step[1]
+        if isinstance(step, Exception):
+            raise step
+
+        response = Response()
+        response.status_code = step
+        response.raw = BytesIO(TRACK_MANY_RESPONSE)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class RequestPolicyTests(TestCase):
+    def courier(self, *steps, **policy):
+        policy.setdefault('backoff', 0.001)
+        self.usps = USPSCourier('user', policy=RequestPolicy(**policy))
+        self.adapter = ScriptedAdapter(*steps)
+        self.usps.session.mount('http://', self.adapter)
+        return self.usps
+
+    def setUp(self):
+        self.usps = None
+
+    def tearDown(self):
+        if self.usps is not None:
+            self.usps.close()
+
+    # Test connection errors and retryable statuses are retried until an answer arrives
+    def test_retry(self):
+        usps = self.courier(requests.ConnectionError('reset'), 503, 200)
+
+        response = usps.track('9374889949010711251710')
+
+        self.assertIsNotNone(response.delivered)
+        self.assertEqual(len(self.adapter.requests), 3)
+        self.assertEqual(usps.policy.stats()['retries'], 2)
+        self.assertEqual(usps.policy.stats()['attempts'], 3)
+
+    # Test retries give up after the configured number, reporting the error
+    def test_retries_exhausted(self):
+        usps = self.courier(requests.Timeout('stalled'), retries=1)
+
+        self.assertRaises(requests.Timeout, usps.track, '9374889949010711251710')
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(usps.policy.stats()['failures'], 1)
+
+        # A status which is still failing is handed to process_exception
+        usps = self.courier(500, retries=1)
+        self.assertRaises(NotImplementedError, usps.track, '9374889949010711251710')
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    # Test requests which aren't idempotent are never retried
+    def test_not_idempotent(self):
+        usps = self.courier(requests.ConnectionError('reset'), 200)
+        request = HTTPRequest('POST', 'http://example.com/ship', 'label=1')
+
+        self.assertRaises(requests.ConnectionError, usps._execute, request)
+        self.assertEqual(len(self.adapter.requests), 1)
+
+    # Test the deadline covers every attempt together
+    def test_deadline(self):
+        # Backoff stops at the deadline
+        usps = self.courier(requests.ConnectionError('reset'), deadline=0.05, backoff=10, max_backoff=10, retries=10)
+        started = time.time()
+        self.assertRaises(DeadlineExceeded, usps.track, '9374889949010711251710')
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(len(self.adapter.requests), 1)
+
+        usps = self.courier((0.03, 503), deadline=0.05, retries=10)
+        self.assertRaises(DeadlineExceeded, usps.track, '9374889949010711251710')
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(usps.policy.stats()['deadline_exceeded'], 1)
+
+    # Test a slow request is hedged, and the faster copy is used
+    def test_hedge(self):
+        usps = self.courier((0.5, 200), 200, hedge_after=0.01)
+
+        started = time.time()
+        response = usps.track('9374889949010711251710')
+
+        self.assertLess(time.time() - started, 0.4)
+        self.assertIsNotNone(response.delivered)
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(usps.policy.stats()['hedges'], 1)
+        self.assertEqual(usps.policy.stats()['hedge_wins'], 1)
+
+    # Test hedging waits for the configured percentile of recent latencies
+    def test_hedge_percentile(self):
+        policy = RequestPolicy(hedge_percentile=90, hedge_min_samples=10)
+        request = HTTPRequest('GET', 'http://example.com')
+
+        self.assertIsNone(policy.hedge_delay(request))
+        for latency in range(1, 11):
+            policy.record_latency(latency / 100.0)
+        self.assertEqual(policy.hedge_delay(request), 0.1)
+        self.assertIsNone(policy.hedge_delay(HTTPRequest('POST', 'http://example.com', 'label=1')))
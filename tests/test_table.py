@@ -0,0 +1,75 @@
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ponyexpress.rates import INTERNATIONAL, Package, RateCalculation, RateCalculationResponse
+from ponyexpress.table import RateTable
+
+
+@skipIf(numpy is None, 'RateTable requires numpy')
+class RateTableTests(TestCase):
+    def setUp(self):
+        self.package_1 = Package(24, 8, 8, 8, False, '11218', '11780')
+        self.package_2 = Package(8, 8, 8, 8, True, '11218', '95014')
+        self.response_1 = RateCalculationResponse(
+            RateCalculation(self.package_1, 24.50, 'Priority', package_id='0'),
+            RateCalculation(self.package_1, 42.50, 'Express', package_id='0'),
+            RateCalculation(self.package_2, 12.50, 'Priority', package_id='1'),
+            RateCalculation(self.package_2, 8.25, 'First Class', package_id='1'),
+        )
+        # Package ids start over in every response
+        self.response_2 = RateCalculationResponse(
+            RateCalculation(self.package_2, 30.00, 'Priority', INTERNATIONAL, package_id='0'),
+            RateCalculation(self.package_2, 30.00, 'Express', INTERNATIONAL, package_id='0'),
+        )
+        self.table = RateTable(self.response_1, self.response_2)
+
+    # Test the columns hold every rate in order
+    def test_columns(self):
+        self.assertEqual(len(self.table), 6)
+        self.assertEqual(self.table.response.tolist(), [0, 0, 0, 0, 1, 1])
+        self.assertEqual(self.table.package_id.tolist(), ['0', '0', '1', '1', '0', '0'])
+        self.assertEqual(self.table.price.tolist(), [24.50, 42.50, 12.50, 8.25, 30.00, 30.00])
+        self.assertIs(self.table.package[0], self.package_1)
+
+    # Test the cheapest rate per package matches the response's own lookup
+    def test_cheapest(self):
+        cheapest = self.table.cheapest()
+
+        self.assertEqual(cheapest.method.tolist(), ['Priority', 'First Class', 'Priority'])
+        self.assertEqual(cheapest.price.tolist(), [24.50, 8.25, 30.00])
+        for package_id in self.response_1.package_ids:
+            row = cheapest.where(package_id=package_id).where(destination_type='domestic')
+            self.assertEqual(row.price[0], self.response_1.cheapest(package_id).price)
+
+    # Test filtering on price and method
+    def test_where(self):
+        self.assertEqual(self.table.where(max_price=25).price.tolist(), [24.50, 12.50, 8.25])
+        self.assertEqual(len(self.table.where(method=['Express', 'First Class'])), 3)
+        self.assertEqual(len(self.table.where(min_price=100)), 0)
+        self.assertEqual(len(self.table.where(min_price=100).cheapest()), 0)
+
+    # Test group by aggregations and percentiles
+    def test_aggregate(self):
+        self.assertEqual(self.table.aggregate('method', 'count'), {'Priority': 3, 'Express': 2, 'First Class': 1})
+        self.assertEqual(list(self.table.aggregate('method', 'min').keys()), ['Priority', 'Express', 'First Class'])
+        self.assertEqual(self.table.aggregate('method', 'min')['Priority'], 12.50)
+        self.assertEqual(self.table.aggregate('method', 'max')['Express'], 42.50)
+        self.assertEqual(self.table.aggregate(('response', 'method'), 'sum')[(0, 'Priority')], 37.00)
+        self.assertEqual(self.table.aggregate('package', 'mean')[(1, '0')], 30.00)
+        self.assertEqual(self.table.percentiles(50)['Priority'], 24.50)
+        self.assertEqual(self.table.percentiles([0, 100])['Express'], [30.00, 42.50])
+        self.assertRaises(ValueError, self.table.aggregate, 'method', 'median')
+
+    # Test rows convert back into rate objects
+    def test_to_rates(self):
+        rates = self.table.where(max_price=10).to_rates()
+
+        self.assertEqual(len(rates), 1)
+        self.assertIsInstance(rates[0], RateCalculation)
+        self.assertIs(rates[0].package, self.package_2)
+        self.assertEqual((rates[0].price, rates[0].method, rates[0].package_id), (8.25, 'First Class', '1'))
+        self.assertEqual(self.table.to_response().cheapest('1').price, 8.25)
@@ -0,0 +1,84 @@
+import socket
+from unittest import TestCase, skipIf
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+from ponyexpress.policy import RequestPolicy
+from ponyexpress.transport import HTTPXTransport, MemoryTransport, RequestsTransport
+from ponyexpress.usps import USPSCourier
+from test_usps import FixtureAdapter, STREAMS, TRACK_MANY_RESPONSE
+
+
+class TransportTests(TestCase):
+    # Test couriers send through a pooled requests session by default
+    def test_default(self):
+        usps = USPSCourier('user')
+        self.assertIsInstance(usps.transport, RequestsTransport)
+        self.assertIs(usps.session, usps.transport.session)
+        usps.close()
+
+    # Test the in-memory transport answers every call, batch and streamed, and retries connection errors
+    def test_memory(self):
+        answers = [socket.error('reset'), (503, b''), TRACK_MANY_RESPONSE]
+        sent = []
+
+        def handler(request):
+            sent.append(request)
+            answer = answers.pop(0) if len(answers) > 1 else answers[0]
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        usps = USPSCourier('user', transport=MemoryTransport(handler), policy=RequestPolicy(backoff=0.001))
+        self.assertIsNone(usps.session)
+        self.assertIsNotNone(usps.track('9374889949010711251710').delivered)
+        self.assertEqual(len(sent), 3)
+        self.assertIs(sent[0], usps.last_request)
+
+        usps.streaming = STREAMS
+        responses = usps.track_many(['9374889949010711251710', '93748899490101251710'])
+        self.assertIsNotNone(responses['9374889949010711251710'].delivered)
+        self.assertIsNotNone(responses['93748899490101251710'].error)
+
+    # Test the httpx transport, whose responses stream like requests' ones
+    @skipIf(httpx is None, 'HTTPXTransport requires httpx')
+    def test_httpx(self):
+        sent = []
+
+        def handler(request):
+            sent.append(request)
+            return httpx.Response(200, content=TRACK_MANY_RESPONSE)
+
+        transport = HTTPXTransport(compression=False)
+        transport.session = httpx.Client(
+            headers=transport.session.headers, transport=httpx.MockTransport(handler)
+        )
+        usps = USPSCourier('user', transport=transport, streaming=STREAMS)
+
+        responses = usps.track_many(['9374889949010711251710', '93748899490101251710'])
+        self.assertIsNotNone(responses['9374889949010711251710'].delivered)
+        self.assertEqual(sent[0].headers['Accept-Encoding'], 'identity')
+        self.assertIsNotNone(usps.track('9374889949010711251710').delivered)
+        usps.close()
+
+        # HTTP/2 is on by default, when h2 is installed
+        if h2 is not None:
+            HTTPXTransport().close()
+
+    # Test compression can be turned off for the requests transport
+    def test_requests_identity(self):
+        usps = USPSCourier('user', transport=RequestsTransport(compression=False))
+        adapter = FixtureAdapter(TRACK_MANY_RESPONSE)
+        usps.session.mount('http://', adapter)
+
+        usps.track('9374889949010711251710')
+        self.assertEqual(adapter.requests[0].headers['Accept-Encoding'], 'identity')
+        usps.close()
@@ -1,10 +1,78 @@
 import os
+from io import BytesIO
 from datetime import datetime as dt
-from unittest import TestCase
+from unittest import TestCase, skipIf
 
+try:
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    from urlparse import parse_qs, urlsplit
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from ponyexpress.parsers import XML_BACKENDS, get_xml_backend
 from ponyexpress.rates import Package
+from ponyexpress.request import XMLTemplate
 from ponyexpress.usps import USPSCourier
 
+# Streaming needs an XML backend which parses incrementally, lxml on Python 2.7
+STREAMS = get_xml_backend().streams
+STREAMS_REASON = 'Streaming needs lxml on this Python'
+
+
+# Recorded TrackV2 response for two ids, one of which the carrier does not know about
+TRACK_MANY_RESPONSE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<TrackResponse>
+<TrackInfo ID="9374889949010711251710">
+<TrackSummary><EventTime>2:48 pm</EventTime><EventDate>January 8, 2016</EventDate><Event>Delivered, In/At Mailbox</Event><EventCity>BROOKLYN</EventCity><EventState>NY</EventState><EventZIPCode>11218</EventZIPCode></TrackSummary>
+<TrackDetail><EventTime>10:08 pm</EventTime><EventDate>January 6, 2016</EventDate><Event>Accepted at USPS Origin Facility</Event><EventCity>CHICAGO</EventCity><EventState>IL</EventState><EventZIPCode>60701</EventZIPCode></TrackDetail>
+</TrackInfo>
+<TrackInfo ID="93748899490101251710">
+<Error><Number>-2147219283</Number><Description>A status update is not yet available on your package.</Description></Error>
+</TrackInfo>
+</TrackResponse>'''
+
+# Recorded Verify response for two addresses, the second of which could not be found
+VERIFY_MANY_RESPONSE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<AddressValidateResponse>
+<Address ID="0"><Address2>1 INFINITE LOOP</Address2><City>CUPERTINO</City><State>CA</State><Zip5>95014</Zip5><Zip4>2083</Zip4><DeliveryPoint>01</DeliveryPoint><CarrierRoute>C067</CarrierRoute></Address>
+<Address ID="1"><Error><Number>-2147219401</Number><Description>Address Not Found.</Description></Error></Address>
+</AddressValidateResponse>'''
+
+# Recorded RateV4 response for two packages, the second of which could not be rated
+RATE_MANY_RESPONSE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<RateV4Response>
+<Package ID="0"><ZipOrigination>11218</ZipOrigination><ZipDestination>11780</ZipDestination><Pounds>1</Pounds><Ounces>8</Ounces><Size>LARGE</Size><Machinable>TRUE</Machinable><Zone>1</Zone>
+<Postage CLASSID="3"><MailService>Priority Mail Express 1-Day&amp;lt;sup&amp;gt;&amp;#8482;&amp;lt;/sup&amp;gt;</MailService><Rate>26.35</Rate></Postage>
+<Postage CLASSID="1"><MailService>Priority Mail 1-Day&amp;lt;sup&amp;gt;&amp;#8482;&amp;lt;/sup&amp;gt;</MailService><Rate>7.15</Rate></Postage>
+</Package>
+<Package ID="1"><Error><Number>-2147219500</Number><Description>Please enter a valid ZIP Code for the recipient.</Description></Error></Package>
+</RateV4Response>'''
+
+
+class FixtureAdapter(BaseAdapter):
+    '''
+    Transport adapter which answers every request with a recorded response body, so the
+    USPS parsing can be exercised without network access.
+    '''
+    def __init__(self, body):
+        super(FixtureAdapter, self).__init__()
+        self.body = body
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = Response()
+        response.status_code = 200
+        response.raw = BytesIO(self.body)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
 
 class USPSTests(TestCase):
     # Create a base carrier
@@ -93,3 +161,184 @@ class USPSTests(TestCase):
         for rate in response.rates:
             detailed_rate = self.usps.getDetailedRate(rate)
             self.assertEqual(rate.price, detailed_rate.price)
+
+
+class USPSOfflineTests(TestCase):
+    # Serve recorded responses instead of the live API
+    def respond_with(self, body):
+        self.adapter = FixtureAdapter(body)
+        self.usps.session.mount('http://', self.adapter)
+
+    def setUp(self):
+        self.usps = USPSCourier('user')
+
+    # The XML sent with a request, from either the query string or the POST body
+    def sent_xml(self, request):
+        query = request.body if request.method == 'POST' else urlsplit(request.url).query
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        return parse_qs(query)['XML'][0]
+
+    # Test templates escape values, but not XML rendered by another template
+    def test_template_escaping(self):
+        item = XMLTemplate('<Item ID="{id}">{name}</Item>').render(id='"1"', name='R&D <Labs>')
+        self.assertEqual(item, '<Item ID="&quot;1&quot;">R&amp;D &lt;Labs&gt;</Item>')
+        self.assertEqual(XMLTemplate('<Items>{items}</Items>').render(items=item), '<Items>' + item + '</Items>')
+
+    # Test user input is escaped into the request XML
+    def test_request_escaping(self):
+        self.respond_with(VERIFY_MANY_RESPONSE)
+        self.usps.validate_addresses([('CA', 'Cupertino', '95014', '1 Infinite Loop', '', 'R&D <Labs>')])
+
+        request = self.adapter.requests[0]
+        self.assertEqual(request.method, 'GET')
+        self.assertIn('<FirmName>R&amp;D &lt;LABS&gt;</FirmName>', self.sent_xml(request))
+
+    # Test requests whose URL would be too long are sent as a POST body instead
+    def test_large_request_posted(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+        ids = ['9374889949010711251%03d' % i for i in range(USPSCourier.MAX_TRACK_IDS)]
+        self.usps.track_many(ids)
+
+        request = self.adapter.requests[0]
+        self.assertEqual(request.method, 'POST')
+        self.assertEqual(request.url, USPSCourier.base_url + '/ShippingAPI.dll')
+        self.assertEqual(request.headers['Content-Type'], 'application/x-www-form-urlencoded')
+        self.assertEqual(self.sent_xml(request).count('<TrackID ID='), USPSCourier.MAX_TRACK_IDS)
+
+    # Test batch tracking returns a result per id, with the bad id reported on its own
+    def test_track_many(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+
+        ids = ['9374889949010711251710', '93748899490101251710', '9374889949010711251710']
+        responses = self.usps.track_many(ids)
+
+        # Duplicates were collapsed into a single request
+        self.assertEqual(list(responses.keys()), ids[:2])
+        self.assertEqual(len(self.adapter.requests), 1)
+
+        # The good id parsed, the bad one only carries its error
+        self.assertEqual(dt(2016, 1, 8, 14, 48), responses[ids[0]].delivered)
+        self.assertIsNone(responses[ids[0]].error)
+        self.assertEqual(responses[ids[1]].events, [])
+        self.assertIn('not yet available', responses[ids[1]].error)
+
+    # Test batch tracking splits the ids into API sized requests
+    def test_track_many_chunking(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+
+        responses = self.usps.track_many(str(i) for i in range(USPSCourier.MAX_TRACK_IDS + 1))
+
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(len(responses), USPSCourier.MAX_TRACK_IDS + 1)
+        self.assertIsNotNone(responses['0'].error)
+
+    # Test batch validation maps each result back to its input
+    def test_validate_addresses(self):
+        self.respond_with(VERIFY_MANY_RESPONSE)
+
+        responses = self.usps.validate_addresses([
+            ('CA', 'Cupertino', '9501', '1 Infinite Circle'),
+            {'state': 'CA', 'city': '', 'postal_code': '', 'street_2': '1 Infinite'},
+        ])
+
+        # Both addresses went out in one request
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertEqual(len(responses), 2)
+
+        # The first one was corrected, the second only failed on its own
+        self.assertTrue(responses[0].validated)
+        self.assertEqual(responses[0].address.zip, '95014-2083')
+        self.assertEqual(responses[0].address.carrier_route, 'C067')
+        self.assertFalse(responses[1].validated)
+        self.assertEqual(responses[1].error, 'Address Not Found.')
+
+    # Test streaming tracking reads its input lazily and pairs every input with its result, in input order
+    def test_iter_track(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+        # Every batch is sent, rather than shared with an identical one in flight
+        self.usps.coalesce = False
+        read = []
+
+        def ids():
+            for number in range(100):
+                read.append(number)
+                yield '9374889949010711251710' if number % 2 else '93748899490101251710'
+
+        tracked = self.usps.iter_track(ids(), batch_size=4, concurrency=2)
+        tracking_id, response = next(tracked)
+        self.assertEqual(tracking_id, '93748899490101251710')
+        self.assertIsNotNone(response.error)
+        # Only the batches in flight were read
+        self.assertLessEqual(len(read), 12)
+
+        pairs = list(tracked)
+        self.assertEqual(len(pairs), 99)
+        self.assertEqual(pairs[0][0], '9374889949010711251710')
+        self.assertEqual(dt(2016, 1, 8, 14, 48), pairs[0][1].delivered)
+        self.assertEqual(len(self.adapter.requests), 25)
+
+    # Test streaming validation pairs every address with its result
+    def test_iter_validate(self):
+        self.respond_with(VERIFY_MANY_RESPONSE)
+        self.usps.coalesce = False
+        addresses = [('CA', 'Cupertino', '95014', '1 Infinite Loop'), ('CA', 'Cupertino', '95014', '2 Nowhere')] * 3
+
+        pairs = list(self.usps.iter_validate(iter(addresses), batch_size=2))
+
+        self.assertEqual([address for address, _ in pairs], addresses)
+        self.assertEqual([response.validated for _, response in pairs], [True, False] * 3)
+        self.assertEqual(len(self.adapter.requests), 3)
+
+    # Test bulk rating indexes the rates by package and keeps errors per package
+    def test_get_rates(self):
+        self.respond_with(RATE_MANY_RESPONSE)
+
+        packages = [
+            Package((1, 8), 12, 12, 13, True, '11218', '11780'),
+            Package((1, 8), 12, 12, 13, True, '11218', '00000'),
+        ]
+        response = self.usps.getRates(packages)
+
+        # One request for both packages
+        self.assertEqual(len(self.adapter.requests), 1)
+
+        # Lookups are per package
+        self.assertEqual(response.package_ids, ['0'])
+        self.assertEqual(len(response.rates_for('0')), 2)
+        self.assertEqual(response.cheapest('0').price, 7.15)
+        self.assertIs(response.cheapest('0').package, packages[0])
+        self.assertIsNone(response.cheapest('1'))
+        self.assertIn('ZIP Code', response.errors['1'])
+
+    # Test streaming mode builds the same results as parsing the whole response
+    @skipIf(not STREAMS, STREAMS_REASON)
+    def test_streaming_track_many(self):
+        self.respond_with(TRACK_MANY_RESPONSE)
+        ids = ['9374889949010711251710', '93748899490101251710']
+        expected = self.usps.track_many(ids)
+
+        self.usps = USPSCourier('user', streaming=True)
+        self.respond_with(TRACK_MANY_RESPONSE)
+        responses = self.usps.track_many(ids)
+
+        self.assertEqual(list(responses.keys()), list(expected.keys()))
+        self.assertEqual(responses[ids[0]].delivered, expected[ids[0]].delivered)
+        self.assertEqual(len(responses[ids[0]].events), len(expected[ids[0]].events))
+        self.assertEqual(responses[ids[1]].error, expected[ids[1]].error)
+
+    # Test every XML backend builds identical responses
+    def test_parser_backends_identical(self):
+        results = []
+        for name in XML_BACKENDS:
+            for streaming in (False, True) if XML_BACKENDS[name].streams else (False, ):
+                self.usps = USPSCourier('user', xml_parser=name, streaming=streaming)
+                self.respond_with(RATE_MANY_RESPONSE)
+                response = self.usps.getRates([Package((1, 8), 12, 12, 13, True, '11218', '11780')] * 2)
+                results.append((
+                    [(rate.package_id, rate.method, rate.price, rate.type) for rate in response.rates],
+                    dict(response.errors)
+                ))
+
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ponyexpress.rates import Package
+from ponyexpress.zones import ZoneMatrix
+
+
+@skipIf(np is None, 'ZoneMatrix requires numpy')
+class ZoneMatrixTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.zones = ZoneMatrix.from_ranges([
+            (112, 100, 119, 1),
+            (112, 900, 961, 8),
+            ('005', '112', 2),
+        ])
+
+    def tearDown(self):
+        Package.default_zone_index = None
+        shutil.rmtree(self.directory)
+
+    # Test single pair lookups
+    def test_zone(self):
+        self.assertEqual(self.zones.zone('11218', '11780'), 1)
+        self.assertEqual(self.zones.zone('11218-1234', '95014'), 8)
+        self.assertEqual(self.zones.zone('00501', '11218'), 2)
+        self.assertIsNone(self.zones.zone('11218', '60701'))
+        self.assertIsNone(self.zones.zone('11218', 'H0H'))
+
+    # Test vectorized lookups of strings and integers
+    def test_lookup(self):
+        zones = self.zones.lookup(['11218', '11218', '11218', '00501', ''], ['11780', '95014', '60701', '11218', '11780'])
+        self.assertEqual(zones.tolist(), [1, 8, 0, 2, 0])
+
+        zones = self.zones.lookup(np.array([11218, 501, -1]), np.array([95014, 11218, 11780]))
+        self.assertEqual(zones.tolist(), [8, 2, 0])
+
+    # Test the matrix survives a round trip through its binary and CSV formats
+    def test_save_load(self):
+        path = os.path.join(self.directory, 'zones.npy')
+        self.zones.save(path)
+
+        for mmap in (True, False):
+            zones = ZoneMatrix.load(path, mmap=mmap)
+            self.assertTrue(np.array_equal(zones.matrix, self.zones.matrix))
+            self.assertEqual(zones.zone('11218', '95014'), 8)
+
+        path = os.path.join(self.directory, 'zones.csv')
+        with open(path, 'w') as handle:
+            handle.write('origin,first,last,zone\n112,100,119,1\n112,900,961,8\n005,112,2\n')
+        self.assertTrue(np.array_equal(ZoneMatrix.from_csv(path).matrix, self.zones.matrix))
+
+    # Test packages look up their zone in their own index, or the shared one
+    def test_package_zone(self):
+        package = Package((1, 0), 8, 8, 8, True, '11218', '95014')
+        self.assertIsNone(package.zone)
+
+        Package.default_zone_index = self.zones
+        self.assertEqual(package.zone, 8)
+
+        # A package's own chart takes precedence, given to the constructor or set later
+        other = ZoneMatrix.from_ranges([(112, 900, 961, 5)])
+        self.assertEqual(Package((1, 0), 8, 8, 8, True, '11218', '95014', zone_index=other).zone, 5)
+        package.zone_index = other
+        self.assertEqual(package.zone, 5)
+        self.assertEqual(Package((1, 0), 8, 8, 8, True, '11218', '95014').zone, 8)